@@ -7,3 +7,5 @@ class AccountsConfig(AppConfig):
 
     def ready(self):
         import accounts.signals # Import signals here
+        from .instrumentation import install_instrumentation
+        install_instrumentation()
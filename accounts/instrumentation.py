@@ -0,0 +1,275 @@
+"""
+Per-request instrumentation: SQL query count, DB time, serializer time and total
+time for every request, by view.
+
+- Queries are counted by an execute wrapper installed on every database
+  connection. It records into the current request's RequestStats, which lives
+  in a ContextVar, so queries run by async views on worker threads
+  (sync_to_async carries the context over) are attributed to the right request.
+- Serializer time is the time spent in DRF's Serializer.data and
+  ListSerializer.data, counted once for nested serializers (the nesting depth
+  is a ContextVar, so serializers running on several threads each count
+  their own outermost call).
+- install_instrumentation (called once from AccountsConfig.ready) sets up the
+  execute wrapper and the serializer timing for the process.
+- InstrumentationMiddleware adds the numbers to the response as X-Query-Count
+  and Server-Timing headers, and adds them to an in-process histogram per view
+  (get_request_stats / format_request_stats, and /metrics through api.metrics).
+- A request slower than REQUEST_TIME_BUDGET_MS logs its
+  SLOW_REQUEST_QUERY_LOG_COUNT slowest queries.
+"""
+import heapq
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_current_stats = ContextVar('request_stats', default=None)
+_serializer_depth = ContextVar('serializer_depth', default=0)
+
+# Upper bounds (milliseconds) of the request time histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class RequestStats:
+    """What one request spent, filled in while it runs."""
+
+    def __init__(self, slow_query_count=0):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.slow_query_count = slow_query_count
+        self.slowest_queries = [] # Min-heap of (duration, sql), at most slow_query_count long
+        self.lock = threading.Lock() # Async views may run queries on several threads at once
+
+    def add_serializer_time(self, duration):
+        with self.lock:
+            self.serializer_time += duration
+
+    def add_query(self, sql, duration):
+        with self.lock:
+            self.query_count += 1
+            self.db_time += duration
+            if self.slow_query_count:
+                entry = (duration, sql)
+                if len(self.slowest_queries) < self.slow_query_count:
+                    heapq.heappush(self.slowest_queries, entry)
+                elif entry > self.slowest_queries[0]:
+                    heapq.heapreplace(self.slowest_queries, entry)
+
+
+def get_current_stats():
+    return _current_stats.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper: times the query for the current request, if one is being instrumented."""
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+_serializers_instrumented = False
+
+
+def _timed_data(data_property):
+    def data(self):
+        stats = _current_stats.get()
+        if stats is None:
+            return data_property.fget(self)
+        depth = _serializer_depth.get()
+        token = _serializer_depth.set(depth + 1)
+        started = time.perf_counter()
+        try:
+            return data_property.fget(self)
+        finally:
+            _serializer_depth.reset(token)
+            if depth == 0:
+                # Nested serializers are part of their parent's time
+                stats.add_serializer_time(time.perf_counter() - started)
+    return property(data)
+
+
+def instrument_serializers():
+    """Wraps Serializer.data and ListSerializer.data so their time is recorded (once per process)."""
+    global _serializers_instrumented
+    if _serializers_instrumented:
+        return
+    from rest_framework import serializers
+    for serializer_class in (serializers.Serializer, serializers.ListSerializer):
+        serializer_class.data = _timed_data(serializer_class.__dict__['data'])
+    _serializers_instrumented = True
+
+
+def install_instrumentation():
+    """Installs the query recorder on every database connection and times DRF serializers; once per process."""
+    connection_created.connect(install_query_recorder, dispatch_uid='accounts.instrumentation')
+    # Connections opened before this ran
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection)
+    instrument_serializers()
+
+
+class ViewHistogram:
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total_time = 0.0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.query_count = 0
+        self.max_time = 0.0
+
+    def observe(self, stats, total_time):
+        self.count += 1
+        milliseconds = total_time * 1000
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if milliseconds <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        self.total_time += total_time
+        self.db_time += stats.db_time
+        self.serializer_time += stats.serializer_time
+        self.query_count += stats.query_count
+        self.max_time = max(self.max_time, total_time)
+
+    def as_dict(self):
+        labels = [f'<={bound}ms' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+        return {
+            'count': self.count,
+            'buckets': dict(zip(labels, self.buckets)),
+            'avg_ms': round(self.total_time * 1000 / self.count, 2),
+            'max_ms': round(self.max_time * 1000, 2),
+            'avg_db_ms': round(self.db_time * 1000 / self.count, 2),
+            'avg_serializer_ms': round(self.serializer_time * 1000 / self.count, 2),
+            'avg_queries': round(self.query_count / self.count, 2),
+        }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def observe_request(view_name, stats, total_time):
+    with _histograms_lock:
+        histogram = _histograms.get(view_name)
+        if histogram is None:
+            histogram = _histograms[view_name] = ViewHistogram()
+        histogram.observe(stats, total_time)
+
+
+def get_request_stats():
+    """{view name: histogram and averages} for the requests this process has served."""
+    with _histograms_lock:
+        return {view_name: histogram.as_dict() for view_name, histogram in sorted(_histograms.items())}
+
+
+def snapshot_histograms():
+    """
+    {view name: (per-bucket counts, count, total time, DB time, query count)}
+    copied under the lock, for exporters that need the raw numbers (api.metrics).
+    """
+    with _histograms_lock:
+        return {
+            view_name: (list(histogram.buckets), histogram.count, histogram.total_time, histogram.db_time, histogram.query_count)
+            for view_name, histogram in _histograms.items()
+        }
+
+
+def format_request_stats():
+    """The histograms as a plain text table, one view per line."""
+    lines = []
+    for view_name, stats in get_request_stats().items():
+        buckets = ' '.join(f'{label}:{count}' for label, count in stats['buckets'].items() if count)
+        lines.append(
+            f"{view_name}: {stats['count']} requests, avg {stats['avg_ms']} ms (db {stats['avg_db_ms']} ms, "
+            f"serializers {stats['avg_serializer_ms']} ms, {stats['avg_queries']} queries), max {stats['max_ms']} ms | {buckets}"
+        )
+    return '\n'.join(lines)
+
+
+def reset_request_stats():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.route
+
+
+class InstrumentationMiddleware:
+    """
+    Records query count, DB time, serializer time and total time per request
+    (see the module docstring). Works in sync and async middleware stacks.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        stats, token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - started)
+
+    def start(self):
+        stats = RequestStats(getattr(settings, 'SLOW_REQUEST_QUERY_LOG_COUNT', 5))
+        return stats, _current_stats.set(stats), time.perf_counter()
+
+    def finish(self, request, response, stats, total_time):
+        view_name = get_view_name(request)
+        observe_request(view_name, stats, total_time)
+
+        response['X-Query-Count'] = str(stats.query_count)
+        response['Server-Timing'] = (
+            f'db;dur={stats.db_time * 1000:.1f}, serializer;dur={stats.serializer_time * 1000:.1f}, '
+            f'total;dur={total_time * 1000:.1f}'
+        )
+
+        budget = getattr(settings, 'REQUEST_TIME_BUDGET_MS', 500) / 1000
+        if total_time > budget:
+            slowest = sorted(stats.slowest_queries, reverse=True)
+            logger.warning(
+                '%s %s (%s) took %.0f ms, over the %.0f ms budget: %d queries, %.0f ms in the database, %.0f ms in serializers.%s',
+                request.method, request.path, view_name, total_time * 1000, budget * 1000,
+                stats.query_count, stats.db_time * 1000, stats.serializer_time * 1000,
+                ''.join(f'\n  {duration * 1000:.1f} ms: {sql}' for duration, sql in slowest)
+            )
+        return response
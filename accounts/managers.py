@@ -1,28 +1,19 @@
 from django.db import models
 from django.db.models import Q
-from accounts.request_middleware import get_current_organization, _thread_locals # Import _thread_locals
+from accounts.request_middleware import get_current_organization, _current_organization
 from contextlib import contextmanager
 
 @contextmanager
 def set_current_organization(organization):
-    """Context manager to temporarily set the current organization for testing."""
-    # Create a mock request object and set the organization on it
-    class MockRequest:
-        def __init__(self, organization):
-            self.organization = organization
-            
-    mock_request = MockRequest(organization)
-    
-    original_request = getattr(_thread_locals, 'request', None)
-    _thread_locals.request = mock_request
+    """
+    Context manager to set the current organization, e.g. in tests, management
+    commands or background jobs. Only the current thread or asyncio task sees it.
+    """
+    token = _current_organization.set(organization)
     try:
         yield
     finally:
-        if original_request is None:
-            if hasattr(_thread_locals, 'request'):
-                del _thread_locals.request
-        else:
-            _thread_locals.request = original_request
+        _current_organization.reset(token)
 
 
 class OrganizationModelManager(models.Manager):
@@ -41,7 +32,7 @@ class OrganizationModelManager(models.Manager):
         if not hasattr(self.model, 'organization'):
             return queryset
         
-        # Get current organization from thread-local request
+        # Get current organization from the tenant context
         organization = get_current_organization()
         
         # If we have an organization, filter by it
@@ -119,10 +110,7 @@ class BaseTenantManager(models.Manager):
     def get_queryset(self):
         queryset = TenantAwareQuerySet(self.model, using=self._db)
         # Apply organization filtering here
-        request = getattr(_thread_locals, 'request', None) # Get request from thread locals
-        organization = None
-        if request and hasattr(request, 'organization'):
-            organization = request.organization
+        organization = get_current_organization()
 
         if organization and hasattr(self.model, 'organization'):
             return queryset.filter(organization=organization)
@@ -2,7 +2,7 @@ from django.db.models import Q
 from django.utils.deprecation import MiddlewareMixin
 from django.apps import apps
 from django.contrib.auth.models import AnonymousUser
-from django.db import models
+from accounts.managers import OrganizationModelManager # Kept importable from here; the manager lives in accounts.managers
 
 
 class OrganizationMiddleware(MiddlewareMixin):
@@ -29,34 +29,3 @@ class OrganizationMiddleware(MiddlewareMixin):
             request.organization = request.user.organization
             
         return None
-
-
-class OrganizationModelManager(models.Manager):
-    """
-    Custom manager that automatically filters querysets by organization.
-    
-    This manager should be used for all models that have an organization field to
-    enforce data isolation between organizations.
-    """
-    
-    def get_queryset(self):
-        """Get queryset filtered by organization if applicable"""
-        queryset = super().get_queryset()
-        
-        # Check if model has organization field
-        if not hasattr(self.model, 'organization'):
-            return queryset
-        
-        # Get current request from thread local
-        from threading import local
-        _thread_locals = local()
-        request = getattr(_thread_locals, 'request', None)
-        
-        # If we have a request and it has an organization, filter by it
-        if request and hasattr(request, 'organization'):
-            organization = request.organization
-            if organization:
-                return queryset.filter(organization=organization)
-        
-        # Otherwise return unfiltered queryset
-        return queryset
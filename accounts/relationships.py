@@ -0,0 +1,74 @@
+from accounts.models import OrganizationRelationship
+
+_ACCEPTED_SUPPLIERS_ATTR = '_accepted_supplier_ids'
+
+
+def _get_cache_holder(request):
+    """
+    DRF wraps the Django HttpRequest in its own Request object. Memoize on the
+    underlying HttpRequest so views, serializers and middleware share one cache.
+    """
+    return getattr(request, '_request', request)
+
+
+def get_accepted_supplier_ids(request, organization=None):
+    """
+    Returns the set of supplier organization IDs that have an accepted relationship
+    with the buyer organization.
+
+    The set is computed once per request and memoized on it. If no organization is
+    given, the organization of the request's user is used. Without a request the
+    set is computed on every call.
+    """
+    if organization is None and request is not None:
+        user = getattr(request, 'user', None)
+        organization = getattr(user, 'organization', None) if user and user.is_authenticated else None
+
+    if organization is None:
+        return frozenset()
+
+    if request is None:
+        return _load_accepted_supplier_ids(organization)
+
+    holder = _get_cache_holder(request)
+    cache = getattr(holder, _ACCEPTED_SUPPLIERS_ATTR, None)
+    if cache is None:
+        cache = {}
+        setattr(holder, _ACCEPTED_SUPPLIERS_ATTR, cache)
+
+    if organization.id not in cache:
+        cache[organization.id] = _load_accepted_supplier_ids(organization)
+    return cache[organization.id]
+
+
+async def aget_accepted_supplier_ids(request, organization):
+    """Async variant of get_accepted_supplier_ids for async views; shares the same per-request memo."""
+    holder = _get_cache_holder(request)
+    cache = getattr(holder, _ACCEPTED_SUPPLIERS_ATTR, None)
+    if cache is None:
+        cache = {}
+        setattr(holder, _ACCEPTED_SUPPLIERS_ATTR, cache)
+
+    if organization.id not in cache:
+        cache[organization.id] = frozenset([
+            supplier_id async for supplier_id in _accepted_supplier_queryset(organization)
+        ])
+    return cache[organization.id]
+
+
+def clear_accepted_supplier_ids(request):
+    """Drops the memoized accepted supplier sets for the request (e.g. after a status change)."""
+    holder = _get_cache_holder(request)
+    if hasattr(holder, _ACCEPTED_SUPPLIERS_ATTR):
+        delattr(holder, _ACCEPTED_SUPPLIERS_ATTR)
+
+
+def _accepted_supplier_queryset(organization):
+    return OrganizationRelationship.objects.filter(
+        buyer_organization=organization,
+        status='accepted'
+    ).values_list('supplier_organization_id', flat=True)
+
+
+def _load_accepted_supplier_ids(organization):
+    return frozenset(_accepted_supplier_queryset(organization))
@@ -1,48 +1,68 @@
-from threading import local
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# The tenant context. ContextVars are per thread *and* per asyncio task, and asgiref's
+# sync_to_async/async_to_sync carry them across, so concurrent requests never see each
+# other's values under WSGI or ASGI.
+_current_request = ContextVar('current_request', default=None)
+_current_organization = ContextVar('current_organization', default=None)
 
-_thread_locals = local() # Define _thread_locals here
 
 def get_current_request():
     """
-    Get the current request from thread-local storage.
-    
+    Get the request being handled in the current context.
+
     This allows models and managers to access the current request
     for organization filtering and other context-aware behavior.
     """
-    return getattr(_thread_locals, 'request', None)
+    return _current_request.get()
 
 def get_current_organization():
     """
-    Get the organization from the current request.
-    
+    Get the organization of the current context: the one set with
+    accounts.managers.set_current_organization, else the current request's.
+
     Returns None if there is no request or no organization.
     """
-    request = get_current_request()
-    if request and hasattr(request, 'organization'):
-        return request.organization
+    organization = _current_organization.get()
+    if organization is not None:
+        return organization
+    request = _current_request.get()
+    if request is not None:
+        return getattr(request, 'organization', None)
     return None
 
 
 class RequestMiddleware:
     """
-    Middleware to store the current request in thread-local storage.
-    
+    Middleware to store the current request in the tenant context.
+
     This allows organization filtering to work in model managers by
-    providing access to the current request and organization.
+    providing access to the current request and organization. Works in
+    both sync (WSGI) and async (ASGI) middleware stacks.
     """
-    
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
-        
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
     def __call__(self, request):
-        # Store request in thread-local storage
-        _thread_locals.request = request
-        
-        # Process the request
-        response = self.get_response(request)
-        
-        # Clean up thread-local storage
-        if hasattr(_thread_locals, 'request'):
-            del _thread_locals.request
-            
-        return response
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            # Reset rather than clear, so nested handlers (e.g. test clients) restore the outer request
+            _current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_request.reset(token)
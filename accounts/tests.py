@@ -1,7 +1,18 @@
-from django.test import TestCase
+import asyncio
+import threading
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
-from accounts.models import Organization
-from accounts.managers import BaseTenantManager, TenantAwareQuerySet, set_current_organization # Import set_current_organization
+from django.http import HttpResponse
+from django.test import RequestFactory
+from accounts.models import Organization, OrganizationRelationship
+from accounts.relationships import get_accepted_supplier_ids, clear_accepted_supplier_ids
+from accounts.managers import BaseTenantManager, TenantAwareQuerySet, OrganizationModelManager, set_current_organization # Import set_current_organization
+from accounts.request_middleware import RequestMiddleware, get_current_request, get_current_organization
+from accounts import instrumentation
+from accounts.instrumentation import get_request_stats, reset_request_stats, format_request_stats
+from rest_framework import serializers
+from rest_framework_simplejwt.tokens import AccessToken
+from api.models import Location
 
 User = get_user_model()
 
@@ -86,3 +97,203 @@ class UserModelTests(TestCase):
         self.assertIsNotNone(superuser.organization)
 
     # Add more tests for User model methods and properties
+
+class AcceptedSupplierResolverTests(TestCase):
+
+    def setUp(self):
+        self.buyer_org = Organization.objects.create(name='Buyer Org', organization_type='buyer')
+        self.supplier_org = Organization.objects.create(name='Supplier Org', organization_type='supplier')
+        self.other_supplier_org = Organization.objects.create(name='Other Supplier Org', organization_type='supplier')
+        self.user = User.objects.create_user(
+            email='buyer@buyer.com',
+            username='buyer',
+            password='password',
+            organization=self.buyer_org
+        )
+        self.relationship = OrganizationRelationship.objects.create(
+            buyer_organization=self.buyer_org,
+            supplier_organization=self.supplier_org,
+            status='accepted'
+        )
+        OrganizationRelationship.objects.create(
+            buyer_organization=self.buyer_org,
+            supplier_organization=self.other_supplier_org,
+            status='pending'
+        )
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_accepted_suppliers_are_resolved_once_per_request(self):
+        with self.assertNumQueries(1):
+            first = get_accepted_supplier_ids(self.request)
+            second = get_accepted_supplier_ids(self.request, self.buyer_org)
+        self.assertEqual(first, {self.supplier_org.id})
+        self.assertIs(first, second)
+
+    def test_clearing_picks_up_status_changes(self):
+        self.assertEqual(get_accepted_supplier_ids(self.request), {self.supplier_org.id})
+        OrganizationRelationship.objects.filter(supplier_organization=self.other_supplier_org).update(status='accepted')
+
+        self.assertEqual(get_accepted_supplier_ids(self.request), {self.supplier_org.id})
+        clear_accepted_supplier_ids(self.request)
+        self.assertEqual(
+            get_accepted_supplier_ids(self.request),
+            {self.supplier_org.id, self.other_supplier_org.id}
+        )
+
+
+class TenantContextTests(TestCase):
+
+    def setUp(self):
+        self.org1 = Organization.objects.create(name='Context Org 1')
+        self.org2 = Organization.objects.create(name='Context Org 2')
+        Location.objects.create(name='Org 1 Warehouse', organization=self.org1)
+        Location.objects.create(name='Org 2 Warehouse', organization=self.org2)
+
+    def tenant_manager(self, manager_class):
+        manager = manager_class()
+        manager.model = Location
+        return manager
+
+    def test_managers_filter_by_the_context_organization(self):
+        for manager_class in (BaseTenantManager, OrganizationModelManager):
+            manager = self.tenant_manager(manager_class)
+            self.assertEqual(manager.count(), 2)
+            with set_current_organization(self.org1):
+                self.assertEqual(list(manager.values_list('name', flat=True)), ['Org 1 Warehouse'])
+                with set_current_organization(self.org2):
+                    self.assertEqual(list(manager.values_list('name', flat=True)), ['Org 2 Warehouse'])
+                self.assertEqual(manager.get().organization, self.org1)
+            self.assertEqual(manager.count(), 2)
+
+        with set_current_organization(self.org2):
+            location, created = TenantAwareQuerySet(Location).get_or_create(name='New Warehouse')
+        self.assertTrue(created)
+        self.assertEqual(location.organization, self.org2)
+
+    def test_middleware_sets_and_resets_the_request(self):
+        request = RequestFactory().get('/')
+        request.organization = self.org1
+
+        def view(request):
+            self.assertIs(get_current_request(), request)
+            self.assertEqual(get_current_organization(), self.org1)
+            return HttpResponse()
+
+        RequestMiddleware(view)(request)
+        self.assertIsNone(get_current_request())
+        self.assertIsNone(get_current_organization())
+
+    def test_threads_do_not_share_the_tenant_context(self):
+        barrier = threading.Barrier(2)
+        seen = {}
+
+        def worker(organization):
+            with set_current_organization(organization):
+                # Both threads are inside their context at the same time
+                barrier.wait(timeout=5)
+                seen[organization.id] = get_current_organization()
+                barrier.wait(timeout=5)
+            seen[f'{organization.id}-after'] = get_current_organization()
+
+        with set_current_organization(self.org1):
+            # A new thread starts with an empty context, not its parent's
+            threads = [threading.Thread(target=worker, args=(org,)) for org in (self.org1, self.org2)]
+            threads.append(threading.Thread(target=lambda: seen.setdefault('fresh', get_current_organization())))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(seen[self.org1.id], self.org1)
+        self.assertEqual(seen[self.org2.id], self.org2)
+        self.assertIsNone(seen[f'{self.org1.id}-after'])
+        self.assertIsNone(seen[f'{self.org2.id}-after'])
+        self.assertIsNone(seen['fresh'])
+
+    def test_async_requests_on_one_thread_do_not_bleed(self):
+        seen = []
+
+        async def view(request):
+            # Yield so the other request runs between our reads
+            await asyncio.sleep(0)
+            first = get_current_organization()
+            await asyncio.sleep(0)
+            seen.append((request.organization, first, get_current_organization()))
+            return HttpResponse()
+
+        middleware = RequestMiddleware(view)
+        requests = []
+        for organization in (self.org1, self.org2, self.org1, self.org2):
+            request = RequestFactory().get('/')
+            request.organization = organization
+            requests.append(request)
+
+        async def handle_all():
+            await asyncio.gather(*(middleware(request) for request in requests))
+            return get_current_request()
+
+        self.assertIsNone(asyncio.run(handle_all()))
+        self.assertEqual(len(seen), 4)
+        for organization, first, second in seen:
+            self.assertEqual(first, organization)
+            self.assertEqual(second, organization)
+
+
+class InstrumentationMiddlewareTests(TestCase):
+
+    def setUp(self):
+        reset_request_stats()
+        self.organization = Organization.objects.create(name='Instrumented Org')
+        self.user = User.objects.create_user(
+            email='instrumented@example.com', username='instrumented', password='password', organization=self.organization
+        )
+        self.headers = {'Authorization': f'JWT {AccessToken.for_user(self.user)}'}
+
+    def test_response_headers_and_histograms(self):
+        response = self.client.get('/api/notifications/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[0-9.]+, serializer;dur=[0-9.]+, total;dur=[0-9.]+$')
+
+        self.client.get('/api/notifications/', headers=self.headers)
+        stats = get_request_stats()['api:notification-list']
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(sum(stats['buckets'].values()), 2)
+        self.assertIn('api:notification-list: 2 requests', format_request_stats())
+
+    @override_settings(REQUEST_TIME_BUDGET_MS=0, SLOW_REQUEST_QUERY_LOG_COUNT=2)
+    def test_slow_requests_log_their_slowest_queries(self):
+        with self.assertLogs('accounts.instrumentation', 'WARNING') as logs:
+            self.client.get('/api/notifications/', headers=self.headers)
+        self.assertIn('over the 0 ms budget', logs.output[0])
+        self.assertEqual(logs.output[0].count(' ms: '), 2)
+
+    def test_nested_serializers_on_several_threads_count_once_each(self):
+        class ItemSerializer(serializers.Serializer):
+            name = serializers.CharField()
+
+        class BasketSerializer(serializers.Serializer):
+            items = ItemSerializer(many=True)
+
+        stats = instrumentation.RequestStats(1)
+        basket = {'items': [{'name': 'a'}, {'name': 'b'}]}
+        depths = []
+
+        def worker():
+            token = instrumentation._current_stats.set(stats)
+            try:
+                BasketSerializer(basket).data
+                depths.append(instrumentation._serializer_depth.get())
+            finally:
+                instrumentation._current_stats.reset(token)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Every thread unwound its own nesting, and the outermost calls all added their time
+        self.assertEqual(depths, [0, 0, 0, 0])
+        self.assertGreater(stats.serializer_time, 0)
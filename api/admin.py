@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Brand, Product, Inventory, Location, Order, OrderItem, Supplier, Buyer, Driver, Notification, Communication, Organization
+from .models import Brand, Product, Inventory, Location, Order, OrderItem, Supplier, Buyer, Driver, Notification, Communication, Organization, OutboundEmail, Sequence, StockAlertState, UnreadCounter
 from accounts.models import User
 
 # Register your models here.
@@ -16,4 +16,8 @@ admin.site.register(Buyer)
 admin.site.register(Driver)
 admin.site.register(Notification)
 admin.site.register(Communication)
-admin.site.register(User)
\ No newline at end of file
+admin.site.register(User)
+admin.site.register(OutboundEmail)
+admin.site.register(Sequence)
+admin.site.register(StockAlertState)
+admin.site.register(UnreadCounter)
@@ -1,9 +1,10 @@
-from django.db.models import Sum, Count, Avg, F, ExpressionWrapper, DecimalField
+from django.db.models import Sum, Count, Avg, F, Q, ExpressionWrapper, DecimalField
 from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
 from django.utils import timezone
-from .models import Order, OrderItem, Product, Inventory, InventoryMovement
+from .models import Order, OrderItem, Product, Inventory, InventoryMovement, DailySalesRollup, DailyOrderRollup
 from decimal import Decimal
 from django.db.models import OuterRef, Subquery # Import Subquery and OuterRef
+import datetime
 
 def get_date_range_from_period(period_str):
     """
@@ -37,10 +38,29 @@ def get_date_range_from_period(period_str):
     return start_date, end_date
 
 
+def _to_day(value):
+    """Converts a datetime bound to the rollup day it falls on (in the current time zone)."""
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _filter_days(queryset, organization, start_date, end_date):
+    """Restricts a rollup queryset to the organization and the days covered by the range."""
+    queryset = queryset.filter(organization=organization)
+    if start_date is not None:
+        queryset = queryset.filter(day__gte=_to_day(start_date))
+    if end_date is not None:
+        queryset = queryset.filter(day__lte=_to_day(end_date))
+    return queryset
+
+
 def get_sales_overview(organization, start_date=None, end_date=None):
     """
     Calculates a comprehensive sales overview for a given organization (as a supplier)
-    within a date range.
+    within a date range. Reads the daily sales rollup, so the range is whole days.
     """
     if start_date is None and end_date is None: # Default to this month if no dates provided
         end_date = timezone.now()
@@ -49,32 +69,21 @@ def get_sales_overview(organization, start_date=None, end_date=None):
              start_date = timezone.make_aware(start_date.replace(tzinfo=None), timezone.get_current_timezone())
 
 
-    # Filter OrderItems where the product belongs to the given organization
-    # and the associated order is completed within the date range.
-    order_items_qs = OrderItem.objects.filter(
-        product__organization=organization, # Filter by the product's organization
-        order__status__in=['delivered', 'completed'], # Consider which statuses count as a sale
-        order__order_date__gte=start_date,
-        order__order_date__lte=end_date
-    ).select_related('product', 'order') # Select related for efficiency
-
-    # Aggregate data from the filtered OrderItems
-    summary = order_items_qs.aggregate(
-        total_revenue=Sum(F('quantity') * F('unit_price'), output_field=DecimalField()),
-        total_items_sold=Sum('quantity')
+    # Sales of the organization's products in completed/delivered orders, pre-aggregated per product and day
+    summary = _filter_days(DailySalesRollup.objects.all(), organization, start_date, end_date).aggregate(
+        total_revenue=Sum('revenue'),
+        total_items_sold=Sum('units_sold'),
+        total_cogs=Sum('cogs')
     )
 
     total_revenue = summary['total_revenue'] or Decimal('0.00')
     total_items_sold = summary['total_items_sold'] or 0
+    total_cogs = summary['total_cogs'] or Decimal('0.00')
 
-    # To get the count of unique orders, we can get the distinct order IDs from the filtered items
-    total_orders = order_items_qs.values('order').distinct().count()
-
-    total_cogs = Decimal('0.00')
-    # Calculate COGS by iterating through the filtered order items
-    for item in order_items_qs:
-        if item.product and item.product.cost is not None:
-            total_cogs += item.quantity * item.product.cost
+    # An order falls on a single day, so summing the daily order counts gives the number of unique orders
+    total_orders = _filter_days(DailyOrderRollup.objects.all(), organization, start_date, end_date).aggregate(
+        total=Sum('order_count')
+    )['total'] or 0
 
     net_profit = total_revenue - total_cogs
     average_sale_value = total_revenue / total_orders if total_orders > 0 else Decimal('0.00')
@@ -98,62 +107,51 @@ def get_sales_trend(organization, start_date, end_date, interval='day'):
     date range, and interval.
     Interval can be 'day', 'week', 'month'.
     """
-    trunc_func = TruncDay
+    sales_data = _filter_days(DailySalesRollup.objects.all(), organization, start_date, end_date)
+
+    # Rollup rows are already per day; weeks and months are truncated from the day
     if interval == 'week':
-        trunc_func = TruncWeek
+        sales_data = sales_data.annotate(period=TruncWeek('day'))
     elif interval == 'month':
-        trunc_func = TruncMonth
-
-    # Filter OrderItems where the product belongs to the given organization
-    # and the associated order is completed within the date range.
-    sales_data = OrderItem.objects.filter(
-        product__organization=organization, # Filter by the product's organization
-        order__status__in=['delivered', 'completed'],
-        order__order_date__gte=start_date,
-        order__order_date__lte=end_date
-    ).annotate(
-        # Truncate the order date of the associated order
-        period=trunc_func('order__order_date')
-    ).values('period').annotate(
+        sales_data = sales_data.annotate(period=TruncMonth('day'))
+    else:
+        sales_data = sales_data.annotate(period=F('day'))
+
+    sales_data = sales_data.values('period').annotate(
         # Sum the revenue for items within each period
-        total_sales=Sum(F('quantity') * F('unit_price'), output_field=DecimalField())
+        total_sales=Sum('revenue')
     ).order_by('period')
 
     # Ensure all periods in the range are included, even if sales are 0
     # This requires generating all dates/weeks/months in the range and merging.
     # For simplicity, we'll return the data as is. Frontend can handle filling gaps.
 
-    return [{'date': item['period'].isoformat(), 'sales': item['total_sales'] or 0} for item in sales_data]
+    return [{'date': _period_start(item['period']).isoformat(), 'sales': item['total_sales'] or 0} for item in sales_data]
+
+def _period_start(day):
+    """Midnight at the start of the period in the current time zone, as the trend has always been reported."""
+    if isinstance(day, datetime.datetime):
+        day = day.date()
+    start = datetime.datetime.combine(day, datetime.time.min)
+    return timezone.make_aware(start, timezone.get_current_timezone()) if timezone.is_naive(start) else start
 
 def get_top_selling_products(organization, start_date, end_date, limit=5, by='revenue'):
     """
     Gets top selling products for a given organization (as a supplier)
     by revenue or units sold within a date range.
     """
-    # Filter OrderItems where the product belongs to the given organization
-    # and the associated order is completed within the date range.
-    order_items_qs = OrderItem.objects.filter(
-        product__organization=organization, # Filter by the product's organization
-        order__status__in=['delivered', 'completed'],
-        order__order_date__gte=start_date,
-        order__order_date__lte=end_date
-    ).select_related('product')
+    product_sales = _filter_days(DailySalesRollup.objects.all(), organization, start_date, end_date).values(
+        'product__id', 'product__name'
+    ).annotate(
+        total_value=Sum('revenue'),
+        units_sold=Sum('units_sold')
+    )
 
     if by == 'revenue':
-        top_products = order_items_qs.values(
-            'product__id', 'product__name'
-        ).annotate(
-            total_value=Sum(F('quantity') * F('unit_price'), output_field=DecimalField()),
-            units_sold=Sum('quantity')
-        ).order_by('-total_value')[:limit]
+        top_products = product_sales.order_by('-total_value')[:limit]
         return [{'product_id': p['product__id'], 'product_name': p['product__name'], 'total_revenue': p['total_value'], 'units_sold': p['units_sold']} for p in top_products]
     elif by == 'units':
-        top_products = order_items_qs.values(
-            'product__id', 'product__name'
-        ).annotate(
-            units_sold=Sum('quantity'),
-            total_value=Sum(F('quantity') * F('unit_price'), output_field=DecimalField())
-        ).order_by('-units_sold')[:limit]
+        top_products = product_sales.order_by('-units_sold')[:limit]
         return [{'product_id': p['product__id'], 'product_name': p['product__name'], 'units_sold': p['units_sold'], 'total_revenue': p['total_value']} for p in top_products]
     return []
 
@@ -161,25 +159,26 @@ def get_inventory_summary(organization):
     """
     Provides a summary of the current inventory for a given organization.
     This function already works from the perspective of the organization whose inventory it is.
+    Stock units, stock value and the low stock count come from one aggregate query,
+    DOH from one more on the daily sales rollup.
     """
-    inventory_items = Inventory.objects.filter(organization=organization).select_related('product')
-
-    total_stock_units = inventory_items.aggregate(total=Sum('quantity'))['total'] or 0
-
-    total_stock_value = Decimal('0.00')
-    for item in inventory_items:
-        if item.product and item.product.cost is not None:
-            total_stock_value += item.quantity * item.product.cost
+    summary = Inventory.objects.filter(organization=organization).aggregate(
+        total_stock_units=Sum('quantity'),
+        # Rows whose product has no cost are left out of the value, as before
+        total_stock_value=Sum(F('quantity') * F('product__cost'), output_field=DecimalField(max_digits=20, decimal_places=2)),
+        low_stock_items_count=Count('id', filter=Q(quantity__lte=F('min_stock_level')))
+    )
 
-    low_stock_items_count = inventory_items.filter(quantity__lte=F('min_stock_level')).count()
+    total_stock_units = summary['total_stock_units'] or 0
+    total_stock_value = summary['total_stock_value'] or Decimal('0.00')
+    low_stock_items_count = summary['low_stock_items_count']
 
     # For DOH (Days of Inventory on Hand), we need average daily COGS *for this organization's products*.
-    # We can reuse the get_sales_overview function, which now calculates supplier-side COGS.
     last_30_days_start, last_30_days_end = get_date_range_from_period('last_30_days')
     if last_30_days_start:
-        # Call the modified get_sales_overview to get COGS for this organization's sales
-        sales_info_30_days = get_sales_overview(organization, last_30_days_start, last_30_days_end)
-        cogs_last_30_days = sales_info_30_days['total_cogs']
+        cogs_last_30_days = _filter_days(
+            DailySalesRollup.objects.all(), organization, last_30_days_start, last_30_days_end
+        ).aggregate(total=Sum('cogs'))['total'] or Decimal('0.00')
         avg_daily_cogs = cogs_last_30_days / 30 if cogs_last_30_days > 0 else Decimal('0.00')
         days_on_hand = total_stock_value / avg_daily_cogs if avg_daily_cogs > 0 else Decimal('0.00')
     else:
@@ -191,4 +190,4 @@ def get_inventory_summary(organization):
         'total_stock_value': total_stock_value,
         'low_stock_items_count': low_stock_items_count,
         'approx_days_on_hand': days_on_hand
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,161 @@
+"""
+Result cache for the analytics endpoints.
+
+The dashboard, sales trend and top products views are polled, and most polls
+see the same data as the one before. AnalyticsCache sits in front of the
+api.aggregation functions and stores their results in the 'analytics' cache
+(see CACHES in settings: TTL from ANALYTICS_CACHE_TIMEOUT, least recently used
+entries evicted past MAX_ENTRIES).
+
+Keys are built from the organization, the days covered by the period or date
+range, the interval, limit and 'by' parameters, and a per-organization version
+number. invalidate_analytics() bumps the version once the transaction commits,
+so every cached result for that organization is dropped at once when one of
+its orders completes or its inventory moves. Old entries are never read again
+and simply age out.
+
+LocMemCache is per process; with several workers, point the 'analytics' cache
+at a shared backend (Redis, Memcached) so invalidations reach all of them.
+"""
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from .aggregation import (
+    _to_day, get_sales_overview, get_sales_trend, get_top_selling_products, get_inventory_summary
+)
+from .metrics import CACHE_REQUESTS
+
+ANALYTICS_CACHE_ALIAS = 'analytics'
+
+_MISSING = object()
+
+
+def get_analytics_cache():
+    return caches[ANALYTICS_CACHE_ALIAS]
+
+
+def _version_key(organization_id):
+    return f'analytics:version:{organization_id}'
+
+
+def get_organization_version(organization_id):
+    """
+    Current cache version of the organization. A version that was evicted starts
+    again from the clock, so it can never match entries cached under an older one.
+    """
+    cache = get_analytics_cache()
+    key = _version_key(organization_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_organization_version(organization_id):
+    cache = get_analytics_cache()
+    key = _version_key(organization_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not cached (yet, or evicted): nothing can be cached under a new clock-based version
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def invalidate_analytics(organization_ids):
+    """
+    Drops the cached analytics of the given organizations when the current
+    transaction commits. Bumping only after commit means a concurrent request
+    can never cache pre-commit figures under the new version.
+    """
+    if isinstance(organization_ids, int):
+        organization_ids = [organization_ids]
+    organization_ids = {organization_id for organization_id in organization_ids if organization_id is not None}
+    if not organization_ids:
+        return
+
+    def bump():
+        for organization_id in organization_ids:
+            bump_organization_version(organization_id)
+    transaction.on_commit(bump)
+
+
+def invalidate_all_analytics():
+    """Drops every cached analytics result when the current transaction commits."""
+    transaction.on_commit(lambda: get_analytics_cache().clear())
+
+
+class AnalyticsCache:
+    """
+    Looks up analytics results for one organization and counts hits and misses,
+    which the views report in the X-Cache, X-Cache-Hits and X-Cache-Misses headers.
+    """
+
+    def __init__(self, organization):
+        self.organization = organization
+        self.cache = get_analytics_cache()
+        self.timeout = getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 300)
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, name, params):
+        # The version is read once, so all results of one response come from the same version
+        if self.version is None:
+            self.version = get_organization_version(self.organization.id)
+        parts = [str(part) for part in params]
+        return ':'.join(['analytics', name, str(self.organization.id), str(self.version)] + parts)
+
+    def fetch(self, name, params, compute):
+        key = self.make_key(name, params)
+        result = self.cache.get(key, _MISSING)
+        if result is not _MISSING:
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache='analytics', result='hit')
+            return result
+        self.misses += 1
+        CACHE_REQUESTS.inc(cache='analytics', result='miss')
+        result = compute()
+        self.cache.set(key, result, timeout=self.timeout)
+        return result
+
+    def sales_overview(self, start_date, end_date):
+        # The rollup is per day, so only the days of the range matter
+        result = self.fetch(
+            'sales_overview', (_to_day(start_date), _to_day(end_date)),
+            lambda: get_sales_overview(self.organization, start_date, end_date)
+        )
+        # The figures are shared between requests; the echoed range is this request's
+        return dict(
+            result,
+            start_date=start_date.isoformat() if start_date else result['start_date'],
+            end_date=end_date.isoformat() if end_date else result['end_date']
+        )
+
+    def sales_trend(self, start_date, end_date, interval='day'):
+        return self.fetch(
+            'sales_trend', (_to_day(start_date), _to_day(end_date), interval),
+            lambda: get_sales_trend(self.organization, start_date, end_date, interval)
+        )
+
+    def top_selling_products(self, start_date, end_date, limit=5, by='revenue'):
+        return self.fetch(
+            'top_selling_products', (_to_day(start_date), _to_day(end_date), limit, by),
+            lambda: get_top_selling_products(self.organization, start_date, end_date, limit, by)
+        )
+
+    def inventory_summary(self):
+        # Days on hand use the last 30 days of sales, which move with the date
+        return self.fetch(
+            'inventory_summary', (timezone.localdate(),),
+            lambda: get_inventory_summary(self.organization)
+        )
+
+    def add_headers(self, response):
+        response['X-Cache'] = 'HIT' if self.hits and not self.misses else 'MISS'
+        response['X-Cache-Hits'] = str(self.hits)
+        response['X-Cache-Misses'] = str(self.misses)
+        return response
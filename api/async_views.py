@@ -0,0 +1,296 @@
+"""
+Async (ASGI-native) variants of the read endpoints.
+
+The views in api.views are DRF views, which are sync only: under ASGI every
+request holds a thread for its whole duration. The views here are plain async
+Django views that speak the same API: JWT authentication, the same permission
+classes, the same serializers, keyset pagination and response bodies. Queries
+go through the async ORM; serializers that load related data in batches run
+in sync_to_async. Independent analytics queries (sales overview and inventory
+summary) run at the same time, each on its own thread and database connection.
+
+They are mounted under /api/async/. To compare both stacks under concurrent
+load, serve the project with an ASGI server and point load_test at either URL:
+
+    uvicorn stocksync.asgi:application --workers 1
+    python manage.py load_test http://127.0.0.1:8000/api/async/products/ --token <JWT> --concurrency 50
+"""
+import asyncio
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from accounts.models import User
+from accounts.permissions import IsBuyer, IsAdminOrManager
+from accounts.relationships import aget_accepted_supplier_ids
+from .models import Product, Inventory, Order, Buyer
+from .serializers import (
+    ProductSerializer, BuyerSupplierProductSerializer, InventorySerializer, BuyerSupplierInventorySerializer,
+    OrderSerializer, AnalyticsDashboardSerializer, SalesTrendDataPointSerializer, TopSellingProductSerializer
+)
+from .pagination import KeysetPagination
+from .aggregation import get_date_range_from_period
+from .analytics_cache import AnalyticsCache
+
+
+async def authenticate(request):
+    """
+    Authenticates the request's JWT like JWTAuthentication, but loads the user (and
+    its organization) with the async ORM. Returns AnonymousUser without a token.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return AnonymousUser()
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return AnonymousUser()
+
+    validated_token = authentication.get_validated_token(raw_token)
+    try:
+        user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise AuthenticationFailed('Token contained no recognizable user identification')
+
+    user = await User.objects.select_related('organization').filter(**{jwt_settings.USER_ID_FIELD: user_id}).afirst()
+    if user is None:
+        raise AuthenticationFailed('User not found')
+    if not user.is_active:
+        raise AuthenticationFailed('User is inactive')
+    return user
+
+
+def in_own_connection(func):
+    """
+    Wraps a sync function to run on a worker thread with its own database
+    connection, so several of them can run at once (sync_to_async's default
+    runs everything on one shared thread). The connection is closed afterwards.
+    """
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def get_date_range(params, default_period='this_month'):
+    """
+    The analytics date range: start_date and end_date (YYYY-MM-DD) if both are
+    given, else the period. Raises ValueError on a malformed date.
+    """
+    start_date_param = params.get('start_date')
+    end_date_param = params.get('end_date')
+    if start_date_param and end_date_param:
+        start_date = timezone.datetime.strptime(start_date_param, '%Y-%m-%d').replace(tzinfo=timezone.get_current_timezone())
+        end_date = timezone.datetime.strptime(end_date_param, '%Y-%m-%d').replace(hour=23, minute=59, second=59, microsecond=999999, tzinfo=timezone.get_current_timezone())
+        return start_date, end_date
+
+    start_date, end_date = get_date_range_from_period(params.get('period', default_period))
+    if start_date is None: # Handle unsupported period string gracefully
+        start_date, end_date = get_date_range_from_period(default_period)
+    return start_date, end_date
+
+
+class AsyncAPIView(View):
+    """
+    Base class for the async views: authenticates, checks permission_classes
+    and renders response data with DRF's JSON renderer.
+    """
+    permission_classes = [IsAuthenticated]
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user = await authenticate(request)
+        except AuthenticationFailed as e:
+            return self.render({'detail': e.detail}, status=status.HTTP_401_UNAUTHORIZED)
+
+        for permission_class in self.permission_classes:
+            if not permission_class().has_permission(request, self):
+                if not request.user.is_authenticated:
+                    return self.render({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+                return self.render({'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
+
+        # Serializers and the paginator read DRF-style query_params
+        request.query_params = request.GET
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as e:
+            # e.g. NotFound for an invalid pagination cursor
+            return self.render({'detail': e.detail}, status=e.status_code)
+
+    def render(self, data, status=status.HTTP_200_OK):
+        return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+class AsyncPaginatedListView(AsyncAPIView):
+    """A keyset-paginated list: subclasses provide get_queryset and get_serializer_class."""
+
+    async def get(self, request, *args, **kwargs):
+        organization = request.user.organization
+        queryset = await self.get_queryset(request, organization)
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(queryset, request)
+
+        serializer = self.get_serializer_class(organization)(page, many=True, context={'request': request})
+        # Serializers batch load related data with sync queries
+        data = await sync_to_async(lambda: serializer.data)()
+        return self.render(paginator.get_paginated_data(data))
+
+
+class AsyncProductView(AsyncPaginatedListView):
+    """Async variant of ProductAPIView."""
+
+    def get_serializer_class(self, organization):
+        if organization and organization.organization_type in ['buyer', 'both']:
+            return BuyerSupplierProductSerializer
+        return ProductSerializer
+
+    async def get_queryset(self, request, organization):
+        if not organization:
+            return Product.objects.none()
+        if organization.organization_type in ['supplier', 'both', 'internal']:
+            return Product.objects.filter(organization=organization).select_related('category', 'brand').order_by('name')
+        if organization.organization_type == 'buyer':
+            accepted_supplier_ids = await aget_accepted_supplier_ids(request, organization)
+            return Product.objects.filter(organization__id__in=accepted_supplier_ids).select_related('category', 'brand').order_by('name')
+        return Product.objects.none()
+
+
+class AsyncInventoryListView(AsyncPaginatedListView):
+    """Async variant of InventoryListView."""
+
+    def get_serializer_class(self, organization):
+        if organization and organization.organization_type in ['buyer', 'both']:
+            return BuyerSupplierInventorySerializer
+        return InventorySerializer
+
+    async def get_queryset(self, request, organization):
+        if not organization:
+            return Inventory.objects.none()
+
+        queryset = Inventory.objects.select_related('product', 'location')
+        if organization.organization_type in ['buyer', 'both']:
+            accepted_supplier_ids = await aget_accepted_supplier_ids(request, organization)
+            queryset = queryset.filter(
+                Q(organization=organization) | Q(product__organization__id__in=accepted_supplier_ids)
+            )
+        elif organization.organization_type in ['supplier', 'internal']:
+            queryset = queryset.filter(organization=organization)
+        else:
+            queryset = Inventory.objects.none()
+        return queryset.order_by('product__name', 'location__name')
+
+
+class AsyncCartDataView(AsyncAPIView):
+    """Async variant of CartDataView."""
+    permission_classes = [IsAuthenticated, IsBuyer]
+
+    async def get(self, request, *args, **kwargs):
+        user = request.user
+        if not user.organization:
+            return self.render({"detail": "User is not associated with an organization."}, status=status.HTTP_400_BAD_REQUEST)
+
+        empty_cart = {"items": [], "total_amount": "0.00"}
+        buyer = await Buyer.objects.filter(user=user).afirst()
+        if buyer is None:
+            return self.render(empty_cart)
+
+        order = await Order.objects.filter(customer=buyer, status='pending').select_related('customer').afirst()
+        if order is None:
+            return self.render(empty_cart)
+
+        serializer = OrderSerializer(order, context={'request': request})
+        return self.render(await sync_to_async(lambda: serializer.data)())
+
+
+class AsyncAnalyticsView(AsyncAPIView):
+    permission_classes = [IsAuthenticated, IsAdminOrManager]
+
+    def organization_required(self, request):
+        if not request.user.organization:
+            return self.render({"error": "User is not associated with an organization."}, status=status.HTTP_400_BAD_REQUEST)
+        return None
+
+
+class AsyncAnalyticsDashboardView(AsyncAnalyticsView):
+    """
+    Async variant of AnalyticsDashboardView. The sales overview and the inventory
+    summary are independent, so they are computed concurrently.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        error = self.organization_required(request)
+        if error:
+            return error
+        try:
+            start_date, end_date = get_date_range(request.GET)
+        except ValueError:
+            return self.render({"error": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+        analytics_cache = AnalyticsCache(request.user.organization)
+        sales_overview_data, inventory_summary_data = await asyncio.gather(
+            in_own_connection(analytics_cache.sales_overview)(start_date, end_date),
+            in_own_connection(analytics_cache.inventory_summary)()
+        )
+
+        serializer = AnalyticsDashboardSerializer({
+            'sales_overview': sales_overview_data,
+            'inventory_summary': inventory_summary_data,
+        })
+        return analytics_cache.add_headers(self.render(serializer.data))
+
+
+class AsyncSalesTrendAnalyticsView(AsyncAnalyticsView):
+    """Async variant of SalesTrendAnalyticsView."""
+
+    async def get(self, request, *args, **kwargs):
+        error = self.organization_required(request)
+        if error:
+            return error
+        interval = request.GET.get('interval', 'day')
+        if interval not in ['day', 'week', 'month']:
+            return self.render({"error": "Invalid interval. Choose 'day', 'week', or 'month'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start_date, end_date = get_date_range(request.GET, default_period='last_30_days')
+        except ValueError:
+            return self.render({"error": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+        analytics_cache = AnalyticsCache(request.user.organization)
+        trend_data = await in_own_connection(analytics_cache.sales_trend)(start_date, end_date, interval)
+        serializer = SalesTrendDataPointSerializer(trend_data, many=True)
+        return analytics_cache.add_headers(self.render(serializer.data))
+
+
+class AsyncTopSellingProductsAnalyticsView(AsyncAnalyticsView):
+    """Async variant of TopSellingProductsAnalyticsView."""
+
+    async def get(self, request, *args, **kwargs):
+        error = self.organization_required(request)
+        if error:
+            return error
+        try:
+            start_date, end_date = get_date_range(request.GET)
+        except ValueError:
+            return self.render({"error": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.GET.get('limit', 5))
+        except ValueError:
+            return self.render({"error": "Invalid 'limit' parameter."}, status=status.HTTP_400_BAD_REQUEST)
+        by_param = request.GET.get('by', 'revenue')
+        if by_param not in ['revenue', 'units']:
+            return self.render({"error": "Invalid 'by' parameter. Choose 'revenue' or 'units'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        analytics_cache = AnalyticsCache(request.user.organization)
+        top_products_data = await in_own_connection(analytics_cache.top_selling_products)(start_date, end_date, limit, by_param)
+        serializer = TopSellingProductSerializer(top_products_data, many=True)
+        return analytics_cache.add_headers(self.render(serializer.data))
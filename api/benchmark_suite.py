@@ -0,0 +1,164 @@
+"""
+Endpoint benchmarks against a generated dataset (the run_benchmarks command).
+
+Each endpoint is called in-process through its URL (resolve + the view, as the
+request would be routed), authenticated as a user of the dataset, and timed
+including response rendering. The result is a JSON document with per-endpoint
+latency percentiles and query counts plus the dataset size, so results of
+different commits can be compared (compare_results).
+
+The users are the admins of the busiest supplier and of the buyer with the most
+accepted suppliers among the organizations named '<prefix> ...'.
+process-order creates a fresh cart for the buyer for every run and rolls the
+whole checkout back, so the dataset does not change between runs. The analytics
+cache is cleared before every analytics call, so the numbers are for computing
+the results, not for cache hits.
+"""
+import statistics
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from accounts.models import Organization, OrganizationRelationship, User
+from .analytics_cache import get_analytics_cache
+from .models import Buyer, Inventory, InventoryMovement, Order, OrderItem, Product
+
+# name: (user, method, path, query or body)
+ENDPOINTS = {
+    'products': ('buyer', 'get', '/api/products/', {}),
+    'inventory (supplier)': ('supplier', 'get', '/api/inventory/', {}),
+    'inventory (buyer)': ('buyer', 'get', '/api/inventory/', {}),
+    'inventory-movements': ('supplier', 'get', '/api/inventory-movements/', {}),
+    'analytics/dashboard': ('supplier', 'get', '/api/analytics/dashboard/', {'period': 'last_30_days'}),
+    'analytics/sales-trend': ('supplier', 'get', '/api/analytics/sales-trend/', {'period': 'last_30_days'}),
+    'analytics/top-products': ('supplier', 'get', '/api/analytics/top-products/', {'period': 'last_30_days'}),
+    'process-order': ('buyer', 'post', '/api/process-order/', None),
+}
+
+
+def find_benchmark_users(prefix):
+    """(supplier admin, buyer admin) of the dataset named prefix."""
+    organizations = Organization.objects.filter(name__startswith=f'{prefix} ')
+    supplier = (
+        organizations.filter(organization_type__in=['supplier', 'both'])
+        .annotate(order_count=Count('orders')).order_by('-order_count', 'id').first()
+    )
+    buyer = (
+        organizations.filter(organization_type='buyer')
+        .annotate(accepted_suppliers=Count('buying_relationships', filter=Q(buying_relationships__status='accepted')))
+        .order_by('-accepted_suppliers', 'id').first()
+    )
+    if supplier is None or buyer is None:
+        raise ValueError(f"No supplier and buyer organizations named '{prefix} ...'; run generate_dataset first.")
+    return (
+        User.objects.filter(organization=supplier, role='admin').order_by('id').first(),
+        User.objects.filter(organization=buyer, role='admin').order_by('id').first(),
+    )
+
+
+def _checkout_request(factory, buyer_user, lines):
+    """Fills a new cart for the buyer with lines in-stock products of an accepted supplier; returns the request."""
+    supplier_ids = OrganizationRelationship.objects.filter(
+        buyer_organization_id=buyer_user.organization_id, status='accepted'
+    ).values_list('supplier_organization_id', flat=True)
+    products = list(
+        Product.objects.filter(
+            organization_id__in=supplier_ids, inventory_items__organization_id__in=supplier_ids, inventory_items__quantity__gte=1
+        ).distinct().order_by('id')[:lines]
+    )
+    if not products:
+        raise ValueError(
+            f'No in-stock products of the suppliers of {buyer_user.organization} to check out; regenerate the dataset or restock it.'
+        )
+    buyer = Buyer.objects.get(user=buyer_user)
+    order = Order.objects.create(organization_id=products[0].organization_id, customer=buyer, status='pending')
+    for product in products:
+        OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=product.price, organization_id=product.organization_id)
+    total = sum((product.price for product in products), Decimal('0.00'))
+    return factory.post('/api/process-order/', {'total': str(total), 'shipping_info': {}}, format='json')
+
+
+def _request_host():
+    """A host name ALLOWED_HOSTS accepts, for the absolute URLs in paginated responses."""
+    for host in settings.ALLOWED_HOSTS:
+        if host == '*':
+            break
+        return host.lstrip('.')
+    return 'localhost' if settings.DEBUG or not settings.ALLOWED_HOSTS else 'testserver'
+
+
+def _call(request, user, path):
+    force_authenticate(request, user=user)
+    view = resolve(path).func
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = view(request)
+        if hasattr(response, 'render'):
+            response.render()
+        elapsed = time.perf_counter() - started
+    return response.status_code, elapsed, len(queries)
+
+
+def run_endpoint(name, users, runs=20, warmup=2, checkout_lines=5):
+    """Times one endpoint; returns its result entry."""
+    user_role, method, path, params = ENDPOINTS[name]
+    user = users[user_role]
+    factory = APIRequestFactory(HTTP_HOST=_request_host())
+    samples = []
+    for run in range(warmup + runs):
+        if name.startswith('analytics/'):
+            get_analytics_cache().clear()
+        if name == 'process-order':
+            with transaction.atomic():
+                sample = _call(_checkout_request(factory, user, checkout_lines), user, path)
+                transaction.set_rollback(True)
+        else:
+            sample = _call(getattr(factory, method)(path, params), user, path)
+        if run >= warmup:
+            samples.append(sample)
+
+    times = sorted(elapsed * 1000 for _, elapsed, _ in samples)
+    return {
+        'runs': len(samples),
+        'status_codes': sorted({status_code for status_code, _, _ in samples}),
+        'min_ms': round(times[0], 2),
+        'p50_ms': round(statistics.median(times), 2),
+        'p95_ms': round(times[min(len(times) - 1, int(len(times) * 0.95))], 2),
+        'max_ms': round(times[-1], 2),
+        'mean_ms': round(statistics.fmean(times), 2),
+        'queries': statistics.median_low([queries for _, _, queries in samples]),
+    }
+
+
+def run_benchmarks(prefix='Synthetic', endpoints=None, runs=20, warmup=2, checkout_lines=5, label=None):
+    """Runs the endpoint benchmarks and returns the results document."""
+    supplier_user, buyer_user = find_benchmark_users(prefix)
+    users = {'supplier': supplier_user, 'buyer': buyer_user}
+    return {
+        'label': label,
+        'created_at': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'dataset': {
+            model.__name__: model.objects.count()
+            for model in (Organization, OrganizationRelationship, Product, Inventory, InventoryMovement, Order, OrderItem)
+        },
+        'settings': {'runs': runs, 'warmup': warmup, 'checkout_lines': checkout_lines},
+        'results': {name: run_endpoint(name, users, runs, warmup, checkout_lines) for name in endpoints or ENDPOINTS},
+    }
+
+
+def compare_results(baseline, current, metric='p50_ms'):
+    """[(endpoint, baseline value, current value, change in percent)] for the endpoints in both documents."""
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        change = (result[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0.0
+        rows.append((name, before[metric], result[metric], round(change, 1)))
+    return rows
@@ -0,0 +1,357 @@
+"""
+Performance benchmarks. These are not picked up by the normal test run (they
+seed large datasets); run them explicitly:
+
+    python manage.py test api.benchmarks
+
+Latency budgets can be tuned with the BENCHMARK_* settings.
+"""
+import contextlib
+import io
+import json
+import logging
+import random
+import threading
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from accounts.models import Organization, User
+from stocksync.logs import StructuredFormatter
+from .models import Product, Location, Inventory, Order, OrderItem, Buyer
+from .rollups import rebuild_rollups
+from .views import AnalyticsDashboardView, UnAuthProcessOrderView, ProcessOrderView
+from .utils import cookieCart
+from .analytics_cache import get_analytics_cache
+from .sequences import reset_sequence_blocks
+from .identifiers import TransactionIdGenerator, FULL_RANDOM_LENGTH, SHORT_RANDOM_LENGTH
+
+
+def seed_sales_history(organization, products=1000, order_lines=100000, lines_per_order=10, days=60, seed=0):
+    """
+    Bulk-creates a catalog with stock and a delivered order history for the
+    organization, then rebuilds the sales rollup. Rows are bulk-inserted, so no
+    per-row signals or save() logic run. Returns the number of order lines.
+    """
+    rng = random.Random(seed)
+    location, _ = Location.objects.get_or_create(name='Benchmark Warehouse', organization=organization)
+
+    Product.objects.bulk_create([
+        Product(
+            name=f'Benchmark Product {index:06d}',
+            sku=f'BENCH-{organization.id}-{index:06d}',
+            price=Decimal(rng.randint(500, 20000)) / 100,
+            cost=Decimal(rng.randint(100, 400)) / 100,
+            organization=organization
+        ) for index in range(products)
+    ], batch_size=1000)
+    catalog = list(Product.objects.filter(organization=organization).values_list('id', 'price'))
+
+    Inventory.objects.bulk_create([
+        Inventory(product_id=product_id, location=location, organization=organization, quantity=rng.randint(0, 200))
+        for product_id, _ in catalog
+    ], batch_size=1000, ignore_conflicts=True)
+
+    order_count = order_lines // lines_per_order
+    Order.objects.bulk_create([
+        Order(organization=organization, status='delivered', order_number=f'BENCH-{organization.id}-{index:07d}')
+        for index in range(order_count)
+    ], batch_size=1000)
+    # bulk_create sets order_date to now; spread the history over the last `days` days
+    orders = list(Order.objects.filter(organization=organization, order_number__startswith=f'BENCH-{organization.id}-').values_list('id', flat=True))
+    for day in range(days):
+        Order.objects.filter(id__in=orders[day::days]).update(order_date=timezone.now() - timezone.timedelta(days=day))
+
+    lines = []
+    for order_id in orders:
+        for product_id, price in rng.sample(catalog, min(lines_per_order, len(catalog))):
+            quantity = rng.randint(1, 5)
+            lines.append(OrderItem(
+                order_id=order_id, product_id=product_id, quantity=quantity, unit_price=price,
+                subtotal=quantity * price, organization=organization
+            ))
+    OrderItem.objects.bulk_create(lines, batch_size=2000)
+
+    rebuild_rollups(organization)
+    return len(lines)
+
+
+class AnalyticsDashboardBenchmark(TestCase):
+    """The dashboard for a 100k-line organization stays within a fixed latency and query budget."""
+
+    order_lines = 100000
+    max_queries = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Benchmark Supplier', organization_type='supplier', active_status=True)
+        cls.user = User.objects.create_user(
+            email='benchmark@example.com', username='benchmark', password='password',
+            organization=cls.organization, role='admin'
+        )
+        started = time.perf_counter()
+        cls.lines = seed_sales_history(cls.organization, order_lines=cls.order_lines)
+        print(f"Seeded {cls.lines} order lines in {time.perf_counter() - started:.1f}s")
+
+    def get_dashboard(self, period):
+        # Measure the computation, not the analytics cache
+        get_analytics_cache().clear()
+        request = APIRequestFactory().get('/api/analytics/dashboard/', {'period': period})
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = AnalyticsDashboardView.as_view()(request)
+            response.render()
+            elapsed = time.perf_counter() - started
+        return response, elapsed, len(queries)
+
+    def test_dashboard_latency(self):
+        max_seconds = getattr(settings, 'BENCHMARK_DASHBOARD_MAX_SECONDS', 0.5)
+        self.assertEqual(self.lines, self.order_lines)
+
+        for period in ['today', 'last_7_days', 'last_30_days', 'this_month']:
+            # Best of three, so a single scheduler hiccup does not fail the run
+            runs = [self.get_dashboard(period) for _ in range(3)]
+            response = runs[0][0]
+            best = min(elapsed for _, elapsed, _ in runs)
+            queries = runs[0][2]
+            print(f"Dashboard ({period}) over {self.lines} order lines: {best * 1000:.1f} ms, {queries} queries")
+
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(queries, self.max_queries)
+            self.assertLess(best, max_seconds)
+
+
+class ParallelOrderInsertBenchmark(TransactionTestCase):
+    """Orders for one organization created from several threads get distinct numbers, with and without blocks."""
+
+    workers = 8
+    orders_per_worker = 50
+
+    def create_orders(self, organization):
+        errors = []
+        start = threading.Barrier(self.workers)
+
+        def worker():
+            try:
+                start.wait()
+                for _ in range(self.orders_per_worker):
+                    Order.objects.create(organization=organization)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started, errors
+
+    def test_parallel_order_inserts(self):
+        total = self.workers * self.orders_per_worker
+        for block_size in (1, 50):
+            reset_sequence_blocks()
+            organization = Organization.objects.create(name=f'Sequence Benchmark {block_size}', organization_type='supplier', active_status=True)
+            with override_settings(SEQUENCE_BLOCK_SIZE=block_size):
+                elapsed, errors = self.create_orders(organization)
+            print(f"{total} orders from {self.workers} threads, block size {block_size}: {total / elapsed:.0f} orders/s")
+
+            self.assertEqual(errors, [])
+            numbers = set(Order.objects.filter(organization=organization).values_list('order_number', flat=True))
+            self.assertEqual(len(numbers), total)
+            if block_size == 1:
+                self.assertEqual(numbers, {f'ORD-{organization.id}-{value:06d}' for value in range(1, total + 1)})
+        reset_sequence_blocks()
+
+
+class TransactionIdBenchmark(SimpleTestCase):
+    """Throughput and collision rate of transaction IDs over millions of IDs, without touching the database."""
+
+    ids_per_generator = 250000
+    workers = 8
+
+    def test_single_worker_ids_are_unique_and_ordered(self):
+        for random_length in (FULL_RANDOM_LENGTH, SHORT_RANDOM_LENGTH):
+            generator = TransactionIdGenerator(random_length)
+            count = self.ids_per_generator * self.workers
+            started = time.perf_counter()
+            ids = [generator.generate() for _ in range(count)]
+            elapsed = time.perf_counter() - started
+            print(f"{count} IDs of {len(ids[0])} characters from one worker: {count / elapsed:,.0f} IDs/s")
+
+            self.assertEqual(len(set(ids)), count)
+            self.assertEqual(ids, sorted(ids))
+
+    def test_collisions_across_workers(self):
+        # Independent generators stand in for separate worker processes, interleaved so they share milliseconds
+        for random_length in (FULL_RANDOM_LENGTH, SHORT_RANDOM_LENGTH):
+            generators = [TransactionIdGenerator(random_length) for _ in range(self.workers)]
+            seen = set()
+            collisions = 0
+            for _ in range(self.ids_per_generator):
+                for generator in generators:
+                    transaction_id = generator.generate()
+                    if transaction_id in seen:
+                        collisions += 1
+                    seen.add(transaction_id)
+            total = self.ids_per_generator * self.workers
+            print(f"{total} IDs of {len(next(iter(seen)))} characters from {self.workers} workers: {collisions} collisions")
+
+            if random_length == FULL_RANDOM_LENGTH:
+                self.assertEqual(collisions, 0)
+            else:
+                self.assertLess(collisions / total, 1e-5)
+
+
+class CookieCartBenchmark(TestCase):
+    """Guest carts of 200 lines: product lookups and line inserts do not grow with the cart."""
+
+    cart_lines = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Cookie Cart Supplier', organization_type='supplier', active_status=True)
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Cart Product {index:04d}', sku=f'CART-{index:04d}', price=Decimal('10.00'), cost=Decimal('6.00'), organization=cls.organization)
+            for index in range(cls.cart_lines)
+        ])
+        cls.cookie = json.dumps({str(product.id): {'quantity': 1} for product in cls.products})
+
+    def measure(self, view):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = view()
+            elapsed = time.perf_counter() - started
+        cart_queries = [query for query in queries if query['sql'].startswith(('SELECT "api_product"', 'INSERT INTO "api_orderitem"'))]
+        return response, elapsed, len(cart_queries)
+
+    def test_cookie_cart(self):
+        request = APIRequestFactory().get('/')
+        request.COOKIES['cart'] = self.cookie
+        cart, elapsed, queries = self.measure(lambda: cookieCart(request))
+        print(f"cookieCart with {self.cart_lines} lines: {elapsed * 1000:.1f} ms, {queries} product queries")
+
+        self.assertEqual(len(cart['items']), self.cart_lines)
+        self.assertEqual(queries, 1)
+
+    def test_guest_checkout(self):
+        request = APIRequestFactory().post('/api/unauth-process-order/', {
+            'user_info': {'first_name': 'Bench', 'last_name': 'Guest', 'email': 'bench-guest@example.com'},
+            'total': str(Decimal('10.00') * self.cart_lines),
+        }, format='json')
+        request.COOKIES['cart'] = self.cookie
+        response, elapsed, queries = self.measure(lambda: UnAuthProcessOrderView.as_view()(request))
+        print(f"Guest checkout with {self.cart_lines} lines: {elapsed * 1000:.1f} ms, {queries} product/line queries")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(OrderItem.objects.filter(order__customer__email='bench-guest@example.com').count(), self.cart_lines)
+        # One in_bulk, the line insert(s) (SQLite splits bulk inserts at 999 parameters) and the rollup's line read
+        self.assertLessEqual(queries, 5)
+
+
+@contextlib.contextmanager
+def api_logging(level):
+    """Sends the api loggers at level to an in-memory stream, formatted as in production."""
+    logger = logging.getLogger('api')
+    saved = logger.level, logger.handlers, logger.propagate
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(StructuredFormatter())
+    logger.setLevel(level)
+    logger.handlers = [handler]
+    logger.propagate = False
+    try:
+        yield handler.stream
+    finally:
+        logger.setLevel(saved[0])
+        logger.handlers, logger.propagate = saved[1], saved[2]
+
+
+class LoggingOverheadBenchmark(TestCase):
+    """What the level-gated logging saves over the print() calls it replaced, per call and per checkout."""
+
+    calls = 100000
+    checkouts = 50
+    order_lines = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.supplier = Organization.objects.create(name='Logging Supplier', organization_type='supplier', active_status=True)
+        cls.buyer_org = Organization.objects.create(name='Logging Buyer', organization_type='buyer', active_status=True)
+        cls.user = User.objects.create_user(email='logging-bench@example.com', username='logging-bench', password='password', organization=cls.buyer_org)
+        cls.buyer = Buyer.objects.create(user=cls.user, name='Logging Buyer', buyer_code='LOG-BENCH')
+        Location.objects.create(name='Store', organization=cls.buyer_org)
+        location = Location.objects.create(name='Warehouse', organization=cls.supplier)
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Logged Product {index:03d}', sku=f'LOG-{index:03d}', price=Decimal('10.00'), cost=Decimal('6.00'), organization=cls.supplier)
+            for index in range(cls.order_lines)
+        ])
+        Inventory.objects.bulk_create([
+            Inventory(product=product, location=location, organization=cls.supplier, quantity=1000000) for product in cls.products
+        ])
+
+    def test_disabled_call_versus_print(self):
+        inventory = Inventory.objects.select_related('product').first()
+        logger = logging.getLogger('api.models')
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            for _ in range(self.calls):
+                # The removed Inventory.trigger_low_stock_alert line, with the product already loaded
+                print(f"Checking low stock for Inventory ID: {inventory.id}, Product: {inventory.product.name}, Quantity: {inventory.quantity}, Min Level: {inventory.min_stock_level}")
+            print_time = time.perf_counter() - started
+
+        with api_logging(logging.INFO):
+            started = time.perf_counter()
+            for _ in range(self.calls):
+                logger.debug('Low stock', extra={'inventory_id': inventory.id, 'quantity': inventory.quantity, 'min_stock_level': inventory.min_stock_level})
+            disabled_time = time.perf_counter() - started
+
+        print(
+            f"print(): {print_time / self.calls * 1e9:.0f} ns/call, disabled logger.debug(): "
+            f"{disabled_time / self.calls * 1e9:.0f} ns/call ({print_time / disabled_time:.1f}x)"
+        )
+        self.assertLess(disabled_time, print_time)
+
+    def checkout(self):
+        order = Order.objects.create(organization=self.supplier, customer=self.buyer, status='pending')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, unit_price=product.price, subtotal=product.price, organization=self.supplier)
+            for product in self.products
+        ])
+        Order.objects.filter(pk=order.pk).update(total_amount=Decimal('10.00') * self.order_lines, item_count=self.order_lines)
+        request = APIRequestFactory().post('/api/process_order/', {'total': str(Decimal('10.00') * self.order_lines), 'shipping_info': {}}, format='json')
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = ProcessOrderView.as_view()(request)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200)
+        return elapsed, len(queries)
+
+    def test_per_checkout_saving(self):
+        self.checkout() # Creates the buyer's inventory rows
+        # DEBUG formats and writes everything the prints did, including the values that cost queries.
+        # The levels take turns, so both see the same table sizes.
+        totals = {logging.DEBUG: [0.0, 0, 0], logging.INFO: [0.0, 0, 0]}
+        for _ in range(self.checkouts):
+            for level, total in totals.items():
+                with api_logging(level) as stream:
+                    elapsed, queries = self.checkout()
+                total[0] += elapsed / self.checkouts
+                total[1] += queries / self.checkouts
+                total[2] += len(stream.getvalue())
+        (debug_time, debug_queries, debug_bytes), (info_time, info_queries, info_bytes) = totals[logging.DEBUG], totals[logging.INFO]
+        print(
+            f"ProcessOrderView with {self.order_lines} lines: DEBUG {debug_time * 1000:.2f} ms, {debug_queries:.0f} queries, "
+            f"{debug_bytes / self.checkouts:.0f} bytes of log; INFO {info_time * 1000:.2f} ms, {info_queries:.0f} queries, "
+            f"{info_bytes / self.checkouts:.0f} bytes; saving {(debug_time - info_time) * 1000:.2f} ms per checkout"
+        )
+        self.assertLess(info_queries, debug_queries)
+        self.assertLess(info_bytes, debug_bytes)
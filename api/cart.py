@@ -0,0 +1,176 @@
+"""
+Cart line changes as upserts.
+
+apply_cart_changes applies a batch of add/remove/set changes to a pending order.
+Each change is one
+
+    INSERT INTO api_orderitem ... ON CONFLICT (order_id, product_id) DO UPDATE SET quantity = ... RETURNING quantity
+
+so a line is created or changed without reading it first. Lines that end at
+zero are deleted with one statement for the whole batch, and the order's
+total_amount and item_count are recomputed from its lines with one UPDATE that
+returns the new totals.
+
+The upserts bypass OrderItem.save, which is fine for carts: a pending order is
+not in the sales rollup. Databases without INSERT ... ON CONFLICT ... RETURNING
+(MySQL) take the model path instead.
+
+drifted_order_totals and repair_order_totals compare and repair the stored
+totals of many orders at once (check_cart_totals, bulk_loaddata).
+"""
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Order, OrderItem
+
+CART_ACTIONS = ('add', 'remove', 'set')
+
+
+def _supports_upsert_returning():
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_rows_from_bulk_insert
+
+
+def _to_decimal(value):
+    # SQLite hands back numeric columns as int/float
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def _upsert_line(order, product, action, amount):
+    """Applies one change to the (order, product) line and returns its new quantity."""
+    quote = connection.ops.quote_name
+    item_table = quote(OrderItem._meta.db_table)
+    current = f'{item_table}.{quote("quantity")}'
+    params = []
+    if action == 'add':
+        new_quantity = f'{current} + excluded.{quote("quantity")}'
+        insert_quantity = amount
+    elif action == 'set':
+        new_quantity = f'excluded.{quote("quantity")}'
+        insert_quantity = amount
+    else:
+        new_quantity = f'CASE WHEN {current} > %s THEN {current} - %s ELSE 0 END'
+        params = [amount, amount]
+        insert_quantity = 0
+
+    sql = (
+        f'INSERT INTO {item_table} ({quote("order_id")}, {quote("product_id")}, {quote("quantity")}, '
+        f'{quote("unit_price")}, {quote("subtotal")}, {quote("organization_id")}) VALUES (%s, %s, %s, %s, %s, %s) '
+        f'ON CONFLICT ({quote("order_id")}, {quote("product_id")}) DO UPDATE SET '
+        f'{quote("quantity")} = {new_quantity}, '
+        f'{quote("unit_price")} = excluded.{quote("unit_price")}, '
+        f'{quote("subtotal")} = ({new_quantity}) * excluded.{quote("unit_price")} '
+        f'RETURNING {quote("quantity")}'
+    )
+    insert_params = [order.pk, product.pk, insert_quantity, product.price, insert_quantity * product.price, order.organization_id]
+    with connection.cursor() as cursor:
+        # SET uses the CASE parameters twice (quantity and subtotal)
+        cursor.execute(sql, insert_params + params + params)
+        return cursor.fetchone()[0]
+
+
+def _recalculate_order_totals(order):
+    """Sets total_amount and item_count from the order's lines and returns them, in one statement."""
+    quote = connection.ops.quote_name
+    order_table = quote(Order._meta.db_table)
+    item_table = quote(OrderItem._meta.db_table)
+    sql = (
+        f'UPDATE {order_table} SET '
+        f'{quote("total_amount")} = (SELECT COALESCE(SUM({quote("subtotal")}), 0) FROM {item_table} WHERE {quote("order_id")} = %s), '
+        f'{quote("item_count")} = (SELECT COALESCE(SUM({quote("quantity")}), 0) FROM {item_table} WHERE {quote("order_id")} = %s), '
+        f'{quote("updated_at")} = %s '
+        f'WHERE {quote("id")} = %s RETURNING {quote("total_amount")}, {quote("item_count")}'
+    )
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [order.pk, order.pk, connection.ops.adapt_datetimefield_value(now), order.pk])
+        total_amount, item_count = cursor.fetchone()
+    order.total_amount = _to_decimal(total_amount)
+    order.item_count = item_count
+    order.updated_at = now
+
+
+def _apply_with_models(order, product, action, amount):
+    """The same change through OrderItem save/delete, for databases without upsert RETURNING."""
+    item = OrderItem.objects.select_for_update().filter(order=order, product=product).first()
+    current = item.quantity if item else 0
+    if action == 'add':
+        quantity = current + amount
+    elif action == 'remove':
+        quantity = max(0, current - amount)
+    else:
+        quantity = amount
+
+    if quantity <= 0:
+        if item:
+            item.order = order
+            item.delete()
+        return 0
+    if item is None:
+        item = OrderItem(order=order, product=product, organization_id=order.organization_id)
+    item.order = order
+    item.quantity = quantity
+    item.unit_price = product.price
+    item.save()
+    return quantity
+
+
+def apply_cart_changes(order, changes):
+    """
+    Applies (product, action, amount) changes in order, where action is 'add',
+    'remove' (down to zero) or 'set'. Lines that end at zero are deleted.
+    Returns {product_id: new quantity}; order.total_amount and order.item_count
+    are updated in place.
+
+    Call it inside a transaction holding the order row lock
+    (Order.objects.select_for_update()), so concurrent changes to the same cart
+    queue up instead of interleaving.
+    """
+    quantities = {}
+    with transaction.atomic():
+        if not _supports_upsert_returning():
+            for product, action, amount in changes:
+                quantities[product.pk] = _apply_with_models(order, product, action, amount)
+            return quantities
+
+        for product, action, amount in changes:
+            quantities[product.pk] = _upsert_line(order, product, action, amount)
+
+        emptied = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+        if emptied:
+            OrderItem.objects.filter(order=order, product_id__in=emptied, quantity__lte=0).delete()
+        _recalculate_order_totals(order)
+    return quantities
+
+
+def _line_totals(order_ref):
+    """(subtotal sum, quantity sum) expressions over the lines of the order order_ref points to, zero without lines."""
+    lines = OrderItem.objects.filter(order_id=order_ref).order_by().values('order_id')
+    return (
+        Coalesce(
+            Subquery(lines.annotate(total=Sum('subtotal')).values('total')),
+            Value(Decimal('0.00')), output_field=DecimalField(max_digits=10, decimal_places=2)
+        ),
+        Coalesce(Subquery(lines.annotate(quantity=Sum('quantity')).values('quantity')), Value(0), output_field=IntegerField()),
+    )
+
+
+def drifted_order_totals(orders=None):
+    """
+    The orders (of the given queryset, or all) whose total_amount or item_count
+    differ from the sums of their lines, annotated with line_total and line_quantity.
+    """
+    orders = orders if orders is not None else Order._base_manager.all()
+    line_total, line_quantity = _line_totals(OuterRef('pk'))
+    return orders.annotate(line_total=line_total, line_quantity=line_quantity).filter(
+        ~Q(total_amount=F('line_total')) | ~Q(item_count=F('line_quantity'))
+    )
+
+
+def repair_order_totals(orders=None):
+    """Sets the totals of the drifted orders to the sums of their lines with one UPDATE; returns how many changed."""
+    line_total, line_quantity = _line_totals(OuterRef('pk'))
+    return Order._base_manager.filter(pk__in=drifted_order_totals(orders).values('pk')).update(
+        total_amount=line_total, item_count=line_quantity
+    )
@@ -0,0 +1,189 @@
+"""
+Set-based checkout.
+
+process_checkout moves the stock for a whole order at once: the supplier and
+buyer inventory rows are resolved with one query each, the decrements and
+increments are applied with one conditional UPDATE per side and the sale and
+purchase movements are inserted with one bulk_create. The number of queries
+does not depend on the number of order lines.
+"""
+import logging
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Case, When, Value, F, IntegerField
+from django.utils import timezone
+from .models import Inventory, InventoryMovement
+from .stock import InsufficientStockError, BULK_BATCH_SIZE
+from .analytics_cache import invalidate_analytics
+from .metrics import record_stock_movements
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutConflictError(Exception):
+    """Raised when supplier inventory rows of the order disappear while the checkout runs."""
+
+
+def _quantity_case(deltas):
+    """CASE id WHEN ... THEN n END for a {inventory_id: n} mapping."""
+    return Case(
+        *[When(id=inventory_id, then=Value(quantity)) for inventory_id, quantity in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+
+def _chunks(mapping):
+    items = list(mapping.items())
+    for start in range(0, len(items), BULK_BATCH_SIZE):
+        yield dict(items[start:start + BULK_BATCH_SIZE])
+
+
+def _resolve_supplier_inventories(product_ids):
+    """
+    Returns {product_id: Inventory} with the supplier's inventory row for each product
+    (the first one by ID if the supplier stocks it at several locations).
+    """
+    inventories = {}
+    rows = Inventory.objects.filter(
+        product_id__in=product_ids,
+        organization_id=F('product__organization_id'),
+        product__organization__organization_type__in=['supplier', 'both']
+    ).select_related('product', 'location').order_by('id')
+    for inventory in rows:
+        inventories.setdefault(inventory.product_id, inventory)
+    return inventories
+
+
+def _resolve_buyer_inventories(product_ids, organization, location):
+    """Returns {product_id: Inventory} for the buyer location, creating missing rows with zero stock."""
+    rows = Inventory.objects.filter(product_id__in=product_ids, organization=organization, location=location)
+    inventories = {inventory.product_id: inventory for inventory in rows}
+
+    missing = [product_id for product_id in product_ids if product_id not in inventories]
+    if missing:
+        # ignore_conflicts: a concurrent checkout may create the same rows first
+        Inventory.objects.bulk_create(
+            [Inventory(product_id=product_id, organization=organization, location=location, quantity=0) for product_id in missing],
+            ignore_conflicts=True
+        )
+        created = Inventory.objects.filter(product_id__in=missing, organization=organization, location=location)
+        inventories.update({inventory.product_id: inventory for inventory in created})
+    return inventories
+
+
+def _running_quantities(lines, final_quantities):
+    """
+    Works out quantity_after_movement for each line from the final quantities,
+    walking backwards so several lines for one inventory row form a running balance.
+    """
+    after = [None] * len(lines)
+    remaining = dict(final_quantities)
+    for index in range(len(lines) - 1, -1, -1):
+        inventory_id, quantity_change = lines[index]
+        after[index] = remaining[inventory_id]
+        remaining[inventory_id] -= quantity_change
+    return after
+
+
+def process_checkout(order, organization, location, user=None):
+    """
+    Moves the stock for all lines of the order: decrements the supplier inventory
+    (sale) and increments the buyer inventory at the given location (purchase).
+
+    Supplier stock is decremented with
+        UPDATE ... SET quantity = quantity - CASE id ... END WHERE id IN (...) AND quantity >= CASE id ... END
+    so concurrent checkouts cannot oversell; if any row lacks stock, the whole
+    checkout is rolled back with InsufficientStockError. Returns the movements created.
+    """
+    now = timezone.now()
+    order_items = list(order.items.select_related('product__organization').order_by('id'))
+    if not order_items:
+        return []
+
+    product_ids = list(dict.fromkeys(item.product_id for item in order_items))
+
+    with transaction.atomic():
+        supplier_inventories = _resolve_supplier_inventories(product_ids)
+        buyer_inventories = _resolve_buyer_inventories(product_ids, organization, location)
+
+        sale_lines, purchase_lines = [], []
+        sale_totals, purchase_totals = defaultdict(int), defaultdict(int)
+        for item in order_items:
+            supplier_inventory = supplier_inventories.get(item.product_id)
+            if supplier_inventory is not None:
+                sale_lines.append((supplier_inventory.id, -item.quantity))
+                sale_totals[supplier_inventory.id] += item.quantity
+            else:
+                logger.warning(
+                    'Supplier inventory item not found',
+                    extra={'order_id': order.id, 'product_id': item.product_id, 'supplier_id': item.product.organization_id}
+                )
+
+            buyer_inventory = buyer_inventories[item.product_id]
+            purchase_lines.append((buyer_inventory.id, item.quantity))
+            purchase_totals[buyer_inventory.id] += item.quantity
+
+        for chunk in _chunks(sale_totals):
+            updated = Inventory.objects.filter(
+                id__in=chunk.keys(),
+                quantity__gte=_quantity_case(chunk)
+            ).update(
+                quantity=F('quantity') - _quantity_case(chunk),
+                last_sold=now,
+                updated_at=now
+            )
+            if updated != len(chunk):
+                # Find the first row that was short and report it; the atomic block rolls everything back
+                for inventory in Inventory.objects.select_related('product', 'location').filter(id__in=chunk.keys()):
+                    if inventory.quantity < chunk[inventory.id]:
+                        raise InsufficientStockError(inventory, chunk[inventory.id])
+                raise CheckoutConflictError("Supplier inventory items were removed during checkout.")
+
+        for chunk in _chunks(purchase_totals):
+            Inventory.objects.filter(id__in=chunk.keys()).update(
+                quantity=F('quantity') + _quantity_case(chunk),
+                last_stocked=now,
+                updated_at=now
+            )
+
+        # Our UPDATEs hold the row locks until commit, so these are the quantities after this checkout
+        final_quantities = dict(Inventory.objects.filter(
+            id__in=list(sale_totals) + list(purchase_totals)
+        ).values_list('id', 'quantity'))
+
+        movements = []
+        sale_after = _running_quantities(sale_lines, final_quantities)
+        purchase_after = _running_quantities(purchase_lines, final_quantities)
+        sale_index = 0
+        for index, item in enumerate(order_items):
+            product = item.product
+            supplier_inventory = supplier_inventories.get(item.product_id)
+            if supplier_inventory is not None:
+                movements.append(InventoryMovement(
+                    inventory_id=supplier_inventory.id,
+                    movement_type='sale',
+                    quantity_change=-item.quantity, # Negative for subtraction
+                    quantity_after_movement=sale_after[sale_index],
+                    user=user, # User who processed the order (the buyer in this flow)
+                    organization_id=product.organization_id, # The supplier's organization
+                    note=f"Sale to {organization.name} (Order {order.id})"
+                ))
+                sale_index += 1
+
+            movements.append(InventoryMovement(
+                inventory_id=buyer_inventories[item.product_id].id,
+                movement_type='purchase',
+                quantity_change=item.quantity, # Positive for addition
+                quantity_after_movement=purchase_after[index],
+                user=user, # User who processed the order (the buyer)
+                organization=organization, # The buyer's organization
+                note=f"Purchase from {product.organization.name if product.organization else 'unknown supplier'} (Order {order.id})"
+            ))
+
+        InventoryMovement.objects.bulk_create(movements, batch_size=BULK_BATCH_SIZE)
+        invalidate_analytics({movement.organization_id for movement in movements})
+
+    record_stock_movements(movements)
+    logger.debug('Checkout stock moved', extra={'order_id': order.id, 'sales': len(sale_lines), 'purchases': len(purchase_lines)})
+    return movements
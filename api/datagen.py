@@ -0,0 +1,300 @@
+"""
+Synthetic multi-tenant datasets for benchmarking (the generate_dataset command).
+
+generate_dataset creates organizations of all types with an admin each, a
+buyer/supplier relationship graph, and then:
+
+- supplier catalogs, stocked at one of the supplier's locations
+- buyer inventory for part of what the buyer's suppliers sell
+- stock movement histories that end at the current quantities
+- order histories with their lines, spread over the last `days` days
+
+Relationships follow a skewed popularity: a few suppliers serve many buyers,
+as in real marketplaces. Most relationships are accepted, some are pending or
+rejected.
+
+Rows go in with bulk_create in batches. Apart from the product IDs and prices
+of the catalogs, nothing is kept in memory beyond one organization's rows and
+one batch. bulk_create skips save() and signals, so the
+generator supplies what those would:
+
+- order numbers and buyer codes, taken from the Sequence counters so later saves
+  continue after them
+- order totals
+- the sales rollups and the product search index, rebuilt at the end
+
+bulk_create also stamps auto_now/auto_now_add fields with the current time.
+Historical rows set their own timestamps through explicit_timestamps().
+
+The generator needs primary keys back from bulk_create (PostgreSQL, SQLite
+3.35+, MariaDB 10.5+).
+"""
+import contextlib
+import random
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+from accounts.models import Organization, OrganizationRelationship, User
+from .models import Buyer, Location, Product, Inventory, InventoryMovement, Order, OrderItem
+from .rollups import rebuild_rollups
+from .search import rebuild_index
+from .sequences import allocate_sequence_values
+
+# Share of organizations per type; the rest are buyers
+SUPPLIER_SHARE = 0.3
+BOTH_SHARE = 0.1
+
+RELATIONSHIP_STATUSES = (('accepted', 0.85), ('pending', 0.1), ('rejected', 0.05))
+ORDER_STATUSES = (('delivered', 0.55), ('completed', 0.25), ('shipped', 0.08), ('processing', 0.05), ('canceled', 0.07))
+# Movement types with the sign of their quantity change (adjustments go either way)
+MOVEMENT_TYPES = (('sale', -1, 0.45), ('purchase', 1, 0.2), ('addition', 1, 0.15), ('removal', -1, 0.1), ('adjustment', 0, 0.1))
+
+
+@contextlib.contextmanager
+def explicit_timestamps(*fields):
+    """
+    Lets bulk_create keep the values set on auto_now/auto_now_add fields (it
+    overwrites them with the current time otherwise). Only for offline tools:
+    the fields are changed for the whole process while the block runs.
+    """
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    try:
+        for field in fields:
+            field.auto_now = field.auto_now_add = False
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class BulkWriter:
+    """Collects unsaved objects per model and bulk_creates them batch_size at a time."""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.pending = {}
+        self.counts = {}
+
+    def add(self, obj):
+        model = type(obj)
+        rows = self.pending.setdefault(model, [])
+        rows.append(obj)
+        if len(rows) >= self.batch_size:
+            self.flush(model)
+
+    def create(self, objects):
+        """Inserts objects (of one model) right away and returns them with their primary keys."""
+        objects = list(objects)
+        if objects:
+            model = type(objects[0])
+            model.objects.bulk_create(objects, batch_size=self.batch_size)
+            self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(objects)
+        return objects
+
+    def flush(self, model=None):
+        for pending_model in [model] if model else list(self.pending):
+            rows = self.pending.pop(pending_model, [])
+            self.create(rows)
+
+
+def _pick(rng, choices):
+    """One of the choices, whose last element is its weight."""
+    return rng.choices(choices, [choice[-1] for choice in choices])[0]
+
+
+def _history(rng, now, days, count):
+    """count ascending datetimes within the last days days."""
+    return sorted(now - timezone.timedelta(seconds=rng.randint(0, days * 86400)) for _ in range(count))
+
+
+def _movements(rng, inventory, timestamps):
+    """A movement history for the inventory at the given times that ends at its current quantity, oldest first."""
+    movements = []
+    after = inventory.quantity
+    for timestamp in reversed(timestamps):
+        movement_type, sign, _ = _pick(rng, MOVEMENT_TYPES)
+        if sign == 0:
+            sign = rng.choice((-1, 1))
+        if sign > 0 and after < 1:
+            # Nothing to have been added: the stock before would be negative
+            movement_type, sign = 'sale', -1
+        change = rng.randint(1, after) if sign > 0 else -rng.randint(1, 20)
+        movements.append(InventoryMovement(
+            inventory_id=inventory.id,
+            movement_type=movement_type,
+            quantity_change=change,
+            quantity_after_movement=after,
+            organization_id=inventory.organization_id,
+            timestamp=timestamp,
+            note='Synthetic history'
+        ))
+        after -= change
+    movements.reverse()
+    return movements
+
+
+def generate_dataset(
+    organizations=100, products_per_supplier=200, locations_per_organization=3, suppliers_per_buyer=5,
+    orders_per_buyer=50, lines_per_order=5, movements_per_inventory=5, buyer_stock_items=50, days=90,
+    seed=0, prefix='Synthetic', password='password', batch_size=2000, build_search_index=True, log=print
+):
+    """
+    Creates the dataset described in the module docstring and returns {model
+    name: rows created}. Organization names start with prefix, which must not be
+    in use yet. log receives one progress line per step.
+    """
+    if not connection.features.can_return_rows_from_bulk_insert:
+        raise RuntimeError(f'{connection.vendor} does not return primary keys from bulk inserts; the generator needs them.')
+    if Organization.objects.filter(name__startswith=f'{prefix} ').exists():
+        raise ValueError(f"Organizations named '{prefix} ...' already exist; choose another prefix.")
+
+    rng = random.Random(seed)
+    now = timezone.now()
+    writer = BulkWriter(batch_size)
+    slug = prefix.lower().replace(' ', '-')
+
+    with explicit_timestamps(
+        Order._meta.get_field('order_date'), InventoryMovement._meta.get_field('timestamp')
+    ), transaction.atomic():
+        # Organizations, one admin each, and the buyer profiles
+        types = []
+        for index in range(organizations):
+            draw = rng.random()
+            types.append('supplier' if draw < SUPPLIER_SHARE else 'both' if draw < SUPPLIER_SHARE + BOTH_SHARE else 'buyer')
+        orgs = writer.create(
+            Organization(name=f'{prefix} {organization_type.title()} {index:06d}', organization_type=organization_type, active_status=True)
+            for index, organization_type in enumerate(types)
+        )
+        hashed_password = make_password(password) # Hashing is slow; all generated users share the one hash
+        users = writer.create(
+            User(
+                email=f'{slug}-{index:06d}@example.com', username=f'{slug}-{index:06d}', password=hashed_password,
+                first_name='Synthetic', last_name=f'Admin {index:06d}', organization=organization, role='admin'
+            ) for index, organization in enumerate(orgs)
+        )
+        admins = {user.organization_id: user for user in users}
+        sellers = [organization for organization in orgs if organization.organization_type in ('supplier', 'both')]
+        purchasers = [organization for organization in orgs if organization.organization_type in ('buyer', 'both')]
+        buyers = {}
+        for organization in purchasers:
+            code = allocate_sequence_values(organization, 'buyer')
+            buyers[organization.id] = Buyer(
+                user=admins[organization.id], organization=organization, first_name='Synthetic', last_name='Buyer',
+                email=admins[organization.id].email, name=organization.name, buyer_code=f'BUY-{organization.id}-{code:04d}'
+            )
+        writer.create(buyers.values())
+        log(f'{len(orgs)} organizations: {len(sellers)} selling, {len(purchasers)} buying.')
+
+        # Relationship graph: suppliers are picked by a skewed popularity, so a few serve most buyers
+        popularity = [1 / (rank + 1) ** 0.8 for rank in range(len(sellers))]
+        accepted = {}
+        relationships = []
+        for organization in purchasers:
+            wanted = min(len(sellers), max(1, round(rng.gauss(suppliers_per_buyer, suppliers_per_buyer / 3))))
+            chosen = {}
+            for _ in range(wanted * 4):
+                if len(chosen) >= wanted:
+                    break
+                supplier = rng.choices(sellers, popularity)[0]
+                if supplier.id != organization.id:
+                    chosen[supplier.id] = supplier
+            for supplier in chosen.values():
+                status = _pick(rng, RELATIONSHIP_STATUSES)[0]
+                relationships.append(OrganizationRelationship(
+                    buyer_organization=organization, supplier_organization=supplier, status=status,
+                    initiated_by=admins[organization.id]
+                ))
+                if status == 'accepted':
+                    accepted.setdefault(organization.id, []).append(supplier)
+        writer.create(relationships)
+
+        locations = {}
+        for organization in orgs:
+            locations[organization.id] = writer.create(
+                Location(name=f'Location {index + 1}', organization=organization) for index in range(locations_per_organization)
+            )
+        log(f'{len(relationships)} relationships, {len(orgs) * locations_per_organization} locations.')
+
+        # Catalogs with stock and movement histories, one supplier at a time
+        catalogs = {}
+        for supplier in sellers:
+            prices = [Decimal(rng.randint(200, 50000)) / 100 for _ in range(products_per_supplier)]
+            products = writer.create(
+                Product(
+                    name=f'{supplier.name} Product {index:06d}', sku=f'{slug}-{supplier.id}-{index:06d}', price=price,
+                    cost=(price * rng.randint(50, 75) / 100).quantize(Decimal('0.01')), organization=supplier
+                ) for index, price in enumerate(prices)
+            )
+            catalogs[supplier.id] = [(product.id, product.price) for product in products]
+
+            inventories = writer.create(
+                Inventory(
+                    product=product, location=rng.choice(locations[supplier.id]), organization=supplier,
+                    quantity=rng.randint(0, 500), min_stock_level=rng.randint(5, 20), max_stock_level=rng.randint(300, 1000)
+                ) for product in products
+            )
+            for inventory in inventories:
+                for movement in _movements(rng, inventory, _history(rng, now, days, movements_per_inventory)):
+                    writer.add(movement)
+        writer.flush()
+        log(f'{sum(len(catalog) for catalog in catalogs.values())} products with stock and movement histories.')
+
+        # Buyer stock and order histories, one buyer at a time
+        for organization in purchasers:
+            suppliers = accepted.get(organization.id, [])
+            if not suppliers:
+                continue
+            stocked = set()
+            for _ in range(buyer_stock_items):
+                product_id, _ = rng.choice(catalogs[rng.choice(suppliers).id])
+                stocked.add(product_id)
+            location = locations[organization.id][0]
+            inventories = writer.create(
+                Inventory(product_id=product_id, location=location, organization=organization, quantity=rng.randint(0, 100))
+                for product_id in stocked
+            )
+            for inventory in inventories:
+                for movement in _movements(rng, inventory, _history(rng, now, days, movements_per_inventory)):
+                    writer.add(movement)
+
+            # Orders go to one supplier each; numbers are reserved per supplier so later saves continue after them
+            orders = []
+            order_lines = []
+            for order_date in _history(rng, now, days, orders_per_buyer):
+                supplier = rng.choice(suppliers)
+                lines = rng.sample(catalogs[supplier.id], min(rng.randint(1, lines_per_order * 2 - 1), len(catalogs[supplier.id])))
+                quantities = [rng.randint(1, 10) for _ in lines]
+                status = _pick(rng, ORDER_STATUSES)[0]
+                orders.append(Order(
+                    organization=supplier, customer=buyers[organization.id], status=status, order_date=order_date,
+                    total_amount=sum(price * quantity for (_, price), quantity in zip(lines, quantities)),
+                    item_count=sum(quantities), payment_status='unpaid' if status == 'canceled' else 'paid',
+                    date_completed=order_date if status in ('completed', 'delivered') else None,
+                    created_by=admins[organization.id]
+                ))
+                order_lines.append((lines, quantities))
+            by_supplier = {}
+            for order in orders:
+                by_supplier.setdefault(order.organization_id, []).append(order)
+            for supplier_id, supplier_orders in by_supplier.items():
+                last = allocate_sequence_values(supplier_orders[0].organization, 'order', len(supplier_orders))
+                for value, order in enumerate(supplier_orders, start=last - len(supplier_orders) + 1):
+                    order.order_number = f'ORD-{supplier_id}-{value:06d}'
+            writer.create(orders)
+            for order, (lines, quantities) in zip(orders, order_lines):
+                for (product_id, price), quantity in zip(lines, quantities):
+                    writer.add(OrderItem(
+                        order_id=order.id, product_id=product_id, quantity=quantity, unit_price=price,
+                        subtotal=price * quantity, organization_id=order.organization_id
+                    ))
+        writer.flush()
+        log(f"{writer.counts.get('Order', 0)} orders with {writer.counts.get('OrderItem', 0)} lines.")
+
+        for supplier in sellers:
+            rebuild_rollups(supplier)
+        log('Sales rollups rebuilt.')
+
+    if build_search_index:
+        log(f'Search index rebuilt with {rebuild_index(batch_size=batch_size)} products.')
+    return writer.counts
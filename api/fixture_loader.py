@@ -0,0 +1,450 @@
+"""
+Streaming bulk loader for dumpdata-style JSON fixtures (the bulk_loaddata command).
+
+loaddata reads the whole file into memory and then saves every object on its
+own: an UPDATE, an INSERT when nothing was updated, and the pre_save/post_save
+signals. For dumps of millions of rows both the memory and the round trips add
+up. load_fixtures instead:
+
+1. Reads the files as a stream, one object at a time (iter_fixture_objects).
+   UTF-8 with or without a byte order mark and UTF-16 with one (what
+   `dumpdata > data.json` writes in Windows PowerShell) are recognized, and
+   .gz, .bz2 and .xz files are decompressed on the fly.
+2. Spools the records to one temporary JSON-lines file per model, because dumps
+   are not in dependency order.
+3. Loads the models in dependency order (models_in_dependency_order), each in
+   bulk_create batches. A row whose primary key already exists is overwritten,
+   as loaddata does. Like loaddata, everything runs in one transaction with the
+   foreign key checks done at the end.
+
+Memory is one batch plus the read buffer, whatever the size of the dump; the
+spool files take about as much disk as the dump itself.
+
+bulk_create skips save() and the signals. What those would have done:
+
+- Supplier codes, buyer codes and order numbers missing from the dump are
+  taken from the Sequence counters, one block of values per organization and
+  batch. The counters are first moved past the codes the dump brings, so new
+  codes and later saves continue after them. Codes present in the dump are
+  kept as they are.
+- Order.total_amount and item_count, kept by OrderItem.save, are recomputed
+  from the lines of orders whose stored totals do not match them (e.g. dumps
+  made before the columns existed), with one UPDATE.
+- auto_now/auto_now_add fields keep the dumped timestamps (see
+  api.datagen.explicit_timestamps); they are only set to now when missing.
+- The product search index, the sales rollups and the unread counters are
+  rebuilt afterwards for the models that feed them (rebuild=False skips this,
+  e.g. when several dumps are loaded in a row).
+
+Multi-table inheritance children cannot be bulk inserted and are saved one by
+one, as loaddata would.
+"""
+import bz2
+import codecs
+import gzip
+import json
+import lzma
+import os
+import re
+import tempfile
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.base import DeserializationError
+from django.db import connection, transaction
+from django.utils import timezone
+from .datagen import explicit_timestamps
+
+# Compressed fixtures by file extension, opened in binary mode
+OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+# Codes that save() generates when they are empty:
+# model label -> (field, Sequence kind, format with an organization, format without one)
+CODE_FORMATS = {
+    'api.supplier': ('supplier_code', 'supplier', 'SUP-{organization}-{value:04d}', 'SUP{value:04d}'),
+    'api.buyer': ('buyer_code', 'buyer', 'BUY-{organization}-{value:04d}', 'BUY{value:04d}'),
+    'api.order': ('order_number', 'order', 'ORD-{organization}-{value:06d}', None),
+}
+
+# Models whose rows feed derived data that save() or the signals keep up to date
+SEARCH_INDEX_MODELS = {'api.product', 'api.brand', 'api.category'}
+ROLLUP_MODELS = {'api.order', 'api.orderitem', 'api.product'}
+UNREAD_MODELS = {'api.notification', 'api.communication'}
+ORDER_TOTAL_MODELS = {'api.order', 'api.orderitem'}
+ANALYTICS_MODELS = {'api.product', 'api.inventory', 'api.inventorymovement', 'api.order', 'api.orderitem'}
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def open_fixture(path):
+    """The fixture file as a binary stream, decompressed if its extension says so."""
+    return OPENERS.get(os.path.splitext(path)[1].lower(), open)(path, 'rb')
+
+
+def _detect_encoding(head):
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        # The utf-16 codec reads the byte order from the mark and drops it
+        return 'utf-16'
+    return 'utf-8'
+
+
+class _ArrayReader:
+    """Decodes the objects of a top-level JSON array from a binary stream, keeping only a window of the text."""
+
+    def __init__(self, stream, encoding=None, chunk_size=1 << 20, max_object_size=64 << 20):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.max_object_size = max_object_size
+        head = stream.read(4)
+        self.decoder = codecs.getincrementaldecoder(encoding or _detect_encoding(head))()
+        self.buffer = self.decoder.decode(head)
+        self.position = 0
+        self.eof = False
+        self.count = 0
+        self.raw_decode = json.JSONDecoder().raw_decode
+
+    def fill(self):
+        """Appends the next chunk to the window (dropping what was consumed); False at the end of the stream."""
+        if self.eof:
+            return False
+        data = self.stream.read(self.chunk_size)
+        self.eof = not data
+        self.buffer = self.buffer[self.position:] + self.decoder.decode(data, final=self.eof)
+        self.position = 0
+        return True
+
+    def skip_whitespace(self):
+        """Moves to the next non-whitespace character; False if there is none."""
+        while True:
+            self.position = _WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return True
+            if not self.fill():
+                return False
+
+    def expect(self, characters):
+        if not self.skip_whitespace():
+            raise ValueError(f'Fixture ends unexpectedly after {self.count} objects.')
+        character = self.buffer[self.position]
+        if character not in characters:
+            raise ValueError(f"Expected one of {characters!r} after {self.count} objects, found {character!r}.")
+        self.position += 1
+        return character
+
+    def value(self):
+        if not self.skip_whitespace():
+            raise ValueError(f'Fixture ends unexpectedly after {self.count} objects.')
+        while True:
+            try:
+                value, end = self.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as e:
+                # Usually the object continues in the next chunk
+                if len(self.buffer) - self.position > self.max_object_size or not self.fill():
+                    raise ValueError(f'Invalid JSON in object {self.count + 1} of the fixture: {e.msg}.') from e
+                continue
+            self.position = end
+            self.count += 1
+            return value
+
+    def __iter__(self):
+        self.expect('[')
+        if self.skip_whitespace() and self.buffer[self.position] == ']':
+            self.position += 1
+        else:
+            while True:
+                yield self.value()
+                if self.expect(',]') == ']':
+                    break
+        if self.skip_whitespace():
+            raise ValueError(f'Unexpected data after the fixture array ({self.count} objects).')
+
+
+def iter_fixture_objects(stream, encoding=None, chunk_size=1 << 20):
+    """
+    Yields the objects of a dumpdata JSON fixture (a top-level array) read from
+    a binary stream, one at a time. Raises ValueError for malformed JSON.
+    """
+    return iter(_ArrayReader(stream, encoding, chunk_size))
+
+
+def models_in_dependency_order(models):
+    """
+    The models sorted so that each comes after the models its foreign keys,
+    one-to-one and many-to-many fields point to. Cycles (and self-references)
+    are broken in label order; the foreign keys are only checked at the end.
+    """
+    remaining = sorted(models, key=lambda model: model._meta.label_lower)
+    dependencies = {}
+    for model in remaining:
+        related = {
+            field.related_model for field in model._meta.get_fields()
+            if field.concrete and (field.many_to_one or field.one_to_one or field.many_to_many) and field.related_model
+        }
+        dependencies[model] = related & set(remaining) - {model}
+
+    ordered = []
+    while remaining:
+        ready = next((model for model in remaining if not dependencies[model] - set(ordered)), remaining[0])
+        ordered.append(ready)
+        remaining.remove(ready)
+    return ordered
+
+
+def _code_value(code, organization_id, templates):
+    """The counter value in a code of the given formats (SUP-5-0042 -> 42), or None if the code has another form."""
+    template = templates[0] if organization_id is not None else templates[1]
+    if not code or template is None:
+        return None
+    prefix = template.split('{value', 1)[0].format(organization=organization_id)
+    number = code[len(prefix):] if code.startswith(prefix) else ''
+    return int(number) if number.isdigit() else None
+
+
+def _advance_sequences(values):
+    """Moves the (organization id, kind) counters up to the given values; counters already past them are kept."""
+    from .models import Sequence
+    for (organization_id, kind), value in values.items():
+        counters = Sequence.objects.filter(organization_id=organization_id, kind=kind)
+        if not counters.filter(last_value__lt=value).update(last_value=value) and not counters.exists():
+            Sequence.objects.create(organization_id=organization_id, kind=kind, last_value=value)
+
+
+class FixtureLoader:
+    def __init__(self, batch_size=1000, ignorenonexistent=False, skip_unknown_models=False, exclude=(), encoding=None, log=None):
+        self.batch_size = batch_size
+        self.ignorenonexistent = ignorenonexistent
+        self.skip_unknown_models = skip_unknown_models
+        self.exclude = {label.lower() for label in exclude}
+        self.encoding = encoding
+        self.log = log or (lambda message: None)
+        self.spools = {}
+        self.loaded = {}
+        self.skipped = {}
+        self.generated_codes = 0
+        self.repaired_order_totals = 0
+        # (organization id, kind) -> highest counter value in the codes of the dump
+        self.code_values = {}
+        self.deferred = []
+
+    def is_excluded(self, model):
+        return model._meta.app_label in self.exclude or model._meta.label_lower in self.exclude
+
+    def spool(self, path, directory):
+        """Sorts the records of one fixture file into the per-model spool files."""
+        with open_fixture(path) as stream:
+            for record in iter_fixture_objects(stream, self.encoding):
+                label = record.get('model') if isinstance(record, dict) else None
+                if not isinstance(label, str):
+                    raise DeserializationError(f'{path}: every fixture object needs a "model" name.')
+                try:
+                    model = apps.get_model(label)
+                except (LookupError, ValueError):
+                    if not self.skip_unknown_models:
+                        raise DeserializationError(f'{path}: unknown model {label!r}; use --skip-unknown-models to leave it out.')
+                    model = None
+                if model is None or self.is_excluded(model):
+                    self.skipped[label.lower()] = self.skipped.get(label.lower(), 0) + 1
+                    continue
+
+                label = model._meta.label_lower
+                if label in CODE_FORMATS:
+                    self.note_code(label, record.get('fields') or {})
+                spool = self.spools.get(model)
+                if spool is None:
+                    spool = self.spools[model] = open(os.path.join(directory, f'{label}.jsonl'), 'w+', encoding='utf-8')
+                spool.write(json.dumps(record, separators=(',', ':')))
+                spool.write('\n')
+
+    def note_code(self, label, fields):
+        field_name, kind, *templates = CODE_FORMATS[label]
+        organization_id = fields.get('organization')
+        if isinstance(organization_id, list):
+            # A natural key; such codes are left to the counters as they are
+            return
+        value = _code_value(fields.get(field_name), organization_id, templates)
+        key = (organization_id, kind)
+        if value is not None and value > self.code_values.get(key, 0):
+            self.code_values[key] = value
+
+    def records(self, model):
+        spool = self.spools[model]
+        spool.seek(0)
+        for line in spool:
+            yield json.loads(line)
+
+    def load_model(self, model):
+        label = model._meta.label_lower
+        if label in CODE_FORMATS:
+            _advance_sequences(self.code_values)
+        batch = []
+        for deserialized in serializers.deserialize(
+            'python', self.records(model), ignorenonexistent=self.ignorenonexistent, handle_forward_references=True
+        ):
+            batch.append(deserialized)
+            if len(batch) >= self.batch_size:
+                self.insert(model, batch)
+                batch = []
+        if batch:
+            self.insert(model, batch)
+        self.log(f'{label}: {self.loaded.get(label, 0)} rows')
+
+    def insert(self, model, batch):
+        label = model._meta.label_lower
+        objects = [deserialized.object for deserialized in batch]
+        if label in CODE_FORMATS:
+            self.fill_codes(label, objects)
+
+        if model._meta.parents:
+            # bulk_create cannot insert multi-table inheritance children
+            for deserialized in batch:
+                deserialized.save()
+        else:
+            timestamp_fields = [
+                field for field in model._meta.concrete_fields if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+            ]
+            now = timezone.now()
+            for obj in objects:
+                for field in timestamp_fields:
+                    if getattr(obj, field.attname) is None:
+                        setattr(obj, field.attname, now)
+            with explicit_timestamps(*timestamp_fields):
+                model._default_manager.bulk_create(objects, **self.conflict_options(model))
+            self.insert_many_to_many(model, batch)
+
+        self.deferred.extend(deserialized for deserialized in batch if deserialized.deferred_fields)
+        self.loaded[label] = self.loaded.get(label, 0) + len(objects)
+
+    @staticmethod
+    def conflict_options(model):
+        """bulk_create arguments that overwrite rows whose primary key exists, where the database supports it."""
+        update_fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+        if not update_fields:
+            return {'ignore_conflicts': True}
+        if connection.features.supports_update_conflicts_with_target:
+            return {'update_conflicts': True, 'unique_fields': [model._meta.pk.name], 'update_fields': update_fields}
+        if connection.features.supports_update_conflicts:
+            return {'update_conflicts': True, 'update_fields': update_fields}
+        return {}
+
+    def insert_many_to_many(self, model, batch):
+        """Replaces the many-to-many rows of the batch's objects with the dumped ones, as DeserializedObject.save does."""
+        for field in model._meta.many_to_many:
+            through = field.remote_field.through
+            if not through._meta.auto_created:
+                # Explicit through models are dumped as models of their own
+                continue
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name()
+            dumped = [
+                deserialized for deserialized in batch
+                if isinstance(deserialized.m2m_data.get(field.name), list)
+            ]
+            if not dumped:
+                continue
+            through._default_manager.filter(**{f'{source}__in': [d.object.pk for d in dumped]}).delete()
+            through._default_manager.bulk_create(
+                [
+                    through(**{f'{source}_id': deserialized.object.pk, f'{target}_id': value})
+                    for deserialized in dumped for value in deserialized.m2m_data[field.name]
+                ],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+
+    def fill_codes(self, label, objects):
+        """Gives objects without a code the next values of their organization's counter, one block per organization."""
+        from accounts.models import Organization
+        from .sequences import allocate_sequence_values
+        field_name, kind, *templates = CODE_FORMATS[label]
+        missing = {}
+        for obj in objects:
+            organization_id = obj.organization_id
+            if not getattr(obj, field_name) and templates[organization_id is None] is not None:
+                missing.setdefault(organization_id, []).append(obj)
+
+        for organization_id, group in missing.items():
+            # The allocation only needs the organization's id
+            organization = Organization(id=organization_id) if organization_id is not None else None
+            last = allocate_sequence_values(organization, kind, len(group))
+            template = templates[organization_id is None]
+            for value, obj in enumerate(group, start=last - len(group) + 1):
+                setattr(obj, field_name, template.format(organization=organization_id, value=value))
+            self.generated_codes += len(group)
+            self.code_values[(organization_id, kind)] = max(self.code_values.get((organization_id, kind), 0), last)
+
+    def load(self, paths):
+        with tempfile.TemporaryDirectory(prefix='bulk_loaddata') as directory:
+            try:
+                for path in paths:
+                    self.spool(path, directory)
+                    self.log(f'Read {path}')
+
+                models = models_in_dependency_order(self.spools)
+                with transaction.atomic():
+                    with connection.constraint_checks_disabled():
+                        for model in models:
+                            self.load_model(model)
+                        for deserialized in self.deferred:
+                            deserialized.save_deferred_fields()
+                        # Sequence rows in the dump may have been loaded after the codes
+                        _advance_sequences(self.code_values)
+                        if {model._meta.label_lower for model in models} & ORDER_TOTAL_MODELS:
+                            from .cart import repair_order_totals
+                            self.repaired_order_totals = repair_order_totals()
+                            self.log(f'Order totals: {self.repaired_order_totals} repaired')
+                    # Like loaddata, the foreign keys are checked once everything is in
+                    table_names = [model._meta.db_table for model in models]
+                    table_names += [field.remote_field.through._meta.db_table for model in models for field in model._meta.many_to_many]
+                    connection.check_constraints(table_names=table_names)
+                    self.reset_primary_key_sequences(models)
+            finally:
+                for spool in self.spools.values():
+                    spool.close()
+
+    @staticmethod
+    def reset_primary_key_sequences(models):
+        """Explicit primary keys do not move PostgreSQL's id sequences; set them past the loaded rows."""
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+    def rebuild(self):
+        """Recomputes the data that save() and the signals keep for the loaded models."""
+        loaded = {label for label, count in self.loaded.items() if count}
+        if loaded & SEARCH_INDEX_MODELS:
+            from .search import rebuild_index
+            self.log(f'Search index: {rebuild_index()} products')
+        if loaded & ROLLUP_MODELS:
+            from .rollups import rebuild_rollups
+            self.log(f'Sales rollups: {rebuild_rollups()} rows')
+        if loaded & UNREAD_MODELS:
+            from .unread import reconcile_unread_counters
+            self.log(f'Unread counters: {len(reconcile_unread_counters(fix=True))} corrected')
+        if loaded & ANALYTICS_MODELS:
+            from .analytics_cache import get_analytics_cache
+            get_analytics_cache().clear()
+
+
+def load_fixtures(paths, batch_size=1000, ignorenonexistent=False, skip_unknown_models=False, exclude=(), encoding=None, rebuild=True, log=None):
+    """
+    Loads dumpdata JSON fixtures with bulk inserts (see the module docstring).
+    Returns {'loaded': {model label: rows}, 'skipped': {model label: records},
+    'generated_codes': count, 'repaired_order_totals': count}. Raises ValueError for malformed JSON and
+    DeserializationError for unknown models or fields.
+    """
+    if batch_size <= 0:
+        raise ValueError('batch_size must be positive.')
+    loader = FixtureLoader(batch_size, ignorenonexistent, skip_unknown_models, exclude, encoding, log)
+    loader.load(paths)
+    if rebuild:
+        loader.rebuild()
+    return {
+        'loaded': loader.loaded,
+        'skipped': loader.skipped,
+        'generated_codes': loader.generated_codes,
+        'repaired_order_totals': loader.repaired_order_totals,
+    }
@@ -0,0 +1,78 @@
+from collections import defaultdict
+from django.db.models import Sum, F
+from accounts.relationships import get_accepted_supplier_ids
+from .models import ProductImage, ProductSize, OrderItem, Inventory
+
+
+class ProductBatchLoader:
+    """
+    Loads the related data the product serializers need for a whole list of
+    products in a fixed number of queries (images, sizes, completed order
+    quantities, available stock and accepted supplier relationships).
+    """
+
+    def __init__(self, products, organization=None, request=None):
+        self.organization = organization
+        self.product_ids = {product.id for product in products}
+
+        self.images = defaultdict(list)
+        self.sizes = defaultdict(list)
+        self.completed_quantities = {}
+        self.stock = {}
+        self.accepted_supplier_ids = frozenset()
+
+        if not self.product_ids:
+            return
+
+        for image in ProductImage.objects.filter(product_id__in=self.product_ids).order_by('id'):
+            self.images[image.product_id].append(image)
+
+        for product_size in ProductSize.objects.filter(product_id__in=self.product_ids).select_related('size').order_by('id'):
+            self.sizes[product_size.product_id].append(product_size)
+
+        # Same rule as Product.get_completed: quantities in delivered orders
+        completed = OrderItem.objects.filter(
+            product_id__in=self.product_ids,
+            order__status='delivered'
+        ).values('product_id').annotate(total=Sum('quantity'))
+        self.completed_quantities = {row['product_id']: row['total'] or 0 for row in completed}
+
+        # Stock held by the organization that owns each product
+        stock = Inventory.objects.filter(
+            product_id__in=self.product_ids,
+            organization_id=F('product__organization_id')
+        ).values('product_id').annotate(total=Sum('quantity'))
+        self.stock = {row['product_id']: row['total'] or 0 for row in stock}
+
+        if organization and organization.organization_type in ['buyer', 'both']:
+            self.accepted_supplier_ids = get_accepted_supplier_ids(request, organization)
+
+    def __contains__(self, product):
+        return product.id in self.product_ids
+
+    def get_images(self, product):
+        return self.images.get(product.id, [])
+
+    def get_sizes(self, product):
+        return self.sizes.get(product.id, [])
+
+    def get_completed(self, product):
+        return self.completed_quantities.get(product.id, 0)
+
+    def is_available(self, product, include_own=True):
+        """
+        Returns True if the product has stock that the current organization can see.
+        Own products are checked against the organization's own inventory (when
+        include_own is set), supplier products only through an accepted relationship.
+        """
+        organization = self.organization
+        if not organization:
+            return False
+
+        if include_own and product.organization_id == organization.id:
+            return self.stock.get(product.id, 0) > 0
+
+        if organization.organization_type in ['buyer', 'both'] and product.organization_id in self.accepted_supplier_ids:
+            return self.stock.get(product.id, 0) > 0
+
+        return False
@@ -0,0 +1,148 @@
+"""
+Outbound email queue.
+
+Views call queue_email (or the send_* helpers in api.views, which render the
+template and queue it); the row is committed with the request's transaction and
+nothing talks to SMTP during the request. The send_queued_emails management
+command delivers due emails in batches over a single connection and retries
+failures with exponential backoff.
+"""
+import datetime
+import logging
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from accounts.models import Organization
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def get_outbound_email_setting(name, default):
+    return getattr(settings, f'OUTBOUND_EMAIL_{name}', default)
+
+
+def queue_email(subject, body, to, from_email=None, content_subtype='plain', related_object=None, organization=None):
+    """Stores an email in the outbox. Returns the OutboundEmail."""
+    if isinstance(to, str):
+        to = [to]
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        content_subtype=content_subtype,
+        from_email=from_email,
+        to=list(to),
+        related_object_type=related_object._meta.model_name if related_object is not None else None,
+        related_object_id=related_object.pk if related_object is not None else None,
+        organization=organization
+    )
+
+
+def get_retry_delay(attempts):
+    """Exponential backoff: base, 2 x base, 4 x base ... capped at OUTBOUND_EMAIL_MAX_RETRY_DELAY seconds."""
+    base = get_outbound_email_setting('RETRY_DELAY', 60)
+    cap = get_outbound_email_setting('MAX_RETRY_DELAY', 3600)
+    return datetime.timedelta(seconds=min(base * (2 ** max(attempts - 1, 0)), cap))
+
+
+def claim_due_emails(batch_size):
+    """
+    Marks up to batch_size due emails as 'sending' and returns them. The claim is a
+    conditional UPDATE stamped with this worker's claim time, so concurrent workers
+    never send the same email twice. Claims older than OUTBOUND_EMAIL_LOCK_TIMEOUT
+    seconds (a worker that died mid-batch) are picked up again.
+    """
+    now = timezone.now()
+    stale_before = now - datetime.timedelta(seconds=get_outbound_email_setting('LOCK_TIMEOUT', 600))
+    claimable = (
+        Q(status='pending', next_attempt_at__lte=now) |
+        Q(status='sending', locked_at__lt=stale_before)
+    )
+    candidate_ids = list(OutboundEmail.objects.filter(claimable).order_by('id').values_list('id', flat=True)[:batch_size])
+    if not candidate_ids:
+        return []
+
+    OutboundEmail.objects.filter(claimable, id__in=candidate_ids).update(status='sending', locked_at=now)
+    return list(OutboundEmail.objects.filter(id__in=candidate_ids, status='sending', locked_at=now).order_by('id'))
+
+
+def build_message(email, connection):
+    message = EmailMessage(
+        email.subject,
+        email.body,
+        email.from_email or settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER,
+        email.to,
+        connection=connection
+    )
+    message.content_subtype = email.content_subtype
+    return message
+
+
+def mark_sent(email):
+    email.status = 'sent'
+    email.sent_at = timezone.now()
+    email.attempts += 1
+    email.locked_at = None
+    email.last_error = None
+    email.save(update_fields=['status', 'sent_at', 'attempts', 'locked_at', 'last_error'])
+
+    # Organizations track whether their activation email went out
+    if email.related_object_type == 'organization' and email.related_object_id:
+        Organization.objects.filter(id=email.related_object_id).update(email_sent=True)
+
+
+def mark_failed(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    email.locked_at = None
+    if email.attempts >= get_outbound_email_setting('MAX_ATTEMPTS', 5):
+        email.status = 'failed'
+        logger.error('Giving up on email after %d attempts: %s', email.attempts, error, extra={'email_id': email.id})
+    else:
+        email.status = 'pending'
+        email.next_attempt_at = timezone.now() + get_retry_delay(email.attempts)
+        logger.warning(
+            'Email failed (attempt %d), retrying at %s: %s', email.attempts, email.next_attempt_at, error,
+            extra={'email_id': email.id}
+        )
+    email.save(update_fields=['status', 'attempts', 'last_error', 'locked_at', 'next_attempt_at'])
+
+
+def send_queued_emails(batch_size=None, connection=None):
+    """
+    Sends one batch of due emails over a single connection. Returns a
+    (sent, failed) tuple of counts.
+    """
+    batch_size = batch_size or get_outbound_email_setting('BATCH_SIZE', 50)
+    with transaction.atomic():
+        emails = claim_due_emails(batch_size)
+    if not emails:
+        return 0, 0
+
+    connection = connection or get_connection(fail_silently=False)
+    sent = failed = 0
+    try:
+        connection.open()
+    except Exception as e:
+        # Could not reach the server at all; the whole batch goes back to the queue
+        for email in emails:
+            mark_failed(email, e)
+        return 0, len(emails)
+
+    try:
+        for email in emails:
+            try:
+                connection.send_messages([build_message(email, connection)])
+            except Exception as e:
+                mark_failed(email, e)
+                failed += 1
+            else:
+                mark_sent(email)
+                sent += 1
+    finally:
+        connection.close()
+
+    logger.info('Outbound email batch done', extra={'sent': sent, 'failed': failed})
+    return sent, failed
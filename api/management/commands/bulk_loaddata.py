@@ -0,0 +1,58 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.base import DeserializationError
+from django.db import DatabaseError
+from api.fixture_loader import load_fixtures
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads dumpdata JSON fixtures (plain or .gz/.bz2/.xz) with bulk inserts in dependency order, reading them as a '
+        'stream so large dumps load in constant memory. See api.fixture_loader.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', nargs='+', help='Paths of the fixture files.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT (default: 1000).')
+        parser.add_argument(
+            '-i', '--ignorenonexistent', action='store_true',
+            help='Ignore fields in the fixtures that the models do not have (anymore).'
+        )
+        parser.add_argument('--skip-unknown-models', action='store_true', help='Skip objects of models that do not exist instead of failing.')
+        parser.add_argument(
+            '-e', '--exclude', action='append', default=[],
+            help='An app_label or app_label.ModelName to leave out (can be given several times).'
+        )
+        parser.add_argument('--encoding', help='Encoding of the fixtures (default: from the byte order mark, else UTF-8).')
+        parser.add_argument(
+            '--skip-rebuild', action='store_true',
+            help='Do not rebuild the search index, sales rollups and unread counters afterwards.'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            result = load_fixtures(
+                options['fixtures'],
+                batch_size=options['batch_size'],
+                ignorenonexistent=options['ignorenonexistent'],
+                skip_unknown_models=options['skip_unknown_models'],
+                exclude=options['exclude'],
+                encoding=options['encoding'],
+                rebuild=not options['skip_rebuild'],
+                log=self.stdout.write if options['verbosity'] >= 2 else None,
+            )
+        except (OSError, ValueError, DeserializationError, DatabaseError) as e:
+            raise CommandError(f'Could not load the fixtures: {e}')
+
+        elapsed = time.perf_counter() - started
+        for label, count in sorted(result['skipped'].items()):
+            self.stdout.write(self.style.WARNING(f'Skipped {count} objects of {label}.'))
+        if result['generated_codes']:
+            self.stdout.write(f"Generated {result['generated_codes']} missing supplier codes, buyer codes and order numbers.")
+        if result['repaired_order_totals']:
+            self.stdout.write(f"Recomputed the totals of {result['repaired_order_totals']} orders from their lines.")
+        total = sum(result['loaded'].values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Installed {total} objects of {len(result['loaded'])} models in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)."
+        ))
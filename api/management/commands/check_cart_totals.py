@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.cart import drifted_order_totals, repair_order_totals
+from api.models import Order
+
+
+class Command(BaseCommand):
+    help = "Compares each order's stored total_amount and item_count with the sum of its items, and optionally repairs them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, default=None, help='Only check orders of this organization ID.')
+        parser.add_argument('--fix', action='store_true', help='Overwrite drifted totals with the values computed from the items.')
+
+    def handle(self, *args, **options):
+        # One query: the totals as stored next to the totals computed from the items, drifted orders only
+        orders = Order._base_manager.all()
+        if options['organization'] is not None:
+            orders = orders.filter(organization_id=options['organization'])
+
+        drifted = list(drifted_order_totals(orders).values_list('id', 'total_amount', 'line_total', 'item_count', 'line_quantity'))
+        for order_id, total_amount, line_total, item_count, line_quantity in drifted:
+            self.stdout.write(
+                f'Order {order_id}: total_amount {total_amount} (items: {line_total}), item_count {item_count} (items: {line_quantity})'
+            )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All order totals match their items.'))
+            return
+        if not options['fix']:
+            raise CommandError(f'{len(drifted)} orders have drifted totals; run with --fix to repair them.')
+
+        repair_order_totals(orders)
+        self.stdout.write(self.style.SUCCESS(f'Repaired the totals of {len(drifted)} orders.'))
@@ -0,0 +1,58 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api.datagen import generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a synthetic multi-tenant dataset (organizations, relationships, products, locations, inventory, '
+        'movements and orders) with bulk inserts, for benchmarking. See api.datagen.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organizations', type=int, default=100, help='Organizations to create (default: 100); about 40%% sell.')
+        parser.add_argument('--products-per-supplier', type=int, default=200, help='Catalog size of each selling organization (default: 200).')
+        parser.add_argument('--locations', type=int, default=3, help='Locations per organization (default: 3).')
+        parser.add_argument('--suppliers-per-buyer', type=int, default=5, help='Average supplier relationships per buyer (default: 5).')
+        parser.add_argument('--orders-per-buyer', type=int, default=50, help='Order history length of each buyer (default: 50).')
+        parser.add_argument('--lines-per-order', type=int, default=5, help='Average lines per order (default: 5).')
+        parser.add_argument('--movements-per-inventory', type=int, default=5, help='Movement history length of each inventory item (default: 5).')
+        parser.add_argument('--buyer-stock-items', type=int, default=50, help='Products each buyer keeps in stock (default: 50).')
+        parser.add_argument('--days', type=int, default=90, help='Length of the order and movement history in days (default: 90).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same dataset.')
+        parser.add_argument('--prefix', default='Synthetic', help="Name prefix of the generated organizations (default: 'Synthetic').")
+        parser.add_argument('--password', default='password', help="Password of the generated users (default: 'password').")
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT (default: 2000).')
+        parser.add_argument('--skip-search-index', action='store_true', help='Do not rebuild the product search index afterwards.')
+
+    def handle(self, *args, **options):
+        counts = ('organizations', 'products_per_supplier', 'locations', 'suppliers_per_buyer', 'lines_per_order', 'days', 'batch_size')
+        if any(options[name] <= 0 for name in counts):
+            raise CommandError('Sizes, --days and --batch-size must be positive.')
+
+        started = time.perf_counter()
+        try:
+            created = generate_dataset(
+                organizations=options['organizations'],
+                products_per_supplier=options['products_per_supplier'],
+                locations_per_organization=options['locations'],
+                suppliers_per_buyer=options['suppliers_per_buyer'],
+                orders_per_buyer=options['orders_per_buyer'],
+                lines_per_order=options['lines_per_order'],
+                movements_per_inventory=options['movements_per_inventory'],
+                buyer_stock_items=options['buyer_stock_items'],
+                days=options['days'],
+                seed=options['seed'],
+                prefix=options['prefix'],
+                password=options['password'],
+                batch_size=options['batch_size'],
+                build_search_index=not options['skip_search_index'],
+                log=self.stdout.write,
+            )
+        except (ValueError, RuntimeError) as e:
+            raise CommandError(str(e))
+
+        elapsed = time.perf_counter() - started
+        total = sum(created.values())
+        self.stdout.write(', '.join(f'{count} {name}' for name, count in created.items()))
+        self.stdout.write(self.style.SUCCESS(f'Created {total} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s).'))
@@ -0,0 +1,50 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Sends concurrent GET requests to a running server and reports throughput and latency percentiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Full URL to request, e.g. http://127.0.0.1:8000/api/async/products/')
+        parser.add_argument('--token', default=None, help='JWT access token, sent as "Authorization: JWT <token>".')
+        parser.add_argument('--requests', type=int, default=500, help='Total number of requests (default: 500).')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once (default: 20).')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request counts as failed.')
+
+    def handle(self, *args, **options):
+        if options['requests'] <= 0 or options['concurrency'] <= 0:
+            raise CommandError('--requests and --concurrency must be positive.')
+
+        headers = {'Authorization': f"JWT {options['token']}"} if options['token'] else {}
+        session = requests.Session()
+        session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=options['concurrency']))
+        session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=options['concurrency']))
+
+        def fetch(_):
+            started = time.perf_counter()
+            try:
+                response = session.get(options['url'], headers=headers, timeout=options['timeout'])
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(fetch, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency * 1000 for latency, _ in results)
+        failed = sum(1 for _, ok in results if not ok)
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+        self.stdout.write(
+            f"{len(results)} requests, concurrency {options['concurrency']}: {len(results) / elapsed:.1f} req/s, "
+            f"p50 {statistics.median(latencies):.1f} ms, p95 {percentile(0.95):.1f} ms, p99 {percentile(0.99):.1f} ms, "
+            f"max {latencies[-1]:.1f} ms"
+        )
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} requests failed (connection error or HTTP status >= 400).'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import Organization
+from api.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily sales rollup used by the analytics endpoints from completed and delivered orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, default=None, help='Only rebuild the rollup for this organization ID.')
+
+    def handle(self, *args, **options):
+        organization = None
+        if options['organization'] is not None:
+            try:
+                organization = Organization._base_manager.get(pk=options['organization'])
+            except Organization.DoesNotExist:
+                raise CommandError(f"Organization {options['organization']} does not exist.")
+
+        count = rebuild_rollups(organization)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} product-day rollup rows.'))
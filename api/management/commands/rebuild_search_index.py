@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.search import get_search_backend, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product full-text search index from the Product table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of products read per query.')
+
+    def handle(self, *args, **options):
+        if get_search_backend() is None:
+            self.stdout.write(self.style.WARNING('The current database has no full-text search index. Nothing to do.'))
+            return
+
+        count = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products.'))
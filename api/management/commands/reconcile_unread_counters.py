@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from api.unread import reconcile_unread_counters
+
+
+class Command(BaseCommand):
+    help = 'Compares the unread notification and communication counters with the unread rows, and optionally repairs them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report counters that are off.')
+
+    def handle(self, *args, **options):
+        drifted = reconcile_unread_counters(fix=not options['dry_run'])
+        for kind, user_id, stored, actual in drifted:
+            self.stdout.write(f'User {user_id} {kind}s: counter {stored}, unread rows {actual}')
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All unread counters match.'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(drifted)} counters are off; run without --dry-run to repair them.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {len(drifted)} counters.'))
@@ -0,0 +1,63 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api.benchmark_suite import ENDPOINTS, compare_results, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Times the key API endpoints against a dataset made by generate_dataset and writes the results as JSON. '
+        'With --compare, reports the change against an earlier result file. See api.benchmark_suite.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='Synthetic', help="Name prefix of the generated organizations (default: 'Synthetic').")
+        parser.add_argument('--endpoint', action='append', choices=list(ENDPOINTS), help='Endpoint to run; repeat for several (default: all).')
+        parser.add_argument('--runs', type=int, default=20, help='Timed calls per endpoint (default: 20).')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed calls per endpoint first (default: 2).')
+        parser.add_argument('--checkout-lines', type=int, default=5, help='Cart lines for process-order (default: 5).')
+        parser.add_argument('--label', default=None, help='Free text stored with the results, e.g. a commit hash.')
+        parser.add_argument('--output', default=None, help='File to write the JSON results to (default: stdout).')
+        parser.add_argument('--compare', default=None, help='Earlier result file to compare the p50 latencies with.')
+        parser.add_argument('--max-regression', type=float, default=None, help='With --compare, fail if a p50 got slower by more than this many percent.')
+
+    def handle(self, *args, **options):
+        if options['runs'] <= 0 or options['warmup'] < 0 or options['checkout_lines'] <= 0:
+            raise CommandError('--runs and --checkout-lines must be positive and --warmup not negative.')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        try:
+            results = run_benchmarks(
+                prefix=options['prefix'], endpoints=options['endpoint'], runs=options['runs'],
+                warmup=options['warmup'], checkout_lines=options['checkout_lines'], label=options['label']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        document = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(document + '\n')
+            for name, result in results['results'].items():
+                self.stdout.write(f"{name}: p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, {result['queries']} queries")
+        else:
+            self.stdout.write(document)
+
+        if baseline is None:
+            return
+        # Without --output stdout holds the JSON document, so the comparison goes to stderr
+        report = self.stdout if options['output'] else self.stderr
+        regressions = []
+        for name, before, after, change in compare_results(baseline, results):
+            line = f'{name}: p50 {before} ms -> {after} ms ({change:+.1f}%)'
+            if options['max_regression'] is not None and change > options['max_regression']:
+                regressions.append(name)
+                line = self.style.ERROR(line)
+            report.write(line)
+        if regressions:
+            raise CommandError(f"p50 regressed by more than {options['max_regression']}% for: {', '.join(regressions)}")
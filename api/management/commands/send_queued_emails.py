@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from api.mail import send_queued_emails, get_outbound_email_setting
+
+
+class Command(BaseCommand):
+    help = 'Sends queued outbound emails in batches over one connection, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Emails sent per connection (default: OUTBOUND_EMAIL_BATCH_SIZE).')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the queue instead of exiting when it is empty.')
+        parser.add_argument('--interval', type=float, default=None, help='Seconds to sleep between polls when the queue is empty (default: OUTBOUND_EMAIL_POLL_INTERVAL).')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] if options['interval'] is not None else get_outbound_email_setting('POLL_INTERVAL', 5)
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_queued_emails(batch_size=options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                # More may be waiting; go straight to the next batch
+                continue
+            if not options['loop']:
+                break
+            time.sleep(interval)
+
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails, {total_failed} failed.'))
@@ -0,0 +1,23 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.notifications import send_stock_alert_digests
+
+
+class Command(BaseCommand):
+    help = 'Collapses suppressed low stock and overstock alerts into one digest notification per organization.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep sending digests periodically instead of exiting.')
+        parser.add_argument('--interval', type=float, default=None, help='Seconds between runs with --loop (default: STOCK_ALERT_DIGEST_INTERVAL).')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] if options['interval'] is not None else getattr(settings, 'STOCK_ALERT_DIGEST_INTERVAL', 300)
+        total = 0
+        while True:
+            total += send_stock_alert_digests()
+            if not options['loop']:
+                break
+            time.sleep(interval)
+
+        self.stdout.write(self.style.SUCCESS(f'Created {total} digest notifications.'))
@@ -0,0 +1,255 @@
+"""
+Prometheus metrics for the API hot paths, served as text at /metrics.
+
+The registry is in-process and has no dependencies: each metric keeps its
+values in a dict keyed by the tuple of label values, behind its own lock, so
+recording is a dict lookup and an addition. Every worker process exports its
+own numbers; Prometheus tells them apart by instance and sums them.
+
+Exported:
+
+- stocksync_request_duration_seconds{url_name}: the request time histogram
+  kept by accounts.instrumentation (one book for both /metrics and the
+  request-stats endpoint), with the queries and DB time next to it
+- stocksync_checkout_duration_seconds / stocksync_checkout_lines: the checkout
+  transaction of ProcessOrderView (order and stock updates), and how many order
+  lines it moved
+- stocksync_stock_movements_total{movement_type}: inventory movements recorded
+  by Inventory.add_stock/remove_stock, apply_stock_adjustments and checkout
+- stocksync_notification_fanout{notification_type}: notifications created per
+  stock alert batch or digest run
+- stocksync_email_queue_depth{status}: unsent OutboundEmail rows, counted at
+  scrape time
+- stocksync_cache_requests_total{cache,result} and stocksync_cache_hit_ratio{cache}
+"""
+import bisect
+import math
+import threading
+from django.db.models import Count
+
+# Upper bounds of the default histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """collector() returns exposition lines; it runs on every scrape (e.g. for values read from the database)."""
+        with self.lock:
+            self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self.lock:
+            metrics = list(self.metrics)
+            collectors = list(self.collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+    def render(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        return self.header() + [
+            f'{self.name}{_labels(self.labelnames, key)} {_format_value(value)}' for key, value in values
+        ]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        # Index of the first bucket whose bound is >= value; len(buckets) is +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket counts (not cumulative), then sum and count
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self.lock:
+            values = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self.values.items())
+        lines = self.header()
+        for key, (counts, total, count) in values:
+            lines.extend(histogram_lines(self.name, self.labelnames, key, self.buckets, counts, total, count))
+        return lines
+
+
+def histogram_lines(name, labelnames, key, bounds, counts, total, count):
+    """Exposition lines of one histogram series from its per-bucket counts (the last one being +Inf)."""
+    lines = []
+    cumulative = 0
+    for bound, bucket_count in zip(tuple(bounds) + (math.inf,), counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{_labels(labelnames, key, ("le", _format_value(bound)))} {cumulative}')
+    lines.append(f'{name}_sum{_labels(labelnames, key)} {_format_value(total)}')
+    lines.append(f'{name}_count{_labels(labelnames, key)} {count}')
+    return lines
+
+
+CHECKOUT_DURATION = Histogram(
+    'stocksync_checkout_duration_seconds',
+    'Time spent in the checkout transaction of an order.',
+)
+CHECKOUT_LINES = Histogram(
+    'stocksync_checkout_lines',
+    'Order lines per checkout.',
+    buckets=SIZE_BUCKETS,
+)
+STOCK_MOVEMENTS = Counter(
+    'stocksync_stock_movements_total',
+    'Inventory movements recorded.',
+    ['movement_type'],
+)
+NOTIFICATION_FANOUT = Histogram(
+    'stocksync_notification_fanout',
+    'Notifications created per stock alert batch or digest run.',
+    ['notification_type'],
+    buckets=(0,) + SIZE_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    'stocksync_cache_requests_total',
+    'Cache lookups by result.',
+    ['cache', 'result'],
+)
+
+
+def record_stock_movements(movements):
+    """Counts recorded InventoryMovement objects by movement type."""
+    counts = {}
+    for movement in movements:
+        counts[movement.movement_type] = counts.get(movement.movement_type, 0) + 1
+    for movement_type, count in counts.items():
+        STOCK_MOVEMENTS.inc(count, movement_type=movement_type)
+
+
+def collect_request_metrics():
+    from accounts.instrumentation import LATENCY_BUCKETS_MS, snapshot_histograms
+    bounds = [bound / 1000 for bound in LATENCY_BUCKETS_MS]
+    histograms = sorted(snapshot_histograms().items())
+    duration = 'stocksync_request_duration_seconds'
+    queries = 'stocksync_request_queries_total'
+    db_time = 'stocksync_request_db_seconds_total'
+    lines = [f'# HELP {duration} Request time by URL name.', f'# TYPE {duration} histogram']
+    for url_name, (counts, count, total_time, _, _) in histograms:
+        lines.extend(histogram_lines(duration, ('url_name',), (url_name,), bounds, counts, total_time, count))
+    lines += [f'# HELP {queries} SQL queries run by requests, by URL name.', f'# TYPE {queries} counter']
+    lines += [f'{queries}{_labels(("url_name",), (url_name,))} {values[4]}' for url_name, values in histograms]
+    lines += [f'# HELP {db_time} Time requests spent in the database, by URL name.', f'# TYPE {db_time} counter']
+    lines += [f'{db_time}{_labels(("url_name",), (url_name,))} {_format_value(values[3])}' for url_name, values in histograms]
+    return lines
+
+
+def collect_email_queue():
+    from .models import OutboundEmail
+    name = 'stocksync_email_queue_depth'
+    # Sent emails are never part of the queue; the others are few and covered by the status index
+    depth = dict.fromkeys(('pending', 'sending', 'failed'), 0)
+    depth.update(
+        OutboundEmail.objects.exclude(status='sent').order_by().values_list('status').annotate(emails=Count('id'))
+    )
+    return [f'# HELP {name} Outbound emails not sent yet, by status.', f'# TYPE {name} gauge'] + [
+        f'{name}{_labels(("status",), (status,))} {count}' for status, count in sorted(depth.items())
+    ]
+
+
+def collect_cache_hit_ratio():
+    name = 'stocksync_cache_hit_ratio'
+    with CACHE_REQUESTS.lock:
+        values = dict(CACHE_REQUESTS.values)
+    lines = [f'# HELP {name} Share of cache lookups that were hits since the process started.', f'# TYPE {name} gauge']
+    for cache in sorted({cache for cache, _ in values}):
+        hits = values.get((cache, 'hit'), 0)
+        total = hits + values.get((cache, 'miss'), 0)
+        lines.append(f'{name}{_labels(("cache",), (cache,))} {_format_value(hits / total if total else 0.0)}')
+    return lines
+
+
+REGISTRY.add_collector(collect_request_metrics)
+REGISTRY.add_collector(collect_email_queue)
+REGISTRY.add_collector(collect_cache_hit_ratio)
+
+
+def render_metrics():
+    return REGISTRY.render()
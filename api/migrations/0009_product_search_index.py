@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from api.search import get_search_backend, rebuild_index
+
+    backend = get_search_backend(schema_editor.connection)
+    if backend is None:
+        return
+    backend.create_index(schema_editor)
+
+    # Index products that already exist
+    Product = apps.get_model('api', 'Product')
+    if Product.objects.exists():
+        rebuild_index(product_model=Product)
+
+
+def drop_search_index(apps, schema_editor):
+    from api.search import get_search_backend
+
+    backend = get_search_backend(schema_editor.connection)
+    if backend is not None:
+        backend.drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_alter_inventorymovement_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
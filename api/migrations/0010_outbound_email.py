@@ -0,0 +1,46 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_organizationrelationship_alter_user_options_and_more'),
+        ('api', '0009_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('info', 'Information'), ('success', 'Success'), ('warning', 'Warning'), ('error', 'Error'), ('low_stock', 'Low Stock Alert'), ('overstock', 'Overstock Alert'), ('order', 'Order Update'), ('system', 'System Message')], default='info', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('content_subtype', models.CharField(default='plain', help_text="'plain' or 'html'", max_length=20)),
+                ('from_email', models.CharField(blank=True, max_length=255, null=True)),
+                ('to', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, help_text='When a worker claimed the email for sending', null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('related_object_type', models.CharField(blank=True, help_text="Type of related object (e.g., 'order', 'organization')", max_length=50, null=True)),
+                ('related_object_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='outbound_emails', to='accounts.organization')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='api_outboun_status_d67332_idx'), models.Index(fields=['organization'], name='api_outboun_organiz_da361a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def _number(code, prefix):
+    """The counter value in an existing order number or code (ORD-7-000012, SUP0003, SUP-7-0003)."""
+    if not code or not code.startswith(prefix):
+        return 0
+    digits = code.rsplit('-', 1)[-1] if '-' in code else code[len(prefix):]
+    return int(digits) if digits.isdigit() else 0
+
+
+def seed_sequences(apps, schema_editor):
+    """Starts every counter after the highest number already in use."""
+    Sequence = apps.get_model('api', 'Sequence')
+    sources = [
+        ('order', 'ORD', apps.get_model('api', 'Order'), 'order_number'),
+        ('supplier', 'SUP', apps.get_model('api', 'Supplier'), 'supplier_code'),
+        ('buyer', 'BUY', apps.get_model('api', 'Buyer'), 'buyer_code'),
+    ]
+    counters = {}
+    for kind, prefix, model, field in sources:
+        for organization_id, code in model.objects.values_list('organization_id', field).iterator():
+            key = (organization_id, kind)
+            counters[key] = max(counters.get(key, 0), _number(code, prefix))
+
+    Sequence.objects.bulk_create([
+        Sequence(organization_id=organization_id, kind=kind, last_value=last_value)
+        for (organization_id, kind), last_value in counters.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_organizationrelationship_alter_user_options_and_more'),
+        ('api', '0011_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('order', 'Order number'), ('supplier', 'Supplier code'), ('buyer', 'Buyer code')], max_length=20)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sequences', to='accounts.organization')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sequence',
+            constraint=models.UniqueConstraint(fields=('organization', 'kind'), name='unique_sequence_per_organization'),
+        ),
+        migrations.AddConstraint(
+            model_name='sequence',
+            constraint=models.UniqueConstraint(condition=models.Q(('organization__isnull', True)), fields=('kind',), name='unique_global_sequence'),
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.6 on 2026-10-18 14:02
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_cart_totals(apps, schema_editor):
+    """Sets total_amount and item_count of every order from its items, the values OrderItem now maintains."""
+    Order = apps.get_model('api', 'Order')
+    orders = Order.objects.annotate(line_total=Sum('items__subtotal'), line_quantity=Sum('items__quantity'))
+    changed = []
+    for order in orders.iterator():
+        total_amount = order.line_total or Decimal('0.00')
+        item_count = order.line_quantity or 0
+        if order.total_amount != total_amount or order.item_count != item_count:
+            order.total_amount = total_amount
+            order.item_count = item_count
+            changed.append(order)
+    Order.objects.bulk_update(changed, ['total_amount', 'item_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, help_text='Total quantity over all lines; kept in step by OrderItem save/delete'),
+        ),
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:24
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Folds repeated (order, product) lines into the first one, so the unique constraint can be added."""
+    OrderItem = apps.get_model('api', 'OrderItem')
+    duplicates = (
+        OrderItem.objects.values('order_id', 'product_id')
+        .annotate(lines=Count('id')).filter(lines__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        items = list(OrderItem.objects.filter(order_id=duplicate['order_id'], product_id=duplicate['product_id']).order_by('id'))
+        kept = items[0]
+        kept.quantity = sum(item.quantity for item in items)
+        kept.subtotal = sum(item.subtotal for item in items)
+        kept.save(update_fields=['quantity', 'subtotal'])
+        OrderItem.objects.filter(id__in=[item.id for item in items[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_order_item_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='unique_order_product_line'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_organizationrelationship_alter_user_options_and_more'),
+        ('api', '0014_orderitem_unique_line'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('info', 'Information'), ('success', 'Success'), ('warning', 'Warning'), ('error', 'Error'), ('low_stock', 'Low Stock Alert'), ('overstock', 'Overstock Alert'), ('order', 'Order Update'), ('system', 'System Message'), ('stock_digest', 'Stock Alert Digest')], default='info', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='StockAlertState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alert_type', models.CharField(choices=[('low_stock', 'Low Stock Alert'), ('overstock', 'Overstock Alert')], max_length=20)),
+                ('last_notified_at', models.DateTimeField()),
+                ('suppressed_count', models.PositiveIntegerField(default=0, help_text='Alerts suppressed since last_notified_at; sent as a digest')),
+                ('last_quantity', models.IntegerField(help_text='Quantity at the latest (possibly suppressed) alert')),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_states', to='api.inventory')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_alert_states', to='accounts.organization')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['suppressed_count', 'last_notified_at'], name='api_stockal_suppres_105a40_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockalertstate',
+            constraint=models.UniqueConstraint(fields=('inventory', 'alert_type'), name='unique_stock_alert_state'),
+        ),
+    ]
@@ -7,9 +7,12 @@ import uuid
 from accounts.models import User, Organization
 from decimal import Decimal
 import random, string
+import logging
 from django.utils import timezone
 from django.db import transaction
 
+logger = logging.getLogger(__name__)
+
 # Create your models here.
 
 
@@ -57,24 +60,13 @@ class Supplier(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        # Generate supplier code if not set
-        if not self.supplier_code:
-            prefix = 'SUP'
-            if self.organization:
-                # Fix: Removed .base_manager as it's not needed for the default manager
-                last_supplier = Supplier.objects.filter(organization=self.organization).order_by('-id').first()
-                if last_supplier and last_supplier.supplier_code.startswith(prefix):
-                    try:
-                        last_number = int(last_supplier.supplier_code[len(prefix):])
-                        self.supplier_code = f"{prefix}{last_number + 1:04d}"
-                    except ValueError:
-                        self.supplier_code = f"{prefix}0001"
-                else:
-                    self.supplier_code = f"{prefix}0001"
-            else:
-                self.supplier_code = f"{prefix}0001"
-
-        super().save(*args, **kwargs)
+        # Generate supplier code if not set, in the same transaction as the insert so a failed save gives the number back
+        with transaction.atomic():
+            if not self.supplier_code:
+                from .sequences import format_code
+                self.supplier_code = format_code('SUP', self.organization, 'supplier')
+
+            super().save(*args, **kwargs)
 
     def get_order_history(self):
         """Get purchase order history from this supplier"""
@@ -127,23 +119,13 @@ class Buyer(models.Model):
         return f"{self.first_name} {self.last_name}"
 
     def save(self, *args, **kwargs):
-        # Generate buyer code if not set
-        if not self.buyer_code:
-            prefix = 'BUY'
-            if self.organization:
-                last_buyer = Buyer.objects.filter(organization=self.organization).order_by('-id').first()
-                if last_buyer and last_buyer.buyer_code.startswith(prefix):
-                    try:
-                        last_number = int(last_buyer.buyer_code[len(prefix):])
-                        self.buyer_code = f"{prefix}{last_number + 1:04d}"
-                    except ValueError:
-                        self.buyer_code = f"{prefix}0001"
-                else:
-                    self.buyer_code = f"{prefix}0001"
-            else:
-                self.buyer_code = f"{prefix}0001"
-
-        super().save(*args, **kwargs)
+        # Generate buyer code if not set, in the same transaction as the insert so a failed save gives the number back
+        with transaction.atomic():
+            if not self.buyer_code:
+                from .sequences import format_code
+                self.buyer_code = format_code('BUY', self.organization, 'buyer')
+
+            super().save(*args, **kwargs)
 
     def get_order_history(self):
         """Get order history from this buyer"""
@@ -349,9 +331,8 @@ class Inventory(models.Model):
 
     def trigger_low_stock_alert(self, user=None):
         """Checks if stock is low and triggers a notification."""
-        print(f"Checking low stock for Inventory ID: {self.id}, Product: {self.product.name}, Quantity: {self.quantity}, Min Level: {self.min_stock_level}")
         if self.is_low_stock:
-            print("Stock is low. Attempting to create notification.")
+            logger.debug('Low stock', extra={'inventory_id': self.id, 'quantity': self.quantity, 'min_stock_level': self.min_stock_level})
             # Add a check to prevent excessive notifications
             # You could add a field to Inventory like last_low_stock_alert_sent
             # or check for recent notifications as shown previously.
@@ -359,85 +340,87 @@ class Inventory(models.Model):
 
             # Call the class method on the Notification model
             Notification.create_low_stock_notification(self, user=user)
-            print("Low stock alert triggered.")
-        else:
-            print("Stock is not low.")
 
     def trigger_overstock_alert(self, user=None):
         """Checks if stock is over max level and triggers a notification."""
-        print(f"Checking overstock for Inventory ID: {self.id}, Product: {self.product.name}, Quantity: {self.quantity}, Max Level: {self.max_stock_level}")
         if self.is_overstock:
-            print("Stock is over max level. Attempting to create notification.")
+            logger.debug('Overstock', extra={'inventory_id': self.id, 'quantity': self.quantity, 'max_stock_level': self.max_stock_level})
             # Add a check to prevent excessive notifications if needed
             Notification.create_overstock_notification(self, user=user)
-            print("Overstock alert triggered.")
-        else:
-            print("Stock is not over max level.")
 
-    def add_stock(self, quantity, user=None, organization=None, note=None, reference=None):
-        """Adds stock to inventory and records movement."""
+    def add_stock(self, quantity, user=None, organization=None, note=None, reference=None, movement_type='addition', check_alerts=True):
+        """Adds stock to inventory and records movement. Returns the movement, or None if nothing was added."""
         if quantity <= 0:
-            return
+            return None
+        return self._apply_stock_change(quantity, movement_type, user, organization, note, reference, check_alerts)
 
-        movement_organization = organization if organization is not None else self.organization
-        if movement_organization is None:
-             print(f"Warning: Inventory {self.id} has no organization. Cannot create movement.")
-             return
-
-        # Update inventory quantity *before* creating the movement
-        self.quantity += quantity
-        self.save()
-
-        # Create InventoryMovement, setting quantity_after_movement
-        InventoryMovement.objects.create(
-            inventory=self,
-            movement_type='addition',
-            quantity_change=quantity,
-            quantity_after_movement=self.quantity, # Set the quantity after the change
-            user=user,
-            organization=movement_organization, # Use the determined organization
-            note=note,
-            reference=reference
-        )
+    def remove_stock(self, quantity, user=None, organization=None, note=None, reference=None, movement_type='removal', check_alerts=True):
+        """
+        Removes stock from inventory and records movement. Returns the movement, or
+        None if nothing was removed (e.g. not enough stock left).
+        """
+        if quantity <= 0:
+            return None
+        return self._apply_stock_change(-quantity, movement_type, user, organization, note, reference, check_alerts)
 
-        # Check for low stock after adding (in case it was negative and is now low)
-        self.trigger_low_stock_alert(user=user) # Call the new method
-        # Add this line to check for overstock after adding stock
-        self.trigger_overstock_alert(user=user)
+    def _apply_stock_change(self, quantity_change, movement_type, user, organization, note, reference, check_alerts):
+        """
+        Applies the change with a single conditional UPDATE instead of a read-modify-write
+        on self.quantity, so concurrent changes to the same row are never lost:
 
-    def remove_stock(self, quantity, user=None, organization=None, note=None, reference=None):
-        """Removes stock from inventory and records movement."""
-        if quantity <= 0:
-            return
-        if self.quantity < quantity:
-            print(f"Warning: Attempted to remove {quantity} from inventory {self.id} with only {self.quantity} available.")
-            return
+            UPDATE ... SET quantity = quantity - n, updated_at = ... WHERE id = ... AND quantity >= n
 
+        Only the changed columns are written. The quantity is re-read inside the same
+        transaction; the row stays locked by our UPDATE until commit, so the value is
+        exactly the quantity after this movement.
+        """
         movement_organization = organization if organization is not None else self.organization
         if movement_organization is None:
-             print(f"Warning: Inventory {self.id} has no organization. Cannot create movement.")
-             return
-
-        # Update inventory quantity *before* creating the movement
-        self.quantity -= quantity
-        # You might want to update last_sold here if removal implies a sale/loss
-        # self.last_sold = timezone.now()
-        self.save()
-
-        # Create InventoryMovement, setting quantity_after_movement
-        InventoryMovement.objects.create(
-            inventory=self,
-            movement_type='removal',
-            quantity_change=-quantity, # Negative
-            quantity_after_movement=self.quantity, # Set the quantity after the change
-            user=user,
-            organization=movement_organization, # Use the determined organization
-            note=note,
-            reference=reference
-        )
+             logger.warning('Inventory has no organization; cannot create movement', extra={'inventory_id': self.id})
+             return None
+
+        now = timezone.now()
+        changes = {'quantity': models.F('quantity') + quantity_change, 'updated_at': now}
+        if quantity_change > 0:
+            changes['last_stocked'] = now
+        if movement_type == 'sale':
+            changes['last_sold'] = now
+
+        with transaction.atomic():
+            rows = Inventory.objects.filter(pk=self.pk)
+            if quantity_change < 0:
+                rows = rows.filter(quantity__gte=-quantity_change)
+            if not rows.update(**changes):
+                logger.warning('Not enough stock to remove %d', -quantity_change, extra={'inventory_id': self.id})
+                return None
+
+            self.quantity = Inventory.objects.filter(pk=self.pk).values_list('quantity', flat=True).get()
+            movement = InventoryMovement.objects.create(
+                inventory=self,
+                movement_type=movement_type,
+                quantity_change=quantity_change,
+                quantity_after_movement=self.quantity, # Set the quantity after the change
+                user=user,
+                organization=movement_organization, # Use the determined organization
+                note=note,
+                reference=reference
+            )
+            from .analytics_cache import invalidate_analytics
+            invalidate_analytics({self.organization_id, movement_organization.id})
 
-        # Check for low stock after removing
-        self.trigger_low_stock_alert(user=user) # Call the new method
+        from .metrics import STOCK_MOVEMENTS
+        STOCK_MOVEMENTS.inc(movement_type=movement_type)
+
+        # Keep the in-memory instance in line with what was written
+        for field, value in changes.items():
+            if field != 'quantity':
+                setattr(self, field, value)
+
+        if check_alerts:
+            self.trigger_low_stock_alert(user=user)
+            if quantity_change > 0:
+                self.trigger_overstock_alert(user=user)
+        return movement
 
     # Add other methods like adjust_stock if needed, ensuring they also handle organization
     # and call self.trigger_low_stock_alert() after saving.
@@ -476,13 +459,14 @@ class InventoryMovement(models.Model):
         return f"{self.get_movement_type_display()}: {self.quantity_change} units of {self.inventory.product.name} (Qty after: {self.quantity_after_movement})"
 
 
+# Order._loaded_status of an order whose status was deferred when it was loaded
+_STATUS_NOT_LOADED = object()
+
+
 def generate_unique_transaction_id():
-    length = 6
-    while True:
-        transaction_id = ''.join(random.choices(string.ascii_uppercase, k=length))
-        if Order.objects.filter(transaction_id=transaction_id).count() == 0:
-            break
-    return transaction_id
+    """Short (16 character) time-ordered transaction ID; no database lookup needed, see api.identifiers."""
+    from .identifiers import generate_transaction_id
+    return generate_transaction_id(short=True)
 
 
 class Order(models.Model):
@@ -507,6 +491,7 @@ class Order(models.Model):
     customer = models.ForeignKey('Buyer', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0, help_text="Total quantity over all lines; kept in step by OrderItem save/delete")
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='unpaid')
     shipping_address = models.TextField(blank=True, null=True)
     customer_info = models.JSONField(blank=True, null=True, help_text="Additional customer information")
@@ -528,28 +513,54 @@ class Order(models.Model):
     def __str__(self):
         return self.order_number if self.order_number else f"Order (ID: {self.id or 'N/A'})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so save() can tell when the order starts or stops counting as a sale
+        instance._loaded_status = instance.__dict__.get('status', _STATUS_NOT_LOADED)
+        return instance
+
+    def get_stored_status(self):
+        """The status in the database: the one loaded, read with one query if it was deferred, None for a new order."""
+        status = getattr(self, '_loaded_status', None)
+        if status is _STATUS_NOT_LOADED:
+            status = Order._base_manager.filter(pk=self.pk).values_list('status', flat=True).first()
+        return status
+
     def save(self, *args, **kwargs):
-        if not self.order_number and self.organization:
-            prefix = 'ORD'
-            with transaction.atomic():
-                last_order = Order.objects.filter(organization=self.organization).select_for_update().order_by('-id').first()
-                if last_order and last_order.order_number:
-                    try:
-                        parts = last_order.order_number.split('-')
-                        if len(parts) > 2:
-                            last_number = int(parts[-1])
-                            new_number = last_number + 1
-                            self.order_number = f'{prefix}-{self.organization.id}-{new_number:06d}'
-                        else:
-                            self.order_number = f'{prefix}-{self.organization.id}-000001'
-                    except (ValueError, IndexError):
-                        self.order_number = f'{prefix}-{self.organization.id}-000001'
-                else:
-                    self.order_number = f'{prefix}-{self.organization.id}-000001'
-        elif not self.order_number:
-            pass
-
-        super().save(*args, **kwargs)
+        from .rollups import is_counted_status, apply_order_to_rollup
+        update_fields = kwargs.get('update_fields')
+        # Only a save that writes the status can change what the rollup counts. Saving an order
+        # loaded without its status writes just the loaded fields, as does an update_fields save.
+        writes_status = (
+            'status' in update_fields if update_fields is not None
+            else self._state.adding or 'status' not in self.get_deferred_fields()
+        )
+        with transaction.atomic():
+            previous_status = self.get_stored_status() if writes_status else None
+            if not self.order_number and self.organization:
+                # Taken in the same transaction as the insert, so a failed save gives the number back
+                from .sequences import next_sequence_value
+                self.order_number = f'ORD-{self.organization.id}-{next_sequence_value(self.organization, "order"):06d}'
+
+            super().save(*args, **kwargs)
+            # Keep the daily sales rollup in step when the order moves into or out of completed/delivered
+            if writes_status and is_counted_status(previous_status) != is_counted_status(self.status):
+                apply_order_to_rollup(self, 1 if is_counted_status(self.status) else -1)
+        if writes_status:
+            self._loaded_status = self.status
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None or 'status' in fields:
+            self._loaded_status = self.status
+
+    def delete(self, *args, **kwargs):
+        from .rollups import is_counted_status, apply_order_to_rollup
+        with transaction.atomic():
+            if self.pk and is_counted_status(self.get_stored_status() if hasattr(self, '_loaded_status') else self.status):
+                apply_order_to_rollup(self, -1)
+            return super().delete(*args, **kwargs)
 
     def calculate_total(self):
         return self.items.aggregate(total=Sum('subtotal'))['total'] or Decimal('0.00')
@@ -582,13 +593,30 @@ class Order(models.Model):
 
     @property
     def get_cart_total(self):
-        total = self.items.aggregate(total=Sum('subtotal'))['total']
-        return total if total is not None else Decimal('0.00')
+        # Maintained by OrderItem save/delete; `python manage.py check_cart_totals` verifies it
+        return self.total_amount
 
     @property
     def get_cart_items(self):
-        total_quantity = self.items.aggregate(total_quantity=Sum('quantity'))['total_quantity']
-        return total_quantity if total_quantity is not None else 0
+        return self.item_count
+
+    def apply_line_change(self, amount, quantity):
+        """
+        Adds a line change to total_amount and item_count with one UPDATE on the
+        order row (F() expressions, so concurrent line changes add up) and keeps
+        this instance in step.
+        """
+        if not amount and not quantity:
+            return
+        now = timezone.now()
+        Order.objects.filter(pk=self.pk).update(
+            total_amount=models.F('total_amount') + amount,
+            item_count=models.F('item_count') + quantity,
+            updated_at=now
+        )
+        self.total_amount = (self.total_amount or Decimal('0.00')) + amount
+        self.item_count = (self.item_count or 0) + quantity
+        self.updated_at = now
 
 
 class OrderItem(models.Model):
@@ -605,18 +633,51 @@ class OrderItem(models.Model):
             models.Index(fields=['product']),
             models.Index(fields=['organization']),
         ]
+        constraints = [
+            # One line per product and order; the cart upserts (api.cart) conflict on it
+            models.UniqueConstraint(fields=['order', 'product'], name='unique_order_product_line'),
+        ]
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in Order {self.order.order_number if self.order and self.order.order_number else 'N/A'}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What this line contributed to the sales rollup when it was loaded
+        instance._loaded_line = (instance.__dict__.get('product_id'), instance.__dict__.get('quantity'), instance.__dict__.get('unit_price'))
+        return instance
+
     def save(self, *args, **kwargs):
+        from .rollups import apply_order_item_to_rollup
         self.subtotal = self.quantity * self.unit_price
-
-        super().save(*args, **kwargs)
-
-        self.order.refresh_from_db()
-        self.order.total_amount = self.order.get_cart_total
-        self.order.save()
+        loaded_line = getattr(self, '_loaded_line', None)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Lines changed on an order that already counts as a sale adjust the rollup directly
+            apply_order_item_to_rollup(self, loaded_line)
+            # The order totals move by the difference to what this line held before
+            old_amount, old_quantity = self.line_totals(loaded_line)
+            self.order.apply_line_change(self.subtotal - old_amount, self.quantity - old_quantity)
+        self._loaded_line = (self.product_id, self.quantity, self.unit_price)
+
+    def delete(self, *args, **kwargs):
+        from .rollups import apply_order_item_to_rollup
+        loaded_line = getattr(self, '_loaded_line', None)
+        with transaction.atomic():
+            apply_order_item_to_rollup(self, loaded_line, deleted=True)
+            old_amount, old_quantity = self.line_totals(loaded_line)
+            self.order.apply_line_change(-old_amount, -old_quantity)
+            return super().delete(*args, **kwargs)
+
+    @staticmethod
+    def line_totals(line):
+        """(subtotal, quantity) of a (product_id, quantity, unit_price) line as stored, or zeros for a new line."""
+        if line is None:
+            return Decimal('0.00'), 0
+        _, quantity, unit_price = line
+        return quantity * unit_price, quantity
 
     @property
     def get_total(self):
@@ -627,6 +688,73 @@ class OrderItem(models.Model):
         return self.subtotal
 
 
+class DailySalesRollup(models.Model):
+    """
+    Units, revenue and COGS sold per supplier organization, product and day (of the
+    order date), counting orders that are completed or delivered. Maintained by
+    Order/OrderItem saves and backfilled with `python manage.py rebuild_sales_rollup`.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='daily_sales')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    units_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cogs = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Product cost at the time the sale was recorded")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['organization', 'product', 'day'], name='unique_daily_sales_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['organization', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.units_sold} units, {self.revenue} revenue"
+
+
+class DailyOrderRollup(models.Model):
+    """Number of counted orders per supplier organization and day (an order can hold several products)."""
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='daily_orders')
+    day = models.DateField()
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['organization', 'day'], name='unique_daily_order_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.organization_id} on {self.day}: {self.order_count} orders"
+
+
+class Sequence(models.Model):
+    """
+    Counter behind order numbers and supplier/buyer codes, one row per organization
+    and kind (organization is empty for the global counters). Values are taken
+    with a single UPDATE ... RETURNING in api.sequences; see next_sequence_value.
+    """
+    KIND_CHOICES = [
+        ('order', 'Order number'),
+        ('supplier', 'Supplier code'),
+        ('buyer', 'Buyer code'),
+    ]
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True, related_name='sequences')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['organization', 'kind'], name='unique_sequence_per_organization'),
+            # NULLs are distinct in a unique constraint, so the global counters need their own
+            models.UniqueConstraint(fields=['kind'], condition=models.Q(organization__isnull=True), name='unique_global_sequence'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} sequence for {self.organization_id or 'all organizations'}: {self.last_value}"
+
+
 class ShippingAddress(models.Model):
     customer = models.ForeignKey(Buyer, on_delete=models.CASCADE)
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -648,6 +776,7 @@ class Notification(models.Model):
         ('overstock', 'Overstock Alert'), # Add this line
         ('order', 'Order Update'),
         ('system', 'System Message'),
+        ('stock_digest', 'Stock Alert Digest'),
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
@@ -666,58 +795,92 @@ class Notification(models.Model):
             models.Index(fields=['read_status']),
             models.Index(fields=['timestamp']),
             models.Index(fields=['organization']),
+            models.Index(fields=['user', '-timestamp', '-id'], name='api_notif_user_list_idx'),
         ]
         ordering = ['timestamp']
 
     def __str__(self):
         return f"{self.get_notification_type_display()} for {self.user.email}: {self.message[:50]}"
 
+    def save(self, *args, **kwargs):
+        from .unread import adjust_unread
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding and not self.read_status:
+                adjust_unread('notification', {self.user_id: 1})
+
+    def delete(self, *args, **kwargs):
+        from .unread import adjust_unread
+        with transaction.atomic():
+            if not self.read_status and Notification.objects.filter(pk=self.pk, read_status=False).exists():
+                adjust_unread('notification', {self.user_id: -1})
+            return super().delete(*args, **kwargs)
+
     def mark_as_read(self):
+        # One UPDATE that only changes the row (and the unread counter) if it was still unread
+        from .unread import mark_read
+        mark_read('notification', self.user, ids=[self.pk])
         self.read_status = True
-        self.save()
 
     @classmethod
     def get_unread_count(cls, user):
-        return cls.objects.filter(user=user, read_status=False).count()
+        """Read from the user's unread counter (api.unread) instead of counting rows."""
+        from .unread import get_unread_count
+        return get_unread_count('notification', user)
 
     @classmethod
     def create_low_stock_notification(cls, inventory, user=None):
-        # ...existing code...
-        pass # Keep the existing method
+        """Notifies the admins and managers (or user) that the item is low on stock, unless it was alerted recently."""
+        return cls.create_low_stock_notifications([inventory], user=user)
+
+    @classmethod
+    def create_low_stock_notifications(cls, inventories, user=None):
+        from .notifications import notify_stock_alerts
+        return notify_stock_alerts(inventories, 'low_stock', user=user)
 
     @classmethod
     def create_overstock_notification(cls, inventory, user=None):
-        """Checks if stock is over max level and triggers a notification."""
-        # Determine users to notify (e.g., admins and managers in the organization)
-        if not user:
-            users = User.objects.filter(
-                organization=inventory.organization,
-                role__in=['admin', 'manager'], # Notify admins and managers
-                is_active=True
-            )
-        else:
-            # If a specific user is provided, notify only that user
-            users = [user]
-
-        notifications = []
-        # Customize the message for overstock
-        message = f"Overstock alert: {inventory.product.name} at {inventory.location.name} is above maximum level. Current: {inventory.quantity}, Maximum: {inventory.max_stock_level}"
-
-        # Create a notification for each relevant user
-        for user in users:
-            # Optional: Add logic here to prevent duplicate notifications within a short period
-            # For simplicity, we create one every time the trigger is hit and condition is met.
-            notification = cls.objects.create(
-                user=user,
-                message=message,
-                notification_type='overstock', # Use the new type
-                related_object_type='inventory',
-                related_object_id=inventory.id,
-                organization=inventory.organization # Associate with the inventory's organization
-            )
-            notifications.append(notification)
+        """Notifies the admins and managers (or user) that the item is over its maximum level, unless it was alerted recently."""
+        return cls.create_overstock_notifications([inventory], user=user)
 
-        return notifications
+    @classmethod
+    def create_overstock_notifications(cls, inventories, user=None):
+        """
+        Batch version of create_overstock_notification: the recipients of each organization
+        are looked up once and all notifications are created with one bulk_create.
+        """
+        from .notifications import notify_stock_alerts
+        return notify_stock_alerts(inventories, 'overstock', user=user)
+
+
+class StockAlertState(models.Model):
+    """
+    When an inventory item was last alerted about, per alert type, and how many
+    alerts were suppressed since (see api.notifications).
+    """
+    ALERT_TYPES = [
+        ('low_stock', 'Low Stock Alert'),
+        ('overstock', 'Overstock Alert'),
+    ]
+
+    inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='alert_states')
+    alert_type = models.CharField(max_length=20, choices=ALERT_TYPES)
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='stock_alert_states')
+    last_notified_at = models.DateTimeField()
+    suppressed_count = models.PositiveIntegerField(default=0, help_text="Alerts suppressed since last_notified_at; sent as a digest")
+    last_quantity = models.IntegerField(help_text="Quantity at the latest (possibly suppressed) alert")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['inventory', 'alert_type'], name='unique_stock_alert_state'),
+        ]
+        indexes = [
+            models.Index(fields=['suppressed_count', 'last_notified_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_alert_type_display()} for inventory {self.inventory_id}: {self.suppressed_count} suppressed"
 
 
 class Communication(models.Model):
@@ -744,11 +907,88 @@ class Communication(models.Model):
     def __str__(self):
         return f"From {self.sender.email} to {self.recipient.email}: {self.message[:50]}"
 
+    def save(self, *args, **kwargs):
+        from .unread import adjust_unread
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding and not self.read_status:
+                adjust_unread('communication', {self.recipient_id: 1})
+
+    def delete(self, *args, **kwargs):
+        from .unread import adjust_unread
+        with transaction.atomic():
+            if not self.read_status and Communication.objects.filter(pk=self.pk, read_status=False).exists():
+                adjust_unread('communication', {self.recipient_id: -1})
+            return super().delete(*args, **kwargs)
+
     def mark_as_read(self):
+        from .unread import mark_read
+        mark_read('communication', self.recipient, ids=[self.pk])
         self.read_status = True
-        self.save()
 
     @classmethod
     def get_unread_count(cls, user):
-        return cls.objects.filter(recipient=user, read_status=False).count()
+        """Read from the user's unread counter (api.unread) instead of counting rows."""
+        from .unread import get_unread_count
+        return get_unread_count('communication', user)
+
+
+class UnreadCounter(models.Model):
+    """A user's number of unread notifications or communications, maintained by api.unread."""
+    KIND_CHOICES = [
+        ('notification', 'Notifications'),
+        ('communication', 'Communications'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='unread_counters')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind'], name='unique_unread_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.count} unread {self.kind}s for user {self.user_id}"
+
+
+class OutboundEmail(models.Model):
+    """
+    Outbox for emails sent by the API. Requests only insert a row (inside their
+    transaction); the send_queued_emails worker delivers them over one SMTP
+    connection per batch and retries failures with exponential backoff.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    content_subtype = models.CharField(max_length=20, default='plain', help_text="'plain' or 'html'")
+    from_email = models.CharField(max_length=255, blank=True, null=True)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True, help_text="When a worker claimed the email for sending")
+    sent_at = models.DateTimeField(null=True, blank=True)
+    related_object_type = models.CharField(max_length=50, blank=True, null=True, help_text="Type of related object (e.g., 'order', 'organization')")
+    related_object_id = models.PositiveIntegerField(blank=True, null=True)
+    organization = models.ForeignKey(Organization, on_delete=models.SET_NULL, null=True, blank=True, related_name='outbound_emails')
+    created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['organization']),
+        ]
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
@@ -0,0 +1,189 @@
+"""
+Low stock and overstock notifications.
+
+An alert for an inventory item goes to the admins and managers of its
+organization (or to the user that caused it) and is inserted with one
+bulk_create for the whole batch. After that, further alerts of the same type
+for the same item are suppressed for STOCK_ALERT_DEDUP_WINDOW seconds: a
+StockAlertState row per (inventory, alert type) keeps the time of the last
+notification and counts the suppressed ones.
+
+Suppressed alerts are not lost. The next alert after the window mentions how
+many were suppressed, and the send_stock_alert_digests command periodically
+collapses the items that went quiet into one digest notification per
+organization.
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import User
+from .models import Notification, StockAlertState
+from .unread import adjust_unread
+from .metrics import NOTIFICATION_FANOUT
+
+logger = logging.getLogger(__name__)
+
+ALERT_MESSAGES = {
+    'low_stock': "Low stock alert: {product} at {location} is at or below minimum level. Current: {quantity}, Minimum: {minimum}",
+    'overstock': "Overstock alert: {product} at {location} is above maximum level. Current: {quantity}, Maximum: {maximum}",
+}
+
+
+def get_dedup_window():
+    return timedelta(seconds=getattr(settings, 'STOCK_ALERT_DEDUP_WINDOW', 3600))
+
+
+def _recipients(organization_id, user, cache):
+    """The given user, else the active admins and managers of the organization (looked up once per organization)."""
+    if user:
+        return [user]
+    if organization_id not in cache:
+        cache[organization_id] = list(User.objects.filter(
+            organization_id=organization_id,
+            role__in=['admin', 'manager'], # Notify admins and managers
+            is_active=True
+        ))
+    return cache[organization_id]
+
+
+def _alert_message(inventory, alert_type, suppressed_count):
+    message = ALERT_MESSAGES[alert_type].format(
+        product=inventory.product.name,
+        location=inventory.location.name,
+        quantity=inventory.quantity,
+        minimum=inventory.min_stock_level,
+        maximum=inventory.max_stock_level
+    )
+    if suppressed_count:
+        message += f" ({suppressed_count} repeated alerts since the previous notification.)"
+    return message
+
+
+def notify_stock_alerts(inventories, alert_type, user=None):
+    """
+    Notifies about the items in inventories that were not alerted about (for
+    alert_type) within the dedup window, and counts the others as suppressed.
+    Returns the created notifications.
+    """
+    inventories = list({inventory.id: inventory for inventory in inventories if inventory.organization_id}.values())
+    if not inventories:
+        return []
+
+    now = timezone.now()
+    due_before = now - get_dedup_window()
+    recipients = {}
+    notifications = []
+    new_states = []
+    changed_states = []
+    suppressed = 0
+    with transaction.atomic():
+        states = {
+            state.inventory_id: state
+            for state in StockAlertState.objects.select_for_update().filter(
+                inventory_id__in=[inventory.id for inventory in inventories], alert_type=alert_type
+            )
+        }
+        for inventory in inventories:
+            state = states.get(inventory.id)
+            if state is not None and state.last_notified_at > due_before:
+                # Alerted recently: only count it
+                state.suppressed_count += 1
+                state.last_quantity = inventory.quantity
+                changed_states.append(state)
+                suppressed += 1
+                continue
+
+            suppressed_count = 0
+            if state is None:
+                new_states.append(StockAlertState(
+                    inventory=inventory,
+                    alert_type=alert_type,
+                    organization_id=inventory.organization_id,
+                    last_notified_at=now,
+                    last_quantity=inventory.quantity
+                ))
+            else:
+                suppressed_count = state.suppressed_count
+                state.last_notified_at = now
+                state.suppressed_count = 0
+                state.last_quantity = inventory.quantity
+                changed_states.append(state)
+
+            message = _alert_message(inventory, alert_type, suppressed_count)
+            for recipient in _recipients(inventory.organization_id, user, recipients):
+                notifications.append(Notification(
+                    user=recipient,
+                    message=message,
+                    notification_type=alert_type,
+                    related_object_type='inventory',
+                    related_object_id=inventory.id,
+                    organization_id=inventory.organization_id
+                ))
+
+        # A concurrent first alert for the same item may have created the state already
+        StockAlertState.objects.bulk_create(new_states, ignore_conflicts=True)
+        StockAlertState.objects.bulk_update(changed_states, ['last_notified_at', 'suppressed_count', 'last_quantity'], batch_size=500)
+        created = Notification.objects.bulk_create(notifications, batch_size=500)
+        adjust_unread('notification', Counter(notification.user_id for notification in created))
+
+    NOTIFICATION_FANOUT.observe(len(created), notification_type=alert_type)
+    logger.debug(
+        'Stock alerts sent',
+        extra={'alert_type': alert_type, 'inventories': len(inventories), 'suppressed': suppressed, 'notifications': len(created)}
+    )
+    return created
+
+
+def send_stock_alert_digests():
+    """
+    Sends one digest notification per organization (to its admins and managers)
+    for the items whose suppressed alerts have not been reported yet and that
+    were not alerted about within the dedup window. Returns the number of
+    notifications created.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        states = list(
+            StockAlertState.objects.select_for_update(of=('self',))
+            .filter(suppressed_count__gt=0, last_notified_at__lte=now - get_dedup_window())
+            .select_related('inventory__product', 'inventory__location')
+            .order_by('organization_id', 'inventory_id', 'alert_type')
+        )
+        if not states:
+            return 0
+
+        by_organization = defaultdict(list)
+        for state in states:
+            by_organization[state.organization_id].append(state)
+
+        recipients = {}
+        notifications = []
+        for organization_id, organization_states in by_organization.items():
+            lines = [
+                f"- {state.inventory.product.name} at {state.inventory.location.name}: "
+                f"{state.suppressed_count} {state.get_alert_type_display().lower()}s, last quantity {state.last_quantity}"
+                for state in organization_states
+            ]
+            total = sum(state.suppressed_count for state in organization_states)
+            message = f"Stock alert digest: {total} repeated alerts for {len(organization_states)} items.\n" + "\n".join(lines)
+            for recipient in _recipients(organization_id, None, recipients):
+                notifications.append(Notification(
+                    user=recipient,
+                    message=message,
+                    notification_type='stock_digest',
+                    organization_id=organization_id
+                ))
+
+        created = Notification.objects.bulk_create(notifications, batch_size=500)
+        adjust_unread('notification', Counter(notification.user_id for notification in created))
+        StockAlertState.objects.filter(id__in=[state.id for state in states]).update(suppressed_count=0, last_notified_at=now)
+
+    NOTIFICATION_FANOUT.observe(len(created), notification_type='stock_digest')
+    logger.info(
+        'Stock alert digests sent',
+        extra={'inventories': len(states), 'organizations': len(by_organization), 'notifications': len(created)}
+    )
+    return len(created)
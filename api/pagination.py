@@ -0,0 +1,223 @@
+import base64
+import datetime
+import decimal
+import json
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over the queryset's existing ordering.
+
+    The ordering of the view's queryset (e.g. 'name' or 'product__name', 'location__name')
+    is extended with the primary key as a tie breaker. The cursor encodes the ordering
+    values of the last (or first) row on the page, and the next page is fetched with a
+    WHERE clause on those values instead of an OFFSET, so deep pages cost the same as
+    the first one. Ordering fields must not be nullable.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+        self.max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.get_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """The same page, fetched with the async ORM (see api.async_views)."""
+        return self.get_page([instance async for instance in self.get_page_queryset(queryset, request)])
+
+    def get_page_queryset(self, queryset, request):
+        """Returns the queryset for one page plus one row, which tells whether there is more."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.current_page_size = self.get_page_size(request)
+
+        self.ordering = self.get_ordering(queryset)
+        self.position, self.reverse = self.decode_cursor(request, self.ordering, queryset.model)
+
+        # Walking backwards means flipping the ordering, then flipping the page back
+        query_ordering = [(field, not descending) for field, descending in self.ordering] if self.reverse else self.ordering
+        queryset = queryset.order_by(*[('-' if descending else '') + field for field, descending in query_ordering])
+        if self.position is not None:
+            queryset = queryset.filter(self.build_keyset_filter(query_ordering, self.position))
+        return queryset[:self.current_page_size + 1]
+
+    def get_page(self, results):
+        ordering, position, reverse = self.ordering, self.position, self.reverse
+        has_more = len(results) > self.current_page_size
+        page = results[:self.current_page_size]
+        if reverse:
+            page.reverse()
+
+        self.next_position = self.previous_position = None
+        if page:
+            last_values = self.get_position(page[-1], ordering)
+            first_values = self.get_position(page[0], ordering)
+            if (has_more and not reverse) or (reverse and position is not None):
+                self.next_position = last_values
+            if (has_more and reverse) or (not reverse and position is not None):
+                self.previous_position = first_values
+        elif position is not None:
+            # Stepped past the end; let the client walk back from the position it sent
+            position = [self.encode_value(value) for value in position]
+            self.previous_position = position if not reverse else None
+            self.next_position = position if reverse else None
+
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        """
+        Returns the queryset ordering as a list of (field, descending) tuples,
+        with the primary key appended so every row has a unique position.
+        """
+        order_by = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+        ordering = []
+        for field in order_by:
+            if not isinstance(field, str):
+                raise ValueError('KeysetPagination only supports ordering by field names.')
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            if name == 'pk':
+                name = queryset.model._meta.pk.name
+            ordering.append((name, descending))
+
+        pk_name = queryset.model._meta.pk.name
+        if not any(name == pk_name for name, _ in ordering):
+            ordering.append((pk_name, ordering[0][1] if ordering else False))
+        return ordering
+
+    def build_keyset_filter(self, ordering, position):
+        """
+        Builds the "row comes after position" condition:
+        (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z) ...
+        """
+        condition = Q()
+        for index, (field, descending) in enumerate(ordering):
+            lookup = {previous_field: position[i] for i, (previous_field, _) in enumerate(ordering[:index])}
+            lookup[f"{field}__{'lt' if descending else 'gt'}"] = position[index]
+            condition |= Q(**lookup)
+        return condition
+
+    def get_position(self, instance, ordering):
+        position = []
+        for field, _ in ordering:
+            value = instance
+            for part in field.split('__'):
+                value = getattr(value, part)
+            position.append(self.encode_value(value))
+        return position
+
+    def encode_value(self, value):
+        # Keep full precision; DjangoJSONEncoder would truncate datetimes to milliseconds
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            return value.isoformat()
+        if isinstance(value, (decimal.Decimal, uuid.UUID)):
+            return str(value)
+        return value
+
+    def encode_cursor(self, position, reverse=False):
+        payload = {'p': position}
+        if reverse:
+            payload['r'] = 1
+        data = json.dumps(payload, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_field(self, model, path):
+        """
+        The model field at the end of an ordering path like 'product__name' (a
+        relation's target field), or None for names that are not fields (annotations).
+        """
+        field = None
+        for part in path.split('__'):
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return None
+            if field.is_relation:
+                model = field.related_model
+        return field.target_field if field.is_relation else field
+
+    def to_python(self, model, path, value):
+        field = self.get_field(model, path)
+        return field.to_python(value) if field is not None else value
+
+    def decode_cursor(self, request, ordering, model):
+        """
+        Returns (position, reverse) from the cursor parameter, with every value
+        converted to its field's Python type, so a tampered cursor is a 404 and
+        never reaches the query.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = payload['p']
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # encode_value only writes scalars
+        if any(isinstance(value, (list, dict)) for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [self.to_python(model, field, value) for (field, _), value in zip(ordering, position)]
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        # Ordering fields are not nullable, so neither are positions
+        if any(value is None for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
@@ -0,0 +1,172 @@
+"""
+Daily sales rollup.
+
+DailySalesRollup holds units, revenue and COGS per (supplier organization,
+product, day) and DailyOrderRollup the number of orders per (supplier
+organization, day), for orders that are completed or delivered. The analytics
+in api.aggregation read these tables instead of scanning OrderItem.
+
+Rows are adjusted with F() increments when an order moves into or out of a
+counted status, and when lines of a counted order change. COGS uses the product
+cost at that moment. rebuild_rollups() recomputes everything from the orders.
+Every change drops the cached analytics of the organizations it touched.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum, Count, DecimalField
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import DailySalesRollup, DailyOrderRollup, OrderItem, Product
+from .analytics_cache import invalidate_analytics, invalidate_all_analytics
+
+COUNTED_STATUSES = ('completed', 'delivered')
+
+
+def is_counted_status(status):
+    return status in COUNTED_STATUSES
+
+
+def get_rollup_day(order):
+    """The day an order is reported on: its order date in the current time zone (as TruncDate does)."""
+    return timezone.localdate(order.order_date) if timezone.is_aware(order.order_date) else order.order_date.date()
+
+
+def _increment(model, keys, changes):
+    """Adds changes to the row with the given keys, creating it if needed."""
+    if model.objects.filter(**keys).update(**{field: F(field) + value for field, value in changes.items()}):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **changes)
+    except IntegrityError:
+        # Created concurrently between our UPDATE and INSERT
+        model.objects.filter(**keys).update(**{field: F(field) + value for field, value in changes.items()})
+
+
+def _apply_lines(day, lines, sign):
+    """lines: iterable of (organization_id, product_id, quantity, unit_price, cost)."""
+    totals = defaultdict(lambda: [0, Decimal('0.00'), Decimal('0.00')])
+    for organization_id, product_id, quantity, unit_price, cost in lines:
+        if organization_id is None:
+            continue
+        total = totals[(organization_id, product_id)]
+        total[0] += quantity
+        total[1] += quantity * unit_price
+        total[2] += quantity * (cost or Decimal('0.00'))
+
+    for (organization_id, product_id), (units, revenue, cogs) in totals.items():
+        _increment(
+            DailySalesRollup,
+            {'organization_id': organization_id, 'product_id': product_id, 'day': day},
+            {'units_sold': sign * units, 'revenue': sign * revenue, 'cogs': sign * cogs}
+        )
+    return {organization_id for organization_id, _ in totals}
+
+
+def apply_order_to_rollup(order, sign):
+    """Adds (sign=1) or removes (sign=-1) all lines of the order."""
+    lines = OrderItem.objects.filter(order=order).values_list(
+        'product__organization_id', 'product_id', 'quantity', 'unit_price', 'product__cost'
+    )
+    day = get_rollup_day(order)
+    with transaction.atomic():
+        organization_ids = _apply_lines(day, lines, sign)
+        for organization_id in organization_ids:
+            _increment(DailyOrderRollup, {'organization_id': organization_id, 'day': day}, {'order_count': sign})
+        invalidate_analytics(organization_ids)
+
+
+def apply_order_item_to_rollup(order_item, loaded_line, deleted=False):
+    """
+    Applies a changed order line to the rollup if its order counts as a sale.
+    loaded_line is the (product_id, quantity, unit_price) the line had in the
+    database, or None for a new line.
+    """
+    order = order_item.order
+    if not is_counted_status(order.status):
+        return
+
+    new_line = None if deleted else (order_item.product_id, order_item.quantity, order_item.unit_price)
+    if loaded_line == new_line:
+        return
+
+    product_ids = {line[0] for line in (loaded_line, new_line) if line is not None}
+    products = Product.objects.in_bulk(product_ids)
+    day = get_rollup_day(order)
+
+    def as_lines(line):
+        if line is None or line[0] not in products:
+            return []
+        product = products[line[0]]
+        return [(product.organization_id, product.id, line[1], line[2], product.cost)]
+
+    old_organizations = _apply_lines(day, as_lines(loaded_line), -1)
+    new_organizations = _apply_lines(day, as_lines(new_line), 1)
+
+    # The order counts once per supplier organization that has at least one line in it
+    for organization_id in old_organizations ^ new_organizations:
+        other_lines = OrderItem.objects.filter(order=order, product__organization_id=organization_id)
+        if order_item.pk:
+            other_lines = other_lines.exclude(pk=order_item.pk)
+        if not other_lines.exists():
+            change = 1 if organization_id in new_organizations else -1
+            _increment(DailyOrderRollup, {'organization_id': organization_id, 'day': day}, {'order_count': change})
+
+    invalidate_analytics(old_organizations | new_organizations)
+
+
+def rebuild_rollups(organization=None, apps=None):
+    """
+    Recomputes the rollup tables from the completed and delivered orders, for one
+    organization or all of them. COGS uses current product costs. Returns the
+    number of product-day rows written. Migrations pass their app registry.
+    """
+    if apps is not None:
+        OrderItem = apps.get_model('api', 'OrderItem')
+        DailySalesRollup = apps.get_model('api', 'DailySalesRollup')
+        DailyOrderRollup = apps.get_model('api', 'DailyOrderRollup')
+    else:
+        from .models import OrderItem, DailySalesRollup, DailyOrderRollup
+
+    items = OrderItem.objects.filter(order__status__in=COUNTED_STATUSES, product__organization__isnull=False)
+    sales = DailySalesRollup.objects.all()
+    orders = DailyOrderRollup.objects.all()
+    if organization is not None:
+        items = items.filter(product__organization=organization)
+        sales = sales.filter(organization=organization)
+        orders = orders.filter(organization=organization)
+
+    items = items.annotate(day=TruncDate('order__order_date'))
+    product_days = items.values('product__organization_id', 'product_id', 'day').annotate(
+        units=Sum('quantity'),
+        total_revenue=Sum(F('quantity') * F('unit_price'), output_field=DecimalField()),
+        total_cogs=Sum(F('quantity') * F('product__cost'), output_field=DecimalField())
+    ).order_by()
+    order_days = items.values('product__organization_id', 'day').annotate(
+        orders=Count('order', distinct=True)
+    ).order_by()
+
+    with transaction.atomic():
+        sales.delete()
+        orders.delete()
+        created = DailySalesRollup.objects.bulk_create([
+            DailySalesRollup(
+                organization_id=row['product__organization_id'],
+                product_id=row['product_id'],
+                day=row['day'],
+                units_sold=row['units'] or 0,
+                revenue=row['total_revenue'] or Decimal('0.00'),
+                cogs=row['total_cogs'] or Decimal('0.00')
+            ) for row in product_days.iterator()
+        ], batch_size=1000)
+        DailyOrderRollup.objects.bulk_create([
+            DailyOrderRollup(organization_id=row['product__organization_id'], day=row['day'], order_count=row['orders'])
+            for row in order_days.iterator()
+        ], batch_size=1000)
+        if apps is None:
+            if organization is not None:
+                invalidate_analytics(organization.id)
+            else:
+                invalidate_all_analytics()
+    return len(created)
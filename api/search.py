@@ -0,0 +1,286 @@
+"""
+Full-text search index for products.
+
+The index covers name, description, SKU, barcode, brand and category. On SQLite
+it is an FTS5 virtual table, on PostgreSQL a table with a weighted tsvector
+column (plus pg_trgm for typo tolerance when the extension is available). Other
+backends fall back to icontains filtering in ProductSearchView.
+
+The index is kept in sync by the Product/Brand/Category signals in api.signals;
+rebuild it with `python manage.py rebuild_search_index`.
+"""
+import difflib
+import logging
+import re
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'api_product_search'
+SEARCH_VOCAB_TABLE = 'api_product_search_vocab'
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def get_search_terms(query):
+    """Splits a user query into lowercase search terms."""
+    return [term.lower() for term in _TERM_RE.findall(query or '')]
+
+
+def get_product_document(product):
+    """Returns the text indexed for a product, keyed by index column."""
+    return {
+        'name': product.name or '',
+        'description': product.description or '',
+        'sku': product.sku or '',
+        'barcode': product.barcode or '',
+        'brand': product.brand.name if product.brand_id else '',
+        'category': product.category.name if product.category_id else '',
+    }
+
+
+class SQLiteProductSearchBackend:
+    """FTS5 backed index. The FTS rowid is the product id."""
+
+    # bm25 column weights: name, description, sku, barcode, brand, category, organization_id
+    RANK_WEIGHTS = '10.0, 2.0, 8.0, 8.0, 4.0, 4.0, 0.0'
+
+    def create_index(self, schema_editor):
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            "name, description, sku, barcode, brand, category, organization_id UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+        )
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_VOCAB_TABLE} USING fts5vocab({SEARCH_TABLE}, 'row')"
+        )
+
+    def drop_index(self, schema_editor):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_VOCAB_TABLE}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index_product(self, product):
+        document = get_product_document(product)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [product.pk])
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, sku, barcode, brand, category, organization_id) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                [product.pk, document['name'], document['description'], document['sku'],
+                 document['barcode'], document['brand'], document['category'], product.organization_id]
+            )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [product_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+    def _match_expression(self, terms):
+        # Every term must match; each one is quoted and used as a prefix query
+        return ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+
+    def _known_prefix(self, cursor, term):
+        cursor.execute(
+            f"SELECT 1 FROM {SEARCH_VOCAB_TABLE} WHERE term >= %s AND term < %s LIMIT 1",
+            [term, term + '\U0010ffff']
+        )
+        return cursor.fetchone() is not None
+
+    def _correct_term(self, cursor, term):
+        """Finds indexed terms close to a misspelled one (same first letter, similar length)."""
+        cursor.execute(
+            f"SELECT term FROM {SEARCH_VOCAB_TABLE} WHERE term >= %s AND term < %s "
+            "AND length(term) BETWEEN %s AND %s",
+            [term[0], term[0] + '\U0010ffff', max(1, len(term) - 2), len(term) + 2]
+        )
+        candidates = [row[0] for row in cursor.fetchall()]
+        return difflib.get_close_matches(term, candidates, n=3, cutoff=0.75)
+
+    def search(self, query, organization_ids, limit):
+        terms = get_search_terms(query)
+        organization_ids = list(organization_ids)
+        if not terms or not organization_ids:
+            return []
+
+        with connection.cursor() as cursor:
+            match_parts = []
+            for term in terms:
+                if self._known_prefix(cursor, term):
+                    match_parts.append(self._match_expression([term]))
+                    continue
+                corrections = self._correct_term(cursor, term)
+                if not corrections:
+                    return []
+                match_parts.append('(' + ' OR '.join(self._match_expression([c]) for c in corrections) + ')')
+
+            placeholders = ', '.join(['%s'] * len(organization_ids))
+            cursor.execute(
+                f"SELECT rowid FROM {SEARCH_TABLE} "
+                f"WHERE {SEARCH_TABLE} MATCH %s AND organization_id IN ({placeholders}) "
+                f"ORDER BY bm25({SEARCH_TABLE}, {self.RANK_WEIGHTS}) LIMIT %s",
+                [' '.join(match_parts), *organization_ids, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresProductSearchBackend:
+    """tsvector backed index with a trigram fallback for misspelled queries."""
+
+    DOCUMENT_SQL = (
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'C')"
+    )
+
+    def __init__(self):
+        self._has_trigram = None
+
+    def create_index(self, schema_editor):
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+            "product_id bigint PRIMARY KEY REFERENCES api_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "organization_id bigint NOT NULL, "
+            "document tsvector NOT NULL, "
+            "terms text NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING gin (document)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_organization_idx ON {SEARCH_TABLE} (organization_id)"
+        )
+        # pg_trgm needs extension privileges; without it search still works, just without typo tolerance
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                schema_editor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_terms_trgm_idx ON {SEARCH_TABLE} USING gin (terms gin_trgm_ops)"
+                )
+        except Exception as e:
+            logger.warning('pg_trgm is not available, product search will not be typo tolerant: %s', e)
+
+    def drop_index(self, schema_editor):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index_product(self, product):
+        document = get_product_document(product)
+        identifiers = f"{document['sku']} {document['barcode']}"
+        grouping = f"{document['brand']} {document['category']}"
+        terms = ' '.join(value for value in document.values() if value).lower()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (product_id, organization_id, document, terms) "
+                f"VALUES (%s, %s, {self.DOCUMENT_SQL}, %s) "
+                "ON CONFLICT (product_id) DO UPDATE SET organization_id = EXCLUDED.organization_id, "
+                "document = EXCLUDED.document, terms = EXCLUDED.terms",
+                [product.pk, product.organization_id, document['name'], identifiers, grouping,
+                 document['description'], terms]
+            )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE product_id = %s", [product_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+    def has_trigram(self, cursor):
+        if self._has_trigram is None:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            self._has_trigram = cursor.fetchone() is not None
+        return self._has_trigram
+
+    def search(self, query, organization_ids, limit):
+        terms = get_search_terms(query)
+        organization_ids = list(organization_ids)
+        if not terms or not organization_ids:
+            return []
+
+        # to_tsquery syntax: every term is a prefix match and all terms must match
+        tsquery = ' & '.join("'%s':*" % term.replace("'", "''").replace('\\', '') for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT product_id FROM {SEARCH_TABLE} "
+                "WHERE organization_id = ANY(%s) AND document @@ to_tsquery('simple', %s) "
+                "ORDER BY ts_rank(document, to_tsquery('simple', %s)) DESC, product_id LIMIT %s",
+                [organization_ids, tsquery, tsquery, limit]
+            )
+            product_ids = [row[0] for row in cursor.fetchall()]
+            if product_ids or not self.has_trigram(cursor):
+                return product_ids
+
+            # Nothing matched exactly; fall back to trigram word similarity for typos
+            text = ' '.join(terms)
+            cursor.execute(
+                f"SELECT product_id FROM {SEARCH_TABLE} "
+                "WHERE organization_id = ANY(%s) AND %s <%% terms "
+                "ORDER BY word_similarity(%s, terms) DESC, product_id LIMIT %s",
+                [organization_ids, text, text, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+_backends = {
+    'sqlite': SQLiteProductSearchBackend(),
+    'postgresql': PostgresProductSearchBackend(),
+}
+
+
+def get_search_backend(db_connection=None):
+    """Returns the search backend for the database in use, or None if it has no full-text index."""
+    return _backends.get((db_connection or connection).vendor)
+
+
+def get_search_result_limit():
+    return getattr(settings, 'PRODUCT_SEARCH_RESULT_LIMIT', 100)
+
+
+def index_product(product):
+    backend = get_search_backend()
+    if backend:
+        backend.index_product(product)
+
+
+def remove_product(product_id):
+    backend = get_search_backend()
+    if backend:
+        backend.remove_product(product_id)
+
+
+def search_product_ids(query, organization_ids, limit=None):
+    """
+    Returns the IDs of products matching the query within the given organizations,
+    best match first. Returns None if the database has no full-text index.
+    """
+    backend = get_search_backend()
+    if backend is None:
+        return None
+    return backend.search(query, organization_ids, limit or get_search_result_limit())
+
+
+def rebuild_index(batch_size=1000, product_model=None):
+    """
+    Clears and refills the search index from the Product table. Returns the number
+    of products indexed. Migrations pass their historical Product model.
+    """
+    if product_model is None:
+        from .models import Product as product_model
+
+    backend = get_search_backend()
+    if backend is None:
+        return 0
+
+    count = 0
+    with transaction.atomic():
+        backend.clear()
+        products = product_model.objects.select_related('brand', 'category').order_by('pk')
+        for product in products.iterator(chunk_size=batch_size):
+            backend.index_product(product)
+            count += 1
+    return count
@@ -0,0 +1,128 @@
+"""
+Order numbers and supplier/buyer codes.
+
+Each (organization, kind) has a row in the Sequence table. A value is taken with
+one statement,
+
+    UPDATE api_sequence SET last_value = last_value + 1 WHERE organization_id = ... AND kind = ... RETURNING last_value
+
+instead of locking and parsing the organization's latest order. Concurrent saves
+only meet on that counter row, and only for the length of their own transaction.
+Taken inside the caller's transaction, a rolled back save gives its number back,
+so numbers stay gapless.
+
+With SEQUENCE_BLOCK_SIZE > 1, a process reserves that many values at once and
+hands them out from memory, so most saves do not touch the counter row at all.
+Numbers are then no longer gapless or in creation order across processes. A
+block is reserved in the caller's transaction and only shared with other saves
+once that transaction commits; if it rolls back, the reservation is undone in
+the database and the block is simply dropped, so no value is handed out twice.
+(Several saves inside one long transaction therefore each reserve a block.)
+"""
+import threading
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from .models import Sequence
+
+_blocks = {}
+_blocks_lock = threading.Lock()
+
+
+def _supports_update_returning():
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35, 0)
+    # MySQL and MariaDB have no UPDATE ... RETURNING
+    return False
+
+
+def _increment(organization_id, kind, count):
+    """Adds count to the counter and returns the new last value, or None if there is no counter row yet."""
+    quote = connection.ops.quote_name
+    table = quote(Sequence._meta.db_table)
+    last_value = quote(Sequence._meta.get_field('last_value').column)
+    kind_column = quote(Sequence._meta.get_field('kind').column)
+    organization_column = quote(Sequence._meta.get_field('organization').column)
+
+    params = [count, kind]
+    if organization_id is None:
+        condition = f'{organization_column} IS NULL'
+    else:
+        condition = f'{organization_column} = %s'
+        params.append(organization_id)
+    sql = f'UPDATE {table} SET {last_value} = {last_value} + %s WHERE {kind_column} = %s AND {condition}'
+
+    with connection.cursor() as cursor:
+        if _supports_update_returning():
+            cursor.execute(f'{sql} RETURNING {last_value}', params)
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        cursor.execute(sql, params)
+        if not cursor.rowcount:
+            return None
+    # Our UPDATE holds the row lock until commit, so this reads exactly our value
+    return Sequence.objects.filter(organization_id=organization_id, kind=kind).values_list('last_value', flat=True).get()
+
+
+def allocate_sequence_values(organization, kind, count=1):
+    """
+    Reserves count consecutive values of the (organization, kind) counter and
+    returns the last one; the reserved range is last - count + 1 ... last.
+    The counter row is created on first use.
+    """
+    organization_id = organization.id if organization is not None else None
+    with transaction.atomic():
+        last = _increment(organization_id, kind, count)
+        if last is None:
+            try:
+                with transaction.atomic():
+                    Sequence.objects.create(organization_id=organization_id, kind=kind, last_value=0)
+            except IntegrityError:
+                # Created concurrently; use that row
+                pass
+            last = _increment(organization_id, kind, count)
+    return last
+
+
+def next_sequence_value(organization, kind):
+    """Returns the next value of the (organization, kind) counter, starting at 1."""
+    block_size = getattr(settings, 'SEQUENCE_BLOCK_SIZE', 1)
+    if block_size <= 1:
+        return allocate_sequence_values(organization, kind)
+
+    key = (connection.alias, organization.id if organization is not None else None, kind)
+    with _blocks_lock:
+        ranges = _blocks.get(key)
+        if ranges:
+            value = ranges[0][0]
+            ranges[0][0] += 1
+            if ranges[0][0] > ranges[0][1]:
+                ranges.pop(0)
+            return value
+
+    last = allocate_sequence_values(organization, kind, block_size)
+    first = last - block_size + 1
+
+    def publish():
+        if first < last:
+            with _blocks_lock:
+                _blocks.setdefault(key, []).append([first + 1, last])
+    # The rest of the block is only safe to hand out once the reservation is committed
+    transaction.on_commit(publish)
+    return first
+
+
+def reset_sequence_blocks():
+    """Forgets the blocks reserved by this process (their unused values are skipped)."""
+    with _blocks_lock:
+        _blocks.clear()
+
+
+def format_code(prefix, organization, kind):
+    """Supplier and buyer codes: SUP-<organization id>-0001, or SUP0001 without an organization."""
+    value = next_sequence_value(organization, kind)
+    if organization is None:
+        return f"{prefix}{value:04d}"
+    return f"{prefix}-{organization.id}-{value:04d}"
@@ -1,8 +1,9 @@
 from rest_framework import serializers
-from .models import Product, Order, ProductImage, Size, ProductSize, Brand, OrderItem, ShippingAddress, Buyer, Supplier, Driver, Category, Location, Inventory, InventoryMovement
+from .models import Product, Order, ProductImage, Size, ProductSize, Brand, OrderItem, ShippingAddress, Buyer, Supplier, Driver, Category, Location, Inventory, InventoryMovement, Notification
 from accounts.models import Organization, User, OrganizationRelationship
-from django.db import transaction
+from django.db import transaction, models
 from django.db.models import Sum
+from .loaders import ProductBatchLoader
 
 class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
@@ -21,7 +22,47 @@ class ProductSizeSerializer(serializers.ModelSerializer):
         model = ProductSize
         fields = ('size',)
 
-class ProductSerializer(serializers.ModelSerializer):
+def get_request_organization(context):
+    """Returns the organization of the authenticated user in the serializer context, if any."""
+    request = context.get('request')
+    if request and request.user and request.user.is_authenticated:
+        return request.user.organization
+    return None
+
+class ProductListSerializer(serializers.ListSerializer):
+    """
+    List serializer for products that batch loads images, sizes, completed order
+    quantities and stock for the whole list before rendering each product.
+    """
+
+    def to_representation(self, data):
+        products = list(data.all() if isinstance(data, models.Manager) else data)
+        self.child._product_batch = ProductBatchLoader(
+            products,
+            organization=get_request_organization(self.context),
+            request=self.context.get('request')
+        )
+        return [self.child.to_representation(product) for product in products]
+
+class ProductBatchMixin:
+    """
+    Gives product serializers access to a ProductBatchLoader. When the serializer is
+    used on its own (not through ProductListSerializer) a loader is built for the
+    single product being serialized.
+    """
+
+    def get_product_batch(self, obj):
+        batch = getattr(self, '_product_batch', None)
+        if batch is None or obj not in batch:
+            batch = ProductBatchLoader(
+                [obj],
+                organization=get_request_organization(self.context),
+                request=self.context.get('request')
+            )
+            self._product_batch = batch
+        return batch
+
+class ProductSerializer(ProductBatchMixin, serializers.ModelSerializer):
     """
     Standard Serializer for the Product model.
     Includes all fields, including 'cost'. Used for suppliers/internal users.
@@ -35,6 +76,7 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
+        list_serializer_class = ProductListSerializer
         fields = [
             'id', 'name', 'sku', 'description', 'category', 'brand', 'price',
             'cost', 'image', 'barcode', 'digital', 'organization', 'active',
@@ -44,53 +86,20 @@ class ProductSerializer(serializers.ModelSerializer):
 
     def get_images(self, obj):
         request = self.context.get('request')
-        images = ProductImage.objects.filter(product=obj)
-        try:
-            return ProductImageSerializer(images, many=True, context={'request': request}).data
-        except ImportError:
-            return []
+        images = self.get_product_batch(obj).get_images(obj)
+        return ProductImageSerializer(images, many=True, context={'request': request}).data
 
     def get_sizes(self, obj):
-        sizes = ProductSize.objects.filter(product=obj)
-        try:
-            return ProductSizeSerializer(sizes, many=True).data
-        except ImportError:
-            return []
+        sizes = self.get_product_batch(obj).get_sizes(obj)
+        return ProductSizeSerializer(sizes, many=True).data
 
     def get_total_completed_orders(self, obj):
-        return obj.get_completed
+        return self.get_product_batch(obj).get_completed(obj)
 
     def get_is_available(self, obj):
-        request = self.context.get('request')
-        if request and request.user and request.user.is_authenticated:
-            user_organization = request.user.organization
-
-            if user_organization:
-                if obj.organization == user_organization:
-                     total_inventory = Inventory.objects.filter(
-                         product=obj,
-                         organization=user_organization
-                     ).aggregate(total_quantity=Sum('quantity'))['total_quantity']
-                     return total_inventory is not None and total_inventory > 0
-
-                if user_organization.organization_type in ['buyer', 'both']:
-                    is_accepted_supplier = OrganizationRelationship.objects.filter(
-                        buyer_organization=user_organization,
-                        supplier_organization=obj.organization,
-                        status='accepted'
-                    ).exists()
-
-                    if is_accepted_supplier:
-                        total_inventory = Inventory.objects.filter(
-                            product=obj,
-                            organization=obj.organization
-                        ).aggregate(total_quantity=Sum('quantity'))['total_quantity']
-
-                        return total_inventory is not None and total_inventory > 0
-
-        return False
-
-class BuyerSupplierProductSerializer(serializers.ModelSerializer):
+        return self.get_product_batch(obj).is_available(obj)
+
+class BuyerSupplierProductSerializer(ProductBatchMixin, serializers.ModelSerializer):
     """
     Serializer for buyers viewing supplier products.
     Excludes sensitive fields like 'cost'.
@@ -104,6 +113,7 @@ class BuyerSupplierProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
+        list_serializer_class = ProductListSerializer
         fields = [
             'id', 'name', 'sku', 'description', 'category', 'brand', 'price',
             'image', 'barcode', 'digital', 'organization', 'active',
@@ -113,59 +123,19 @@ class BuyerSupplierProductSerializer(serializers.ModelSerializer):
 
     def get_images(self, obj):
         request = self.context.get('request')
-        images = ProductImage.objects.filter(product=obj)
-        try:
-            return ProductImageSerializer(images, many=True, context={'request': request}).data
-        except ImportError:
-            return []
+        images = self.get_product_batch(obj).get_images(obj)
+        return ProductImageSerializer(images, many=True, context={'request': request}).data
 
     def get_sizes(self, obj):
-        sizes = ProductSize.objects.filter(product=obj)
-        try:
-            return ProductSizeSerializer(sizes, many=True).data
-        except ImportError:
-            return []
+        sizes = self.get_product_batch(obj).get_sizes(obj)
+        return ProductSizeSerializer(sizes, many=True).data
 
     def get_total_completed_orders(self, obj):
-        return obj.get_completed
+        return self.get_product_batch(obj).get_completed(obj)
 
     def get_is_available(self, obj):
-        print(f"--- get_is_available for Product ID: {obj.id} ---")
-        request = self.context.get('request')
-        if request and request.user and request.user.is_authenticated:
-            print(f"User authenticated: {request.user.email}")
-            user_organization = request.user.organization
-            print(f"User Organization: {user_organization.id if user_organization else 'None'}")
-
-            if user_organization:
-                if user_organization.organization_type in ['buyer', 'both']:
-                    print(f"User organization type is buyer/both: {user_organization.organization_type}")
-                    print(f"Checking relationship between Buyer Org {user_organization.id} and Supplier Org {obj.organization.id}")
-                    is_accepted_supplier = OrganizationRelationship.objects.filter(
-                        buyer_organization=user_organization,
-                        supplier_organization=obj.organization,
-                        status='accepted'
-                    ).exists()
-                    print(f"Is accepted supplier relationship exists: {is_accepted_supplier}")
-
-                    if is_accepted_supplier:
-                        print(f"Calculating total inventory for Product ID {obj.id} in Organization ID {obj.organization.id}")
-                        total_inventory = Inventory.objects.filter(
-                            product=obj,
-                            organization=obj.organization
-                        ).aggregate(total_quantity=Sum('quantity'))['total_quantity']
-                        print(f"Total inventory calculated: {total_inventory}")
-
-                        result = total_inventory is not None and total_inventory > 0
-                        print(f"Final is_available result: {result}")
-                        print("--- End get_is_available ---")
-                        return result
-                    else:
-                        print("No accepted supplier relationship found.")
-
-        print("Conditions not met for availability check.")
-        print("--- End get_is_available ---")
-        return False
+        # Buyers only see availability for products of accepted suppliers
+        return self.get_product_batch(obj).is_available(obj, include_own=False)
 
 class ProductCreateSerializer(serializers.ModelSerializer):
     cost = serializers.DecimalField(max_digits=10, decimal_places=2)
@@ -517,10 +487,8 @@ class   ManualInventoryAdjustmentItemSerializer(serializers.Serializer):
     """
     Serializer for a single item within a manual inventory adjustment request.
     """
-    inventory_id = serializers.PrimaryKeyRelatedField(
-        queryset=Inventory.objects.all(),
-        error_messages={'does_not_exist': 'Inventory item with ID {pk_value} does not exist.'}
-    )
+    # A plain ID: the parent serializer checks all IDs with one query instead of one per item
+    inventory_id = serializers.IntegerField(min_value=1)
     quantity = serializers.IntegerField(min_value=1)
     note = serializers.CharField(max_length=255, required=False, allow_blank=True, allow_null=True)
     reference = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
@@ -558,9 +526,9 @@ class ManualInventoryAdjustmentSerializer(serializers.Serializer):
         movement_type = data.get('movement_type')
         items_data = data.get('items')
 
-        inventory_ids = [item_data['inventory_id'].id for item_data in items_data]
+        inventory_ids = {item_data['inventory_id'] for item_data in items_data}
         # Fetch all requested inventory items in one query
-        inventory_items = Inventory.objects.filter(id__in=inventory_ids, organization=user_organization)
+        inventory_items = Inventory.objects.filter(id__in=inventory_ids, organization=user_organization).select_related('product', 'location')
 
         if len(inventory_items) != len(inventory_ids):
             # Find which IDs were not found or don't belong to the organization
@@ -576,9 +544,13 @@ class ManualInventoryAdjustmentSerializer(serializers.Serializer):
         # Check stock levels for removal/sale types
         if movement_type in ['removal', 'sale']:
             errors = {}
+            # Several lines may remove from the same inventory item
+            requested = {}
             for item_data in items_data:
-                inventory_id = item_data['inventory_id'].id
-                quantity_to_remove = item_data['quantity']
+                inventory_id = item_data['inventory_id']
+                requested[inventory_id] = requested.get(inventory_id, 0) + item_data['quantity']
+
+            for inventory_id, quantity_to_remove in requested.items():
                 inventory = inventory_dict[inventory_id]
 
                 if inventory.quantity < quantity_to_remove:
@@ -686,4 +658,11 @@ class AnalyticsDashboardSerializer(serializers.Serializer):
     sales_overview = SalesOverviewSerializer()
     inventory_summary = InventorySummarySerializer()
     # top_products_by_revenue = TopSellingProductSerializer(many=True) # Example: if you want to nest it
-    # top_products_by_units = TopSellingProductSerializer(many=True) # Example
\ No newline at end of file
+    # top_products_by_units = TopSellingProductSerializer(many=True) # Example
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ['id', 'message', 'notification_type', 'read_status', 'timestamp', 'related_object_type', 'related_object_id']
+        read_only_fields = fields
@@ -0,0 +1,49 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Product, Brand, Category, Inventory
+from . import search
+from .analytics_cache import invalidate_analytics
+
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, raw=False, **kwargs):
+    """Keeps the product search index in sync when a product is created or updated."""
+    if raw:
+        # Fixture loading; run rebuild_search_index afterwards
+        return
+    search.index_product(instance)
+    # Product costs go into the stock value of the inventory summary
+    invalidate_analytics(instance.organization_id)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+    invalidate_analytics(instance.organization_id)
+
+
+@receiver(post_save, sender=Brand)
+def reindex_brand_products(sender, instance, created=False, raw=False, **kwargs):
+    """Brand names are part of the product search document."""
+    if created or raw:
+        return
+    for product in Product.objects.filter(brand=instance).select_related('brand', 'category'):
+        search.index_product(product)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created=False, raw=False, **kwargs):
+    """Category names are part of the product search document."""
+    if created or raw:
+        return
+    for product in Product.objects.filter(category=instance).select_related('brand', 'category'):
+        search.index_product(product)
+
+
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+def invalidate_inventory_analytics(sender, instance, raw=False, **kwargs):
+    """Inventory rows edited directly (not through a stock movement) change the inventory summary."""
+    if raw:
+        return
+    invalidate_analytics(instance.organization_id)
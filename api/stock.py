@@ -0,0 +1,127 @@
+"""
+Bulk stock adjustments.
+
+Inventory.add_stock/remove_stock are right for single changes, but each call is an
+UPDATE, a movement INSERT and its own alert checks. A stock count with thousands
+of lines goes through apply_stock_adjustments instead, which locks the affected
+rows once, writes them back with one bulk_update, inserts all movements with one
+bulk_create and evaluates alerts once for the whole batch.
+"""
+import logging
+from django.db import transaction
+from django.utils import timezone
+from .models import Inventory, InventoryMovement, Notification
+from .analytics_cache import invalidate_analytics
+from .metrics import record_stock_movements
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 500
+
+# Direction of the quantity change for each movement type that changes stock
+MOVEMENT_SIGNS = {
+    'addition': 1,
+    'purchase': 1,
+    'removal': -1,
+    'sale': -1,
+}
+
+
+class InsufficientStockError(Exception):
+    """Raised when a batch would take an inventory item below zero."""
+
+    def __init__(self, inventory, requested):
+        self.inventory = inventory
+        self.requested = requested
+        super().__init__(
+            f"Insufficient stock for product '{inventory.product.name}' at '{inventory.location.name}'. "
+            f"Available: {inventory.quantity}, Requested: {requested}"
+        )
+
+
+def apply_stock_adjustments(organization, movement_type, items, user=None, check_alerts=True):
+    """
+    Applies a batch of stock changes of one movement type for the organization.
+
+    items is a list of dicts with inventory_id, quantity (absolute, > 0) and optional
+    note and reference. Items for the same inventory are applied in order, and every
+    movement records the quantity after it. Either the whole batch is applied or,
+    if any item would take stock below zero, nothing is (InsufficientStockError).
+    Returns the updated Inventory objects.
+    """
+    sign = MOVEMENT_SIGNS.get(movement_type)
+    if sign is None or not items:
+        return []
+
+    inventory_ids = {item['inventory_id'] for item in items}
+    now = timezone.now()
+
+    with transaction.atomic():
+        # Lock all affected rows up front; the quantities read here cannot change under us
+        inventories = (
+            Inventory.objects.select_for_update(of=('self',))
+            .select_related('product', 'location')
+            .filter(organization=organization, id__in=inventory_ids)
+            .in_bulk()
+        )
+        missing_ids = inventory_ids - set(inventories)
+        if missing_ids:
+            raise Inventory.DoesNotExist(f"Inventory items not found for this organization: {sorted(missing_ids)}")
+
+        movements = []
+        for item in items:
+            inventory = inventories[item['inventory_id']]
+            quantity_change = sign * item['quantity']
+            if inventory.quantity + quantity_change < 0:
+                raise InsufficientStockError(inventory, item['quantity'])
+
+            inventory.quantity += quantity_change
+            movements.append(InventoryMovement(
+                inventory=inventory,
+                movement_type=movement_type,
+                quantity_change=quantity_change,
+                quantity_after_movement=inventory.quantity,
+                user=user,
+                organization=organization,
+                note=item.get('note') or f"Manual {movement_type} of {item['quantity']} units",
+                reference=item.get('reference')
+            ))
+
+        update_fields = ['quantity', 'updated_at']
+        for inventory in inventories.values():
+            inventory.updated_at = now
+            if sign > 0:
+                inventory.last_stocked = now
+            elif movement_type == 'sale':
+                inventory.last_sold = now
+        if sign > 0:
+            update_fields.append('last_stocked')
+        elif movement_type == 'sale':
+            update_fields.append('last_sold')
+
+        Inventory.objects.bulk_update(inventories.values(), update_fields, batch_size=BULK_BATCH_SIZE)
+        InventoryMovement.objects.bulk_create(movements, batch_size=BULK_BATCH_SIZE)
+        invalidate_analytics(organization.id)
+
+    record_stock_movements(movements)
+    updated = list(inventories.values())
+    logger.debug('Applied stock adjustments', extra={'movement_type': movement_type, 'movements': len(movements), 'inventories': len(updated)})
+
+    if check_alerts:
+        evaluate_stock_alerts(updated, user=user, check_overstock=sign > 0)
+    return updated
+
+
+def evaluate_stock_alerts(inventories, user=None, check_overstock=True):
+    """
+    Checks a batch of inventory items for low and overstock levels once, after all
+    changes are applied, instead of after every single change.
+    """
+    low_stock = [inventory for inventory in inventories if inventory.is_low_stock]
+    overstock = [inventory for inventory in inventories if inventory.is_overstock] if check_overstock else []
+    logger.debug('Stock alerts evaluated', extra={'inventories': len(inventories), 'low_stock': len(low_stock), 'overstock': len(overstock)})
+
+    if low_stock:
+        Notification.create_low_stock_notifications(low_stock, user=user)
+    if overstock:
+        Notification.create_overstock_notifications(overstock, user=user)
@@ -1,3 +1,1688 @@
-from django.test import TestCase
+from decimal import Decimal
+from urllib.parse import urlsplit, parse_qsl
+import asyncio
+import base64
+import contextlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from django.core import mail
+from django.core.management import call_command, CommandError
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.models import Organization, OrganizationRelationship, User
+from stocksync.logs import StructuredFormatter, build_logging_config, parse_log_levels
+from .models import (
+    Product, ProductImage, ProductSize, Size, Location, Inventory, InventoryMovement, Order, OrderItem, Brand,
+    Notification, Buyer, OutboundEmail, DailySalesRollup, DailyOrderRollup, Supplier, Sequence, ShippingAddress,
+    StockAlertState, Communication, UnreadCounter
+)
+from .views import (
+    ProductAPIView, ProductSearchView, InventoryListView, InventoryMovementListView, ManualInventoryAdjustmentView,
+    ProcessOrderView, AnalyticsDashboardView, SalesTrendAnalyticsView, TopSellingProductsAnalyticsView, CartDataView,
+    updateCartView, UnAuthProcessOrderView, NotificationListView, UnreadCountView, MarkReadView
+)
+from .checkout import process_checkout, _resolve_supplier_inventories
+from .utils import cookieCart
+from .notifications import send_stock_alert_digests
+from .unread import reconcile_unread_counters
+from .mail import queue_email, send_queued_emails
+from .aggregation import get_sales_overview, get_sales_trend, get_top_selling_products, get_inventory_summary
+from .search import search_product_ids
+from .analytics_cache import get_analytics_cache, AnalyticsCache
+from .sequences import next_sequence_value, reset_sequence_blocks
+from .identifiers import TransactionIdGenerator, generate_transaction_id, get_transaction_id_time, CROCKFORD_ALPHABET
+from .models import generate_unique_transaction_id
+from .metrics import Registry, Counter, Histogram, STOCK_MOVEMENTS, CACHE_REQUESTS
+from .stock import apply_stock_adjustments
+from .datagen import generate_dataset
+from .benchmark_suite import run_benchmarks, compare_results
+from .fixture_loader import iter_fixture_objects, load_fixtures, models_in_dependency_order
 
 # Create your tests here.
+
+
+class CatalogTestMixin:
+    """Helpers to build a supplier catalog and the users that browse it."""
+
+    def create_organization(self, name, organization_type):
+        return Organization.objects.create(name=name, organization_type=organization_type, active_status=True)
+
+    def create_user(self, organization, email, role='admin'):
+        return User.objects.create_user(
+            email=email,
+            username=email.split('@')[0],
+            password='password',
+            organization=organization,
+            role=role
+        )
+
+    def create_products(self, organization, count, location=None, delivered_orders=False):
+        location = location or Location.objects.get_or_create(name='Main', organization=organization)[0]
+        size, _ = Size.objects.get_or_create(name='M')
+        order = None
+        if delivered_orders:
+            order = Order.objects.create(organization=organization, status='delivered')
+        products = []
+        start = Product.objects.filter(organization=organization).count()
+        for index in range(start, start + count):
+            product = Product.objects.create(
+                name=f'{organization.name} Product {index:04d}',
+                sku=f'{organization.id}-SKU-{index:04d}',
+                price=Decimal('10.00'),
+                cost=Decimal('6.00'),
+                organization=organization
+            )
+            ProductImage.objects.create(product=product, color='red', image='images/variants/shirt-red.jpg')
+            ProductSize.objects.create(product=product, size=size)
+            Inventory.objects.create(product=product, location=location, organization=organization, quantity=10)
+            if order is not None:
+                OrderItem.objects.create(order=order, product=product, quantity=2, unit_price=product.price, organization=organization)
+            products.append(product)
+        return products
+
+
+class ProductSerializerBatchLoadingTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.supplier_org = self.create_organization('Supplier Org', 'supplier')
+        self.buyer_org = self.create_organization('Buyer Org', 'buyer')
+        self.supplier_user = self.create_user(self.supplier_org, 'supplier@example.com')
+        self.buyer_user = self.create_user(self.buyer_org, 'buyer@example.com')
+        OrganizationRelationship.objects.create(
+            buyer_organization=self.buyer_org,
+            supplier_organization=self.supplier_org,
+            status='accepted'
+        )
+
+    def get_products(self, user):
+        request = self.factory.get('/api/products/', {'page_size': 100})
+        force_authenticate(request, user=user)
+        with CaptureQueriesContext(connection) as queries:
+            response = ProductAPIView.as_view()(request)
+            response.render()
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.create_products(self.supplier_org, 2, delivered_orders=True)
+        response, small_page_queries = self.get_products(self.supplier_user)
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.create_products(self.supplier_org, 20, delivered_orders=True)
+        response, large_page_queries = self.get_products(self.supplier_user)
+        self.assertEqual(len(response.data['results']), 22)
+
+        self.assertEqual(small_page_queries, large_page_queries)
+
+    def test_buyer_query_count_does_not_grow_with_page_size(self):
+        self.create_products(self.supplier_org, 2)
+        _, small_page_queries = self.get_products(self.buyer_user)
+
+        self.create_products(self.supplier_org, 20)
+        response, large_page_queries = self.get_products(self.buyer_user)
+        self.assertEqual(len(response.data['results']), 22)
+
+        self.assertEqual(small_page_queries, large_page_queries)
+
+    def test_batched_values_match_product_data(self):
+        product = self.create_products(self.supplier_org, 1, delivered_orders=True)[0]
+        response, _ = self.get_products(self.supplier_user)
+        data = response.data['results'][0]
+
+        self.assertEqual(data['id'], product.id)
+        self.assertEqual(len(data['images']), 1)
+        self.assertEqual(data['images'][0]['color'], 'red')
+        self.assertEqual(data['sizes'], [{'size': {'name': 'M'}}])
+        self.assertEqual(data['total_completed_orders'], product.get_completed)
+        self.assertTrue(data['is_available'])
+
+    def test_buyer_availability_requires_stock(self):
+        product = self.create_products(self.supplier_org, 1)[0]
+        Inventory.objects.filter(product=product).update(quantity=0)
+
+        response, _ = self.get_products(self.buyer_user)
+        self.assertFalse(response.data['results'][0]['is_available'])
+        self.assertNotIn('cost', response.data['results'][0])
+
+
+class ProductSearchIndexTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.organization = self.create_organization('Search Org', 'supplier')
+        self.other_organization = self.create_organization('Other Search Org', 'supplier')
+        self.user = self.create_user(self.organization, 'search@example.com')
+        self.brand = Brand.objects.create(name='Acme', organization=self.organization)
+        self.jacket = Product.objects.create(
+            name='Leather Jacket', sku='JKT-001', description='Warm winter wear',
+            price=Decimal('99.00'), cost=Decimal('50.00'), organization=self.organization, brand=self.brand
+        )
+        self.scarf = Product.objects.create(
+            name='Wool Scarf', sku='SCF-001', description='Goes well with a leather jacket',
+            price=Decimal('19.00'), cost=Decimal('8.00'), organization=self.organization
+        )
+        self.foreign_jacket = Product.objects.create(
+            name='Leather Jacket', sku='OTHER-JKT', price=Decimal('99.00'), cost=Decimal('50.00'),
+            organization=self.other_organization
+        )
+
+    def search(self, query):
+        request = self.factory.get('/api/search/', {'q': query})
+        force_authenticate(request, user=self.user)
+        response = ProductSearchView.as_view()(request)
+        return [product['id'] for product in response.data]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('leather jacket'), [self.jacket.id, self.scarf.id])
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.search('leat'), [self.jacket.id, self.scarf.id])
+        self.assertEqual(self.search('scf'), [self.scarf.id])
+
+    def test_typo_tolerance(self):
+        self.assertEqual(self.search('lether'), [self.jacket.id, self.scarf.id])
+
+    def test_brand_and_category_are_indexed(self):
+        self.assertEqual(self.search('acme'), [self.jacket.id])
+        self.brand.name = 'Globex'
+        self.brand.save()
+        self.assertEqual(self.search('globex'), [self.jacket.id])
+        self.assertEqual(self.search('acme'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.scarf.name = 'Cashmere Scarf'
+        self.scarf.save()
+        self.assertEqual(self.search('cashmere'), [self.scarf.id])
+
+        self.scarf.delete()
+        self.assertEqual(self.search('cashmere'), [])
+        self.assertEqual(search_product_ids('jacket', [self.organization.id]), [self.jacket.id])
+
+    def test_search_is_scoped_to_organizations(self):
+        self.assertEqual(search_product_ids('jacket', [self.other_organization.id]), [self.foreign_jacket.id])
+
+
+class KeysetPaginationTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.organization = self.create_organization('Paging Org', 'supplier')
+        self.user = self.create_user(self.organization, 'paging@example.com')
+
+    def get(self, view, url, params=None):
+        request = self.factory.get(url, params or {})
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = view.as_view()(request)
+            response.render()
+        return response, len(queries)
+
+    def walk(self, view, url, page_size):
+        """Follows next links from the first page and returns ids of all pages and their query counts."""
+        ids, query_counts = [], []
+        params = {'page_size': page_size}
+        while True:
+            response, query_count = self.get(view, url, params)
+            ids.append([row['id'] for row in response.data['results']])
+            query_counts.append(query_count)
+            if not response.data['next']:
+                return ids, query_counts, response
+            params = self.link_params(response.data['next'])
+
+    def link_params(self, link):
+        return dict(parse_qsl(urlsplit(link).query))
+
+    def test_products_are_paged_in_name_order(self):
+        products = self.create_products(self.organization, 7)
+        # Duplicate names are ordered by primary key
+        Product.objects.filter(id=products[3].id).update(name=products[2].name)
+
+        pages, query_counts, last_response = self.walk(ProductAPIView, '/api/products/', 3)
+
+        expected = list(Product.objects.order_by('name', 'id').values_list('id', flat=True))
+        self.assertEqual([product_id for page in pages for product_id in page], expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertIsNotNone(last_response.data['previous'])
+        # Deep pages cost the same number of queries as later ones
+        self.assertEqual(query_counts[1], query_counts[2])
+
+    def test_previous_link_returns_the_previous_page(self):
+        self.create_products(self.organization, 5)
+        first, _ = self.get(ProductAPIView, '/api/products/', {'page_size': 2})
+        self.assertIsNone(first.data['previous'])
+        second, _ = self.get(ProductAPIView, '/api/products/', self.link_params(first.data['next']))
+        back, _ = self.get(ProductAPIView, '/api/products/', self.link_params(second.data['previous']))
+        self.assertEqual([row['id'] for row in back.data['results']], [row['id'] for row in first.data['results']])
+
+    def test_inventory_is_paged_by_product_and_location(self):
+        second_location = Location.objects.create(name='Annex', organization=self.organization)
+        products = self.create_products(self.organization, 3)
+        for product in products:
+            Inventory.objects.create(product=product, location=second_location, organization=self.organization, quantity=1)
+
+        pages, _, _ = self.walk(InventoryListView, '/api/inventory/', 2)
+
+        expected = list(Inventory.objects.order_by('product__name', 'location__name', 'id').values_list('id', flat=True))
+        self.assertEqual([inventory_id for page in pages for inventory_id in page], expected)
+
+    def test_movements_are_paged_newest_first(self):
+        product = self.create_products(self.organization, 1)[0]
+        inventory = Inventory.objects.get(product=product)
+        for quantity in range(1, 6):
+            InventoryMovement.objects.create(
+                inventory=inventory, movement_type='addition', quantity_change=quantity,
+                organization=self.organization
+            )
+
+        pages, _, _ = self.walk(InventoryMovementListView, '/api/inventory-movements/', 2)
+
+        expected = list(InventoryMovement.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+        self.assertEqual([movement_id for page in pages for movement_id in page], expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        response, _ = self.get(ProductAPIView, '/api/products/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_values_of_the_wrong_type_are_rejected(self):
+        self.create_products(self.organization, 2)
+        for view, url, position in (
+            (ProductAPIView, '/api/products/', ['x', 'abc']),
+            (ProductAPIView, '/api/products/', ['x', None]),
+            (ProductAPIView, '/api/products/', [['x'], 1]),
+            (InventoryMovementListView, '/api/inventory-movements/', ['not a date', 1]),
+        ):
+            cursor = base64.urlsafe_b64encode(json.dumps({'p': position}).encode()).decode()
+            response, _ = self.get(view, url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+        # A well-formed cursor past the last row still gets a link back
+        cursor = base64.urlsafe_b64encode(json.dumps({'p': ['2000-01-01T00:00:00+00:00', 1]}).encode()).decode()
+        response, _ = self.get(InventoryMovementListView, '/api/inventory-movements/', {'cursor': cursor})
+        self.assertEqual((response.status_code, response.data['results']), (200, []))
+        self.assertIsNotNone(response.data['previous'])
+
+
+class InventoryStockMutationTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.organization = self.create_organization('Stock Org', 'supplier')
+        self.product = self.create_products(self.organization, 1)[0]
+        self.inventory = Inventory.objects.get(product=self.product)
+
+    def test_stale_instances_do_not_lose_updates(self):
+        other_copy = Inventory.objects.get(pk=self.inventory.pk)
+        self.inventory.remove_stock(3)
+        other_copy.remove_stock(4)
+
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 3)
+        self.assertEqual(other_copy.quantity, 3)
+        self.assertEqual(
+            list(self.inventory.movements.order_by('id').values_list('quantity_change', 'quantity_after_movement')),
+            [(-3, 7), (-4, 3)]
+        )
+
+    def test_remove_stock_never_goes_below_zero(self):
+        self.assertIsNone(self.inventory.remove_stock(11))
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 10)
+        self.assertFalse(self.inventory.movements.exists())
+
+    def test_sale_sets_last_sold(self):
+        movement = self.inventory.remove_stock(2, movement_type='sale')
+        self.assertEqual(movement.movement_type, 'sale')
+        self.inventory.refresh_from_db()
+        self.assertIsNotNone(self.inventory.last_sold)
+
+    def test_add_stock_only_writes_changed_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.inventory.add_stock(5, check_alerts=False)
+        update_sql = next(query['sql'] for query in queries if query['sql'].startswith('UPDATE'))
+        self.assertNotIn('"min_stock_level"', update_sql)
+        self.assertNotIn('"product_id"', update_sql)
+
+
+class ConcurrentStockMutationTests(CatalogTestMixin, TransactionTestCase):
+    """Hammers one inventory row from several threads, each with its own connection."""
+
+    workers = 8
+    removals_per_worker = 5
+
+    def test_concurrent_removals_keep_movements_consistent(self):
+        organization = self.create_organization('Concurrent Org', 'supplier')
+        product = self.create_products(organization, 1)[0]
+        inventory = Inventory.objects.get(product=product)
+        # Fewer units than requested, so some removals have to be refused
+        Inventory.objects.filter(pk=inventory.pk).update(quantity=30)
+        errors = []
+        start = threading.Barrier(self.workers)
+
+        def worker():
+            try:
+                start.wait()
+                for _ in range(self.removals_per_worker):
+                    Inventory.objects.get(pk=inventory.pk).remove_stock(1, check_alerts=False)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        inventory.refresh_from_db()
+        movements = list(inventory.movements.values_list('quantity_change', 'quantity_after_movement'))
+        self.assertEqual(inventory.quantity, 0)
+        self.assertEqual(len(movements), 30)
+        # Every movement saw a distinct quantity: no two removals read the same stock level
+        self.assertEqual(sorted(after for _, after in movements), list(range(30)))
+
+
+class BulkInventoryAdjustmentTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.organization = self.create_organization('Count Org', 'supplier')
+        self.user = self.create_user(self.organization, 'count@example.com')
+        self.products = self.create_products(self.organization, 30)
+        self.inventories = list(Inventory.objects.filter(organization=self.organization).order_by('id'))
+
+    def adjust(self, movement_type, items):
+        request = self.factory.post('/api/inventory/adjust/', {'movement_type': movement_type, 'items': items}, format='json')
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = ManualInventoryAdjustmentView.as_view()(request)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        _, small_batch_queries = self.adjust('removal', [
+            {'inventory_id': inventory.id, 'quantity': 1} for inventory in self.inventories[:3]
+        ])
+        response, large_batch_queries = self.adjust('removal', [
+            {'inventory_id': inventory.id, 'quantity': 1} for inventory in self.inventories
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(small_batch_queries, large_batch_queries)
+        self.assertEqual(InventoryMovement.objects.count(), 33)
+
+    def test_lines_for_the_same_item_are_applied_in_order(self):
+        inventory = self.inventories[0]
+        response, _ = self.adjust('sale', [
+            {'inventory_id': inventory.id, 'quantity': 2, 'reference': 'count-1'},
+            {'inventory_id': inventory.id, 'quantity': 3, 'reference': 'count-2'},
+        ])
+        self.assertEqual(response.status_code, 200)
+
+        inventory.refresh_from_db()
+        self.assertEqual(inventory.quantity, 5)
+        self.assertIsNotNone(inventory.last_sold)
+        self.assertEqual(
+            list(inventory.movements.order_by('id').values_list('movement_type', 'quantity_change', 'quantity_after_movement', 'reference')),
+            [('sale', -2, 8, 'count-1'), ('sale', -3, 5, 'count-2')]
+        )
+
+    def test_insufficient_stock_rejects_the_whole_batch(self):
+        response, _ = self.adjust('removal', [
+            {'inventory_id': self.inventories[0].id, 'quantity': 1},
+            {'inventory_id': self.inventories[1].id, 'quantity': 6},
+            {'inventory_id': self.inventories[1].id, 'quantity': 6},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(Inventory.objects.values_list('quantity', flat=True)), {10})
+        self.assertFalse(InventoryMovement.objects.exists())
+
+    def test_overstock_alerts_are_created_once_per_item(self):
+        response, _ = self.adjust('addition', [
+            {'inventory_id': self.inventories[0].id, 'quantity': 50},
+            {'inventory_id': self.inventories[0].id, 'quantity': 50},
+            {'inventory_id': self.inventories[1].id, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 200)
+        alerts = Notification.objects.filter(notification_type='overstock')
+        self.assertEqual(list(alerts.values_list('related_object_id', 'user_id')), [(self.inventories[0].id, self.user.id)])
+
+
+class CheckoutEngineTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.supplier_org = self.create_organization('Checkout Supplier', 'supplier')
+        self.buyer_org = self.create_organization('Checkout Buyer', 'buyer')
+        self.buyer_user = self.create_user(self.buyer_org, 'checkout@example.com')
+        self.buyer_location = Location.objects.create(name='Store', organization=self.buyer_org)
+        self.buyer = Buyer.objects.create(user=self.buyer_user, name='Checkout Buyer', buyer_code='CHK-BUYER')
+
+    def create_order(self, products, quantity=2):
+        order = Order.objects.create(organization=self.supplier_org, customer=self.buyer, status='pending')
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, unit_price=product.price, organization=self.supplier_org)
+        return order
+
+    def checkout(self, order):
+        with CaptureQueriesContext(connection) as queries:
+            movements = process_checkout(order, self.buyer_org, self.buyer_location, user=self.buyer_user)
+        return movements, len(queries)
+
+    def test_query_count_does_not_grow_with_order_lines(self):
+        _, small_order_queries = self.checkout(self.create_order(self.create_products(self.supplier_org, 2)))
+        movements, large_order_queries = self.checkout(self.create_order(self.create_products(self.supplier_org, 20)))
+        self.assertEqual(small_order_queries, large_order_queries)
+        self.assertEqual(len(movements), 40)
+
+    def test_checkout_moves_stock_and_records_movements(self):
+        products = self.create_products(self.supplier_org, 2)
+        # The buyer already stocks the first product
+        Inventory.objects.create(product=products[0], location=self.buyer_location, organization=self.buyer_org, quantity=4)
+        order = self.create_order(products, quantity=3)
+        self.checkout(order)
+
+        self.assertEqual(
+            list(Inventory.objects.filter(organization=self.supplier_org).order_by('product_id').values_list('quantity', flat=True)),
+            [7, 7]
+        )
+        self.assertEqual(
+            list(Inventory.objects.filter(organization=self.buyer_org).order_by('product_id').values_list('quantity', flat=True)),
+            [7, 3]
+        )
+        self.assertEqual(
+            sorted(InventoryMovement.objects.values_list('movement_type', 'quantity_change', 'quantity_after_movement', 'organization_id')),
+            [('purchase', 3, 3, self.buyer_org.id), ('purchase', 3, 7, self.buyer_org.id),
+             ('sale', -3, 7, self.supplier_org.id), ('sale', -3, 7, self.supplier_org.id)]
+        )
+
+    def test_insufficient_stock_rolls_back_the_order(self):
+        products = self.create_products(self.supplier_org, 2)
+        Inventory.objects.filter(product=products[1]).update(quantity=1)
+        order = self.create_order(products)
+
+        request = self.factory.post('/api/process_order/', {'total': str(order.get_cart_total), 'shipping_info': {}}, format='json')
+        force_authenticate(request, user=self.buyer_user)
+        response = ProcessOrderView.as_view()(request)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Insufficient stock', response.data['detail'])
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+        self.assertEqual(
+            list(Inventory.objects.filter(organization=self.supplier_org).order_by('product_id').values_list('quantity', flat=True)),
+            [10, 1]
+        )
+        self.assertFalse(InventoryMovement.objects.exists())
+        self.assertFalse(Inventory.objects.filter(organization=self.buyer_org).exists())
+
+    def test_supplier_rows_removed_during_checkout_are_a_conflict(self):
+        products = self.create_products(self.supplier_org, 2)
+        order = self.create_order(products)
+
+        def resolve_then_remove(product_ids):
+            inventories = _resolve_supplier_inventories(product_ids)
+            # Another request deletes a row between the lookup and the stock update
+            Inventory.objects.filter(product=products[1], organization=self.supplier_org).delete()
+            return inventories
+
+        request = self.factory.post('/api/process_order/', {'total': str(order.get_cart_total), 'shipping_info': {}}, format='json')
+        force_authenticate(request, user=self.buyer_user)
+        with mock.patch('api.checkout._resolve_supplier_inventories', resolve_then_remove):
+            response = ProcessOrderView.as_view()(request)
+
+        self.assertEqual(response.status_code, 409)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+        self.assertEqual(Inventory.objects.get(product=products[0], organization=self.supplier_org).quantity, 10)
+        self.assertFalse(InventoryMovement.objects.exists())
+
+    def test_confirmation_email_is_queued_not_sent(self):
+        order = self.create_order(self.create_products(self.supplier_org, 1))
+
+        request = self.factory.post('/api/process_order/', {'total': str(order.get_cart_total), 'shipping_info': {}}, format='json')
+        force_authenticate(request, user=self.buyer_user)
+        response = ProcessOrderView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.to, email.status, email.related_object_id), ([self.buyer_user.email], 'pending', order.id))
+
+
+class FailingConnection:
+    """Email connection stand-in whose sends fail for the given recipients."""
+
+    def __init__(self, failing_recipients=(), fail_open=False):
+        self.failing_recipients = set(failing_recipients)
+        self.fail_open = fail_open
+        self.opened = 0
+        self.sent = []
+
+    def open(self):
+        if self.fail_open:
+            raise ConnectionRefusedError('SMTP server unavailable')
+        self.opened += 1
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        for message in messages:
+            if self.failing_recipients.intersection(message.to):
+                raise ConnectionResetError('Recipient rejected')
+            self.sent.append(message)
+        return len(messages)
+
+
+class OutboundEmailQueueTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.organization = self.create_organization('Mail Org', 'supplier')
+        self.organization.email_sent = False
+        self.organization.save()
+
+    def test_worker_sends_batch_to_sent_emails_directory(self):
+        for index in range(3):
+            queue_email(f'Subject {index}', '<p>Hello</p>', f'user{index}@example.com', content_subtype='html')
+        queue_email('Activate', 'Please activate', 'owner@example.com', related_object=self.organization)
+
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(EMAIL_BACKEND='django.core.mail.backends.filebased.EmailBackend', EMAIL_FILE_PATH=directory):
+                call_command('send_queued_emails', stdout=open(os.devnull, 'w'))
+            # One connection for the whole batch means one file
+            files = os.listdir(directory)
+            self.assertEqual(len(files), 1)
+            with open(os.path.join(directory, files[0])) as sent_file:
+                contents = sent_file.read()
+
+        self.assertEqual(contents.count('Subject: '), 4)
+        self.assertIn('text/html', contents)
+        self.assertEqual(set(OutboundEmail.objects.values_list('status', flat=True)), {'sent'})
+        self.organization.refresh_from_db()
+        self.assertTrue(self.organization.email_sent)
+
+    def test_failures_are_retried_with_backoff(self):
+        good = queue_email('Ok', 'Body', 'good@example.com')
+        bad = queue_email('Bounce', 'Body', 'bad@example.com')
+        connection = FailingConnection(failing_recipients=['bad@example.com'])
+
+        self.assertEqual(send_queued_emails(connection=connection), (1, 1))
+        self.assertEqual(connection.opened, 1)
+        good.refresh_from_db()
+        bad.refresh_from_db()
+        self.assertEqual(good.status, 'sent')
+        self.assertEqual((bad.status, bad.attempts), ('pending', 1))
+        first_delay = bad.next_attempt_at - timezone.now()
+        self.assertGreater(first_delay, timedelta(seconds=50))
+
+        # Not due yet
+        self.assertEqual(send_queued_emails(connection=connection), (0, 0))
+
+        OutboundEmail.objects.filter(id=bad.id).update(next_attempt_at=timezone.now())
+        send_queued_emails(connection=connection)
+        bad.refresh_from_db()
+        self.assertEqual(bad.attempts, 2)
+        self.assertGreater(bad.next_attempt_at - timezone.now(), first_delay)
+
+    @override_settings(OUTBOUND_EMAIL_MAX_ATTEMPTS=2)
+    def test_unreachable_server_returns_batch_and_gives_up_after_max_attempts(self):
+        email = queue_email('Hello', 'Body', 'user@example.com')
+        connection = FailingConnection(fail_open=True)
+
+        with self.assertLogs('api.mail', 'INFO') as logs:
+            self.assertEqual(send_queued_emails(connection=connection), (0, 1))
+            OutboundEmail.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+            send_queued_emails(connection=connection)
+
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', 2))
+        self.assertIn('SMTP server unavailable', email.last_error)
+        # A retry, then giving up; identified by ID, without the address
+        self.assertEqual([(record.levelname, record.email_id) for record in logs.records], [('WARNING', email.id), ('ERROR', email.id)])
+        self.assertFalse([record for record in logs.records if 'user@example.com' in record.getMessage()])
+
+    def test_stale_claims_are_picked_up_again(self):
+        email = queue_email('Hello', 'Body', 'user@example.com')
+        OutboundEmail.objects.filter(id=email.id).update(status='sending', locked_at=timezone.now())
+        self.assertEqual(send_queued_emails(connection=FailingConnection()), (0, 0))
+
+        OutboundEmail.objects.filter(id=email.id).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(send_queued_emails(connection=FailingConnection()), (1, 0))
+
+
+class DailySalesRollupTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.supplier_org = self.create_organization('Rollup Supplier', 'supplier')
+        self.other_supplier = self.create_organization('Other Rollup Supplier', 'supplier')
+        self.products = self.create_products(self.supplier_org, 2)
+        self.other_product = self.create_products(self.other_supplier, 1)[0]
+
+    def create_order(self, lines, status='pending'):
+        order = Order.objects.create(organization=self.supplier_org, status=status)
+        for product, quantity in lines:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, unit_price=product.price, organization=self.supplier_org)
+        return order
+
+    def rollup(self):
+        return sorted(DailySalesRollup.objects.values_list('product_id', 'units_sold', 'revenue', 'cogs'))
+
+    def test_order_is_rolled_up_when_completed(self):
+        order = self.create_order([(self.products[0], 2), (self.products[1], 1), (self.other_product, 3)])
+        self.assertFalse(DailySalesRollup.objects.exists())
+
+        order.status = 'completed'
+        order.save()
+        self.assertEqual(self.rollup(), [
+            (self.products[0].id, 2, Decimal('20.00'), Decimal('12.00')),
+            (self.products[1].id, 1, Decimal('10.00'), Decimal('6.00')),
+            (self.other_product.id, 3, Decimal('30.00'), Decimal('18.00')),
+        ])
+        self.assertEqual(
+            sorted(DailyOrderRollup.objects.values_list('organization_id', 'order_count')),
+            [(self.supplier_org.id, 1), (self.other_supplier.id, 1)]
+        )
+
+        # completed -> delivered still counts once; canceling takes it out again
+        order.status = 'delivered'
+        order.save()
+        self.assertEqual(DailySalesRollup.objects.get(product=self.products[0]).units_sold, 2)
+        order.status = 'canceled'
+        order.save()
+        self.assertEqual(set(DailySalesRollup.objects.values_list('units_sold', flat=True)), {0})
+        self.assertEqual(set(DailyOrderRollup.objects.values_list('order_count', flat=True)), {0})
+
+    def test_saves_that_do_not_write_the_status_leave_the_rollup_alone(self):
+        order = self.create_order([(self.products[0], 2)])
+        order.status = 'completed'
+        order.save()
+        counted = self.rollup()
+
+        # Loaded without its status: saving other fields, or the status it already has, counts nothing again
+        partial = Order.objects.only('id', 'notes').get(pk=order.pk)
+        partial.notes = 'Gift wrap'
+        partial.save()
+        partial = Order.objects.only('id', 'order_date').get(pk=order.pk)
+        partial.status = 'delivered'
+        partial.save()
+        self.assertEqual(self.rollup(), counted)
+
+        # update_fields without status does not write the status changed in memory
+        pending = self.create_order([(self.products[1], 1)])
+        pending.status = 'completed'
+        pending.notes = 'Not yet'
+        pending.save(update_fields=['notes'])
+        self.assertEqual(self.rollup(), counted)
+        pending.save(update_fields=['status'])
+        self.assertEqual(DailySalesRollup.objects.get(product=self.products[1]).units_sold, 1)
+
+        # A deferred status is read back before leaving the counted statuses
+        partial = Order.objects.only('id', 'order_date').get(pk=order.pk)
+        partial.status = 'canceled'
+        partial.save()
+        self.assertEqual(DailySalesRollup.objects.get(product=self.products[0]).units_sold, 0)
+        Order.objects.only('id', 'order_date').get(pk=pending.pk).delete()
+        self.assertEqual(DailySalesRollup.objects.get(product=self.products[1]).units_sold, 0)
+
+    def test_line_changes_on_counted_orders_adjust_the_rollup(self):
+        order = self.create_order([(self.products[0], 2)], status='delivered')
+        item = order.items.get()
+        item.quantity = 5
+        item.save()
+        self.assertEqual(self.rollup(), [(self.products[0].id, 5, Decimal('50.00'), Decimal('30.00'))])
+
+        OrderItem.objects.create(order=order, product=self.products[1], quantity=1, unit_price=Decimal('10.00'), organization=self.supplier_org)
+        self.assertEqual(DailyOrderRollup.objects.get(organization=self.supplier_org).order_count, 1)
+
+        OrderItem.objects.get(pk=item.pk).delete()
+        self.assertEqual(DailySalesRollup.objects.get(product=self.products[0]).units_sold, 0)
+        self.assertEqual(DailyOrderRollup.objects.get(organization=self.supplier_org).order_count, 1)
+
+    def test_analytics_read_from_the_rollup(self):
+        self.create_order([(self.products[0], 2), (self.products[1], 1)], status='delivered')
+        self.create_order([(self.products[1], 4)], status='completed')
+        self.create_order([(self.products[0], 9)], status='pending')
+        start, end = timezone.now() - timedelta(days=1), timezone.now()
+
+        with self.assertNumQueries(2):
+            overview = get_sales_overview(self.supplier_org, start, end)
+        self.assertEqual(overview['total_revenue'], Decimal('70.00'))
+        self.assertEqual(overview['total_items_sold'], 7)
+        self.assertEqual(overview['total_orders'], 2)
+        self.assertEqual(overview['total_cogs'], Decimal('42.00'))
+
+        trend = get_sales_trend(self.supplier_org, start, end, 'day')
+        self.assertEqual([point['sales'] for point in trend], [Decimal('70.00')])
+        self.assertTrue(trend[0]['date'].endswith('T00:00:00+00:00'))
+
+        top = get_top_selling_products(self.supplier_org, start, end, by='units')
+        self.assertEqual([(row['product_id'], row['units_sold']) for row in top], [(self.products[1].id, 5), (self.products[0].id, 2)])
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self.create_order([(self.products[0], 2), (self.other_product, 1)], status='delivered')
+        order = self.create_order([(self.products[1], 3)])
+        order.status = 'completed'
+        order.save()
+        incremental = self.rollup()
+        incremental_orders = sorted(DailyOrderRollup.objects.values_list('organization_id', 'day', 'order_count'))
+
+        DailySalesRollup.objects.all().delete()
+        call_command('rebuild_sales_rollup', stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(self.rollup(), incremental)
+        self.assertEqual(sorted(DailyOrderRollup.objects.values_list('organization_id', 'day', 'order_count')), incremental_orders)
+
+    def test_inventory_summary_is_aggregated_in_the_database(self):
+        Inventory.objects.filter(product=self.products[0]).update(quantity=3)
+        self.create_order([(self.products[0], 30)], status='delivered')
+
+        with self.assertNumQueries(2):
+            summary = get_inventory_summary(self.supplier_org)
+        self.assertEqual(summary['total_stock_units'], 13)
+        self.assertEqual(summary['total_stock_value'], Decimal('78.00'))
+        self.assertEqual(summary['low_stock_items_count'], 1)
+        # 30 units at a cost of 6.00 over 30 days is 6.00 a day
+        self.assertEqual(summary['approx_days_on_hand'], Decimal('13'))
+
+
+class AnalyticsCacheTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        get_analytics_cache().clear()
+        self.factory = APIRequestFactory()
+        self.supplier_org = self.create_organization('Cached Supplier', 'supplier')
+        self.other_supplier = self.create_organization('Other Cached Supplier', 'supplier')
+        self.user = self.create_user(self.supplier_org, 'cached@example.com')
+        self.other_user = self.create_user(self.other_supplier, 'other-cached@example.com')
+        self.products = self.create_products(self.supplier_org, 2)
+        self.other_products = self.create_products(self.other_supplier, 1)
+
+    def get(self, view, user, params=None):
+        request = self.factory.get('/api/analytics/', params or {})
+        force_authenticate(request, user=user)
+        response = view.as_view()(request)
+        response.render()
+        return response
+
+    def complete_order(self, product, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(organization=product.organization, status='pending')
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, unit_price=product.price, organization=product.organization)
+            order.status = 'completed'
+            order.save()
+        return order
+
+    def test_repeated_polls_are_served_from_the_cache(self):
+        first = self.get(AnalyticsDashboardView, self.user, {'period': 'last_7_days'})
+        self.assertEqual((first['X-Cache'], first['X-Cache-Hits'], first['X-Cache-Misses']), ('MISS', '0', '2'))
+
+        with self.assertNumQueries(0):
+            second = self.get(AnalyticsDashboardView, self.user, {'period': 'last_7_days'})
+        self.assertEqual((second['X-Cache'], second['X-Cache-Hits'], second['X-Cache-Misses']), ('HIT', '2', '0'))
+        self.assertEqual(second.data['sales_overview']['total_orders'], first.data['sales_overview']['total_orders'])
+
+        # Other parameters are cached separately
+        self.assertEqual(self.get(TopSellingProductsAnalyticsView, self.user, {'by': 'units'})['X-Cache'], 'MISS')
+        self.assertEqual(self.get(TopSellingProductsAnalyticsView, self.user, {'by': 'revenue'})['X-Cache'], 'MISS')
+        self.assertEqual(self.get(TopSellingProductsAnalyticsView, self.user, {'by': 'units'})['X-Cache'], 'HIT')
+        self.assertEqual(self.get(SalesTrendAnalyticsView, self.user, {'interval': 'week'})['X-Cache'], 'MISS')
+        self.assertEqual(self.get(SalesTrendAnalyticsView, self.user, {'interval': 'week'})['X-Cache'], 'HIT')
+
+    def test_completed_order_invalidates_only_its_supplier(self):
+        self.get(AnalyticsDashboardView, self.user)
+        self.get(AnalyticsDashboardView, self.other_user)
+
+        self.complete_order(self.products[0], 3)
+
+        response = self.get(AnalyticsDashboardView, self.user)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['sales_overview']['total_items_sold'], 3)
+        self.assertEqual(self.get(AnalyticsDashboardView, self.other_user)['X-Cache'], 'HIT')
+
+    def test_inventory_movements_invalidate_the_summary(self):
+        before = self.get(AnalyticsDashboardView, self.user)
+        inventory = Inventory.objects.get(product=self.products[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.add_stock(5)
+        after = self.get(AnalyticsDashboardView, self.user)
+        self.assertEqual(after['X-Cache'], 'MISS')
+        self.assertEqual(
+            after.data['inventory_summary']['total_stock_units'],
+            before.data['inventory_summary']['total_stock_units'] + 5
+        )
+
+        # Not committed yet: the cached result stays in place
+        inventory.remove_stock(1)
+        self.assertEqual(self.get(AnalyticsDashboardView, self.user)['X-Cache'], 'HIT')
+
+
+class AsyncReadEndpointTests(CatalogTestMixin, TransactionTestCase):
+    """The async endpoints return what their sync counterparts return."""
+
+    def setUp(self):
+        get_analytics_cache().clear()
+        self.factory = APIRequestFactory()
+        self.supplier_org = self.create_organization('Async Supplier', 'supplier')
+        self.buyer_org = self.create_organization('Async Buyer', 'buyer')
+        self.supplier_user = self.create_user(self.supplier_org, 'async-supplier@example.com')
+        self.buyer_user = self.create_user(self.buyer_org, 'async-buyer@example.com')
+        OrganizationRelationship.objects.create(
+            buyer_organization=self.buyer_org, supplier_organization=self.supplier_org, status='accepted'
+        )
+        self.products = self.create_products(self.supplier_org, 3, delivered_orders=True)
+
+    def get_async(self, url, user=None, params=None):
+        headers = {'Authorization': f'JWT {AccessToken.for_user(user)}'} if user else {}
+        return asyncio.run(AsyncClient().get(url, params or {}, headers=headers))
+
+    def get_sync(self, view, user, params=None):
+        request = self.factory.get('/api/', params or {})
+        force_authenticate(request, user=user)
+        response = view.as_view()(request)
+        response.render()
+        return json.loads(response.content)
+
+    def test_product_and_inventory_lists_match_the_sync_views(self):
+        for user in (self.supplier_user, self.buyer_user):
+            response = self.get_async('/api/async/products/', user)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['results'], self.get_sync(ProductAPIView, user)['results'])
+
+            response = self.get_async('/api/async/inventory/', user)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['results'], self.get_sync(InventoryListView, user)['results'])
+
+    def test_async_lists_are_keyset_paginated(self):
+        first = self.get_async('/api/async/products/', self.supplier_user, {'page_size': 2}).json()
+        self.assertEqual([row['name'] for row in first['results']], [product.name for product in self.products[:2]])
+        second = self.get_async('/api/async/products/', self.supplier_user, dict(parse_qsl(urlsplit(first['next']).query))).json()
+        self.assertEqual([row['name'] for row in second['results']], [self.products[2].name])
+        self.assertIsNone(second['next'])
+
+        self.assertEqual(self.get_async('/api/async/products/', self.supplier_user, {'cursor': 'garbage'}).status_code, 404)
+
+    def test_cart_matches_the_sync_view(self):
+        buyer = Buyer.objects.create(user=self.buyer_user, name='Async Buyer', buyer_code='ASYNC-1', organization=self.buyer_org)
+        order = Order.objects.create(organization=self.buyer_org, customer=buyer, status='pending')
+        OrderItem.objects.create(order=order, product=self.products[0], quantity=2, unit_price=Decimal('10.00'), organization=self.buyer_org)
+
+        response = self.get_async('/api/async/cart-data/', self.buyer_user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.get_sync(CartDataView, self.buyer_user))
+
+    def test_dashboard_matches_the_sync_view(self):
+        response = self.get_async('/api/async/analytics/dashboard/', self.supplier_user, {'period': 'last_7_days'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        data = response.json()
+        self.assertEqual(data['sales_overview']['total_items_sold'], 6)
+        expected = self.get_sync(AnalyticsDashboardView, self.supplier_user, {'period': 'last_7_days'})
+        self.assertEqual(data['inventory_summary'], expected['inventory_summary'])
+        self.assertEqual(data['sales_overview']['total_revenue'], expected['sales_overview']['total_revenue'])
+
+        trend = self.get_async('/api/async/analytics/sales-trend/', self.supplier_user, {'interval': 'month'})
+        self.assertEqual(trend.json(), self.get_sync(SalesTrendAnalyticsView, self.supplier_user, {'interval': 'month'}))
+        top = self.get_async('/api/async/analytics/top-products/', self.supplier_user, {'by': 'units', 'limit': 2})
+        self.assertEqual(top.json(), self.get_sync(TopSellingProductsAnalyticsView, self.supplier_user, {'by': 'units', 'limit': 2}))
+
+    def test_authentication_and_permissions(self):
+        self.assertEqual(self.get_async('/api/async/products/').status_code, 401)
+        response = asyncio.run(AsyncClient().get('/api/async/products/', headers={'Authorization': 'JWT not-a-token'}))
+        self.assertEqual(response.status_code, 401)
+
+        loner = User.objects.create_user(email='async-loner@example.com', username='async-loner', password='password')
+        self.assertEqual(self.get_async('/api/async/analytics/dashboard/', loner).status_code, 400)
+        self.assertEqual(self.get_async('/api/async/products/', loner).json()['results'], [])
+
+
+class SequenceAllocationTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        reset_sequence_blocks()
+        self.org1 = self.create_organization('Sequence Org 1', 'supplier')
+        self.org2 = self.create_organization('Sequence Org 2', 'supplier')
+
+    def tearDown(self):
+        reset_sequence_blocks()
+
+    def test_order_numbers_are_per_organization_and_gapless(self):
+        first = Order.objects.create(organization=self.org1)
+        second = Order.objects.create(organization=self.org1)
+        other = Order.objects.create(organization=self.org2)
+        self.assertEqual(first.order_number, f'ORD-{self.org1.id}-000001')
+        self.assertEqual(second.order_number, f'ORD-{self.org1.id}-000002')
+        self.assertEqual(other.order_number, f'ORD-{self.org2.id}-000001')
+
+        # A save that is rolled back gives its number back
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Order.objects.create(organization=self.org1)
+                raise RuntimeError
+        self.assertEqual(Order.objects.create(organization=self.org1).order_number, f'ORD-{self.org1.id}-000003')
+        self.assertEqual(Sequence.objects.get(organization=self.org1, kind='order').last_value, 3)
+
+    def test_supplier_and_buyer_codes(self):
+        self.assertEqual(Supplier.objects.create(name='Acme', organization=self.org1).supplier_code, f'SUP-{self.org1.id}-0001')
+        self.assertEqual(Supplier.objects.create(name='Acme', organization=self.org2).supplier_code, f'SUP-{self.org2.id}-0001')
+        self.assertEqual(Buyer.objects.create(name='Shop', organization=self.org1).buyer_code, f'BUY-{self.org1.id}-0001')
+        self.assertEqual(Buyer.objects.create(name='Walk-in').buyer_code, 'BUY0001')
+        self.assertEqual(Buyer.objects.create(name='Walk-in').buyer_code, 'BUY0002')
+
+    @override_settings(SEQUENCE_BLOCK_SIZE=10)
+    def test_blocks_are_shared_only_after_commit(self):
+        # A reservation that is rolled back is dropped together with its block
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.assertEqual(next_sequence_value(self.org1, 'order'), 1)
+                raise RuntimeError
+        self.assertFalse(Sequence.objects.filter(organization=self.org1, kind='order').exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(next_sequence_value(self.org1, 'order'), 1)
+        with self.assertNumQueries(0):
+            values = [next_sequence_value(self.org1, 'order') for _ in range(9)]
+        self.assertEqual(values, list(range(2, 11)))
+        self.assertEqual(Sequence.objects.get(organization=self.org1, kind='order').last_value, 10)
+
+
+class ConcurrentSequenceTests(CatalogTestMixin, TransactionTestCase):
+    """Creates orders for one organization from several threads, each with its own connection."""
+
+    workers = 8
+    orders_per_worker = 10
+
+    def test_concurrent_orders_get_distinct_consecutive_numbers(self):
+        organization = self.create_organization('Concurrent Sequence Org', 'supplier')
+        errors = []
+        start = threading.Barrier(self.workers)
+
+        def worker():
+            try:
+                start.wait()
+                for _ in range(self.orders_per_worker):
+                    Order.objects.create(organization=organization)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        numbers = sorted(int(number.rsplit('-', 1)[-1]) for number in Order.objects.values_list('order_number', flat=True))
+        self.assertEqual(numbers, list(range(1, self.workers * self.orders_per_worker + 1)))
+
+
+class TransactionIdTests(TestCase):
+
+    def test_ids_are_time_ordered_and_need_no_queries(self):
+        before = int(time.time() * 1000)
+        with self.assertNumQueries(0):
+            ids = [generate_transaction_id() for _ in range(1000)]
+            short_ids = [generate_unique_transaction_id() for _ in range(1000)]
+        after = int(time.time() * 1000)
+
+        self.assertEqual({len(transaction_id) for transaction_id in ids}, {26})
+        self.assertEqual({len(transaction_id) for transaction_id in short_ids}, {16})
+        for batch in (ids, short_ids):
+            self.assertEqual(len(set(batch)), len(batch))
+            self.assertEqual(batch, sorted(batch))
+            self.assertTrue(set(''.join(batch)) <= set(CROCKFORD_ALPHABET))
+            self.assertTrue(before <= get_transaction_id_time(batch[0]) <= get_transaction_id_time(batch[-1]) <= after + 1)
+
+    def test_exhausted_millisecond_moves_to_the_next_one(self):
+        generator = TransactionIdGenerator(random_length=1)
+        ids = [generator.generate() for _ in range(200)]
+        self.assertEqual(len(set(ids)), 200)
+        self.assertEqual(ids, sorted(ids))
+
+
+
+class CartTotalsTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.supplier_org = self.create_organization('Cart Totals Supplier', 'supplier')
+        self.products = self.create_products(self.supplier_org, 2)
+        self.order = Order.objects.create(organization=self.supplier_org, status='pending')
+
+    def add_line(self, product, quantity, order=None):
+        return OrderItem.objects.create(order=order or self.order, product=product, quantity=quantity, unit_price=product.price, organization=self.supplier_org)
+
+    def stored_totals(self):
+        return Order.objects.values_list('total_amount', 'item_count').get(pk=self.order.pk)
+
+    def test_line_changes_move_the_stored_totals(self):
+        item = self.add_line(self.products[0], 2)
+        self.add_line(self.products[1], 1)
+        self.assertEqual(self.stored_totals(), (Decimal('30.00'), 3))
+
+        item.quantity = 5
+        item.unit_price = Decimal('12.00')
+        item.save()
+        self.assertEqual(self.stored_totals(), (Decimal('70.00'), 6))
+
+        # A separately loaded copy of the line applies its own difference
+        OrderItem.objects.get(pk=item.pk).delete()
+        self.assertEqual(self.stored_totals(), (Decimal('10.00'), 1))
+
+        order = Order.objects.get(pk=self.order.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual((order.get_cart_total, order.get_cart_items), (Decimal('10.00'), 1))
+        # The instance the lines were saved through is kept in step too (the delete went through another one)
+        self.assertEqual((self.order.get_cart_total, self.order.get_cart_items), (Decimal('70.00'), 6))
+
+    def test_line_change_is_one_update_on_the_order(self):
+        item = self.add_line(self.products[0], 2)
+        item.quantity = 3
+        with CaptureQueriesContext(connection) as queries:
+            item.save()
+        order_statements = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "api_order"')]
+        self.assertEqual(len(order_statements), 1)
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT')])
+
+    def test_check_cart_totals_reports_and_fixes_drift(self):
+        self.add_line(self.products[0], 2)
+        other_order = Order.objects.create(organization=self.supplier_org, status='pending')
+        self.add_line(self.products[1], 4, order=other_order)
+        call_command('check_cart_totals', stdout=open(os.devnull, 'w'))
+
+        Order.objects.filter(pk=self.order.pk).update(total_amount=Decimal('99.00'), item_count=7)
+        with self.assertRaises(CommandError):
+            call_command('check_cart_totals', stdout=open(os.devnull, 'w'))
+
+        call_command('check_cart_totals', fix=True, stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.stored_totals(), (Decimal('20.00'), 2))
+        self.assertEqual(Order.objects.values_list('total_amount', 'item_count').get(pk=other_order.pk), (Decimal('40.00'), 4))
+
+
+class CartUpsertTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.supplier_org = self.create_organization('Upsert Supplier', 'supplier')
+        self.buyer_org = self.create_organization('Upsert Buyer', 'buyer')
+        self.buyer_user = self.create_user(self.buyer_org, 'upsert@example.com')
+        self.products = self.create_products(self.supplier_org, 3)
+
+    def patch(self, data):
+        request = self.factory.patch('/api/update-cart/', data, format='json')
+        force_authenticate(request, user=self.buyer_user)
+        return updateCartView.as_view()(request)
+
+    def cart_lines(self):
+        return sorted(OrderItem.objects.filter(order__customer__user=self.buyer_user).values_list('product_id', 'quantity', 'subtotal'))
+
+    def test_single_changes_upsert_the_line(self):
+        response = self.patch({'product_id': self.products[0].id, 'action': 'add', 'amount': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['total_items'], response.data['total_cost']), (2, '20.00'))
+        self.assertEqual(response.data['updated_item']['quantity'], 2)
+
+        response = self.patch({'product_id': self.products[0].id, 'action': 'add', 'amount': 3})
+        self.assertEqual((response.data['total_items'], response.data['total_cost']), (5, '50.00'))
+        self.assertEqual(self.cart_lines(), [(self.products[0].id, 5, Decimal('50.00'))])
+
+        response = self.patch({'product_id': self.products[0].id, 'action': 'remove', 'amount': 9})
+        self.assertEqual(response.data['message'], 'Item removed from cart')
+        self.assertIsNone(response.data['updated_item'])
+        self.assertEqual((response.data['total_items'], response.data['total_cost']), (0, '0.00'))
+        self.assertEqual(self.cart_lines(), [])
+
+    def test_batch_of_changes_in_one_request(self):
+        self.patch({'product_id': self.products[0].id, 'action': 'add', 'amount': 4})
+        self.patch({'product_id': self.products[1].id, 'action': 'add', 'amount': 1})
+
+        Product.objects.filter(pk=self.products[2].pk).update(price=Decimal('2.50'))
+        response = self.patch({'items': [
+            {'product_id': self.products[0].id, 'action': 'remove', 'amount': 1},
+            {'product_id': self.products[1].id, 'action': 'set', 'amount': 0},
+            {'product_id': self.products[2].id, 'action': 'set', 'amount': 6},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['total_items'], response.data['total_cost']), (9, '45.00'))
+        self.assertEqual(
+            sorted((item['id'], item['quantity']) for item in response.data['items']),
+            [(self.products[0].id, 3), (self.products[1].id, 0), (self.products[2].id, 6)]
+        )
+        self.assertEqual(self.cart_lines(), [(self.products[0].id, 3, Decimal('30.00')), (self.products[2].id, 6, Decimal('15.00'))])
+        order = Order.objects.get(customer__user=self.buyer_user)
+        self.assertEqual((order.total_amount, order.item_count), (Decimal('45.00'), 9))
+        call_command('check_cart_totals', stdout=open(os.devnull, 'w'))
+
+    def test_change_query_count_does_not_grow_with_lookups(self):
+        self.patch({'product_id': self.products[0].id, 'action': 'add', 'amount': 1})
+        # Products, buyer, pending order, the upsert and the totals UPDATE (plus savepoints)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch({'items': [{'product_id': self.products[0].id, 'action': 'add', 'amount': 1}]})
+        self.assertEqual(response.status_code, 200)
+        statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+        self.assertEqual(len(statements), 5)
+
+    def test_invalid_changes_are_rejected(self):
+        self.assertEqual(self.patch({'product_id': self.products[0].id, 'action': 'double', 'amount': 1}).status_code, 400)
+        self.assertEqual(self.patch({'product_id': self.products[0].id, 'action': 'add', 'amount': 0}).status_code, 400)
+        self.assertEqual(self.patch({'items': []}).status_code, 400)
+        self.assertEqual(self.patch({'product_id': 999999, 'action': 'add', 'amount': 1}).status_code, 404)
+        self.assertEqual(self.cart_lines(), [])
+
+
+class CookieCartTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.supplier_org = self.create_organization('Guest Supplier', 'supplier')
+
+    def cookie(self, products, quantity=2, extra=None):
+        cart = {str(product.id): {'quantity': quantity} for product in products}
+        cart.update(extra or {})
+        return json.dumps(cart)
+
+    def checkout(self, cart_cookie, total):
+        request = self.factory.post('/api/unauth-process-order/', {
+            'user_info': {'first_name': 'Guest', 'last_name': 'Buyer', 'email': 'guest@example.com'},
+            'shipping_info': {'address': '1 Main St', 'city': 'Accra', 'state': 'GA', 'zipcode': '00233', 'country': 'GH'},
+            'total': total,
+        }, format='json')
+        request.COOKIES['cart'] = cart_cookie
+        stdout = io.StringIO()
+        with CaptureQueriesContext(connection) as queries, contextlib.redirect_stdout(stdout):
+            response = UnAuthProcessOrderView.as_view()(request)
+        # Outcomes go to the api.views logger
+        self.assertEqual(stdout.getvalue(), '')
+        # Product lookups and order line inserts (the sales rollup is updated per product on completion)
+        cart_queries = [query for query in queries if query['sql'].startswith(('SELECT "api_product"', 'INSERT INTO "api_orderitem"'))]
+        return response, len(cart_queries)
+
+    def test_cookie_cart_resolves_products_in_one_query(self):
+        products = self.create_products(self.supplier_org, 20)
+        request = self.factory.get('/')
+        request.COOKIES['cart'] = self.cookie(products, extra={'abc': {'quantity': 1}, '999999': {'quantity': 1}, str(products[0].id + 1000): 'x'})
+        with self.assertNumQueries(1):
+            cart = cookieCart(request)
+
+        self.assertEqual((cart['total_items'], cart['total_cost']), (40, Decimal('400.00')))
+        self.assertEqual(len(cart['items']), 20)
+        self.assertTrue(cart['shipping'])
+        self.assertEqual(
+            sorted((str(error['id']), error['error']) for error in cart['errors']),
+            [(str(products[0].id + 1000), 'Malformed cart entry.'), ('999999', 'Product no longer exists.'), ('abc', 'Malformed cart entry.')]
+        )
+
+    def test_guest_checkout_query_count_does_not_depend_on_cart_size(self):
+        small = self.create_products(self.supplier_org, 5)
+        large = self.create_products(self.supplier_org, 100)
+
+        response, small_queries = self.checkout(self.cookie(small), '100.00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['order_status'], 'completed')
+        response, large_queries = self.checkout(self.cookie(large), '2000.00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(small_queries, large_queries)
+
+        order = Order.objects.filter(customer__email='guest@example.com').order_by('-id').first()
+        self.assertEqual((order.total_amount, order.item_count, order.items.count()), (Decimal('2000.00'), 200, 100))
+        self.assertEqual(ShippingAddress.objects.filter(order=order).count(), 1)
+        call_command('check_cart_totals', stdout=open(os.devnull, 'w'))
+
+    def test_guest_checkout_rejects_bad_carts(self):
+        products = self.create_products(self.supplier_org, 2)
+        response, _ = self.checkout(self.cookie(products, extra={'999999': {'quantity': 1}}), '40.00')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [{'id': 999999, 'error': 'Product no longer exists.'}])
+
+        response, _ = self.checkout('not json', '40.00')
+        self.assertEqual(response.status_code, 400)
+        response, _ = self.checkout(self.cookie(products), '39.99')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class StockAlertNotificationTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.organization = self.create_organization('Alert Org', 'supplier')
+        self.admin = self.create_user(self.organization, 'alert-admin@example.com', role='admin')
+        self.manager = self.create_user(self.organization, 'alert-manager@example.com', role='manager')
+        self.products = self.create_products(self.organization, 2)
+        Inventory.objects.update(min_stock_level=5)
+        self.inventories = list(Inventory.objects.filter(organization=self.organization).select_related('product', 'location').order_by('id'))
+
+    def drain(self, inventory, times):
+        for _ in range(times):
+            inventory.remove_stock(1)
+
+    def test_fan_out_is_one_insert_for_all_recipients(self):
+        inventory = self.inventories[0]
+        inventory.quantity = 3
+        with CaptureQueriesContext(connection) as queries:
+            notifications = Notification.create_low_stock_notification(inventory)
+        self.assertEqual(sorted(notification.user_id for notification in notifications), [self.admin.id, self.manager.id])
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT INTO "api_notification"')]), 1)
+
+    @override_settings(STOCK_ALERT_DEDUP_WINDOW=3600)
+    def test_repeated_alerts_are_suppressed_within_the_window(self):
+        inventory = self.inventories[0]
+        self.drain(inventory, 8) # 10 -> 2: low stock from 5 on, i.e. four alerts
+        alerts = Notification.objects.filter(notification_type='low_stock', related_object_id=inventory.id)
+        self.assertEqual(alerts.count(), 2) # One alert, to the admin and the manager
+        state = StockAlertState.objects.get(inventory=inventory, alert_type='low_stock')
+        self.assertEqual((state.suppressed_count, state.last_quantity), (3, 2))
+
+        # After the window the next alert goes out again and mentions the suppressed ones
+        StockAlertState.objects.update(last_notified_at=timezone.now() - timedelta(hours=2))
+        self.drain(inventory, 1)
+        self.assertEqual(alerts.count(), 4)
+        self.assertIn('3 repeated alerts', alerts.order_by('-id').first().message)
+        self.assertEqual(StockAlertState.objects.get(pk=state.pk).suppressed_count, 0)
+
+    @override_settings(STOCK_ALERT_DEDUP_WINDOW=3600)
+    def test_quiet_items_are_collapsed_into_a_digest(self):
+        self.drain(self.inventories[0], 7)
+        self.drain(self.inventories[1], 6)
+        self.assertEqual(send_stock_alert_digests(), 0) # Still within the window
+
+        StockAlertState.objects.update(last_notified_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(send_stock_alert_digests(), 2)
+        digest = Notification.objects.filter(notification_type='stock_digest', user=self.admin).get()
+        self.assertTrue(digest.message.startswith('Stock alert digest: 3 repeated alerts for 2 items.'))
+        self.assertIn(f'{self.products[0].name} at Main: 2 low stock alerts, last quantity 3', digest.message)
+        self.assertEqual(set(StockAlertState.objects.values_list('suppressed_count', flat=True)), {0})
+        self.assertEqual(send_stock_alert_digests(), 0)
+
+    @override_settings(STOCK_ALERT_DEDUP_WINDOW=0)
+    def test_zero_window_disables_suppression(self):
+        self.drain(self.inventories[0], 7)
+        self.assertEqual(Notification.objects.filter(notification_type='low_stock', user=self.admin).count(), 3)
+
+
+class UnreadCounterTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.organization = self.create_organization('Unread Org', 'supplier')
+        self.user = self.create_user(self.organization, 'unread@example.com')
+        self.other = self.create_user(self.organization, 'unread-other@example.com')
+
+    def notify(self, count, user=None):
+        return [
+            Notification.objects.create(user=user or self.user, message=f'Message {index}', organization=self.organization)
+            for index in range(count)
+        ]
+
+    def call(self, view, method='get', data=None, **initkwargs):
+        request = getattr(self.factory, method)('/', data, format='json')
+        force_authenticate(request, user=self.user)
+        return view.as_view(**initkwargs)(request)
+
+    def test_counter_follows_creates_and_reads(self):
+        notifications = self.notify(3)
+        self.notify(2, user=self.other)
+        Communication.objects.create(sender=self.other, recipient=self.user, message='Hi', organization=self.organization)
+
+        with self.assertNumQueries(1):
+            response = self.call(UnreadCountView)
+        self.assertEqual(response.data, {'notifications': 3, 'communications': 1})
+
+        notifications[0].mark_as_read()
+        notifications[0].mark_as_read() # Already read: the counter does not move again
+        notifications[1].delete()
+        self.assertEqual(Notification.get_unread_count(self.user), 1)
+        self.assertEqual(Notification.get_unread_count(self.other), 2)
+        self.assertEqual(reconcile_unread_counters(), [])
+
+    def test_mark_all_read_is_one_update_per_table(self):
+        self.notify(5)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.call(MarkReadView, 'post', {}, kind='notification')
+        self.assertEqual(response.data, {'marked_read': 5, 'unread': 0})
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2) # The notification rows and the counter
+        self.assertFalse(Notification.objects.filter(read_status=False).exists())
+
+        notifications = self.notify(3)
+        response = self.call(MarkReadView, 'post', {'ids': [notifications[0].id, notifications[1].id]}, kind='notification')
+        self.assertEqual(response.data, {'marked_read': 2, 'unread': 1})
+
+    def test_stock_alert_fan_out_moves_the_counters(self):
+        self.create_products(self.organization, 1)
+        inventory = Inventory.objects.select_related('product', 'location').get()
+        Notification.create_overstock_notifications([inventory])
+        self.assertEqual(dict(UnreadCounter.objects.filter(kind='notification').values_list('user_id', 'count')), {self.user.id: 1, self.other.id: 1})
+
+    def test_reconcile_repairs_drift(self):
+        self.notify(4)
+        Notification.objects.filter(user=self.user).update(read_status=True) # Bypasses the counter
+        self.assertEqual(reconcile_unread_counters(), [('notification', self.user.id, 4, 0)])
+        call_command('reconcile_unread_counters', stdout=open(os.devnull, 'w'))
+        self.assertEqual(Notification.get_unread_count(self.user), 0)
+
+    def test_notification_list_uses_keyset_paging(self):
+        notifications = self.notify(5)
+        notifications[4].mark_as_read()
+        request = self.factory.get('/api/notifications/', {'page_size': 2, 'unread': 'true'})
+        force_authenticate(request, user=self.user)
+        response = NotificationListView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIn('cursor=', response.data['next'])
+        self.assertNotIn(notifications[4].id, [item['id'] for item in response.data['results']])
+
+
+class MetricsEndpointTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.organization = self.create_organization('Metrics Org', 'supplier')
+        self.user = self.create_user(self.organization, 'metrics@example.com')
+        self.products = self.create_products(self.organization, 2)
+
+    def scrape(self, **kwargs):
+        response = self.client.get('/metrics', **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_registry_renders_the_text_format(self):
+        registry = Registry()
+        counter = Counter('test_events_total', 'Events.', ['kind'], registry=registry)
+        histogram = Histogram('test_size', 'Sizes.', buckets=(1, 5), registry=registry)
+        counter.inc(kind='a "quoted"\nname')
+        counter.inc(2, kind='a "quoted"\nname')
+        for value in (0.5, 3, 3, 9):
+            histogram.observe(value)
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE test_events_total counter', lines)
+        self.assertIn('test_events_total{kind="a \\"quoted\\"\\nname"} 3', lines)
+        self.assertEqual(
+            [line for line in lines if line.startswith('test_size')],
+            ['test_size_bucket{le="1"} 1', 'test_size_bucket{le="5"} 3', 'test_size_bucket{le="+Inf"} 4',
+             'test_size_sum 15.5', 'test_size_count 4']
+        )
+
+    def test_registry_is_safe_across_threads(self):
+        counter = Counter('test_threads_total', 'Increments.', registry=None)
+
+        def work():
+            for _ in range(1000):
+                counter.inc()
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.get(), 8000)
+
+    def test_hot_paths_are_exported(self):
+        before = STOCK_MOVEMENTS.get(movement_type='addition')
+        inventories = list(Inventory.objects.filter(organization=self.organization))
+        apply_stock_adjustments(
+            self.organization, 'addition', [{'inventory_id': inventory.id, 'quantity': 1} for inventory in inventories], check_alerts=False
+        )
+        self.assertEqual(STOCK_MOVEMENTS.get(movement_type='addition'), before + 2)
+
+        hits = CACHE_REQUESTS.get(cache='analytics', result='hit')
+        cache = AnalyticsCache(self.organization)
+        cache.fetch('test', [1], lambda: 1)
+        cache.fetch('test', [1], lambda: 1)
+        self.assertEqual(CACHE_REQUESTS.get(cache='analytics', result='hit'), hits + 1)
+
+        queue_email('Subject', 'Body', ['someone@example.com'])
+        queue_email('Subject', 'Body', ['someone@example.com'])
+        self.client.get('/api/notifications/', headers={'Authorization': f'JWT {AccessToken.for_user(self.user)}'})
+
+        with self.settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            metrics = self.scrape()
+        self.assertIn('stocksync_email_queue_depth{status="pending"} 2', metrics)
+        self.assertRegex(metrics, r'stocksync_stock_movements_total\{movement_type="addition"\} \d+')
+        self.assertRegex(metrics, r'stocksync_cache_hit_ratio\{cache="analytics"\} [0-9.]+')
+        self.assertRegex(metrics, r'stocksync_request_duration_seconds_bucket\{url_name="api:notification-list",le="\+Inf"\} \d+')
+        self.assertIn('# TYPE stocksync_notification_fanout histogram', metrics)
+        self.assertIn('# TYPE stocksync_checkout_duration_seconds histogram', metrics)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        self.assertIn('stocksync_stock_movements_total', self.scrape(headers={'Authorization': 'Bearer scrape-secret'}))
+
+    def test_endpoint_is_closed_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+            self.assertIn('stocksync_stock_movements_total', self.scrape(REMOTE_ADDR='10.0.0.5'))
+        with self.settings(DEBUG=True):
+            self.scrape()
+
+
+class StructuredLoggingTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.supplier_org = self.create_organization('Logging Supplier', 'supplier')
+        self.buyer_org = self.create_organization('Logging Buyer', 'buyer')
+        self.buyer_user = self.create_user(self.buyer_org, 'logging@example.com')
+        Location.objects.create(name='Store', organization=self.buyer_org)
+        self.buyer = Buyer.objects.create(user=self.buyer_user, name='Logging Buyer', buyer_code='LOG-BUYER')
+        self.products = self.create_products(self.supplier_org, 3)
+
+    def make_record(self, **fields):
+        record = logging.LogRecord('api.views', logging.INFO, __file__, 1, 'Order %s completed', (7,), None)
+        record.__dict__.update(fields)
+        return record
+
+    def test_formatter_renders_extra_fields(self):
+        record = self.make_record(order_id=7, total=Decimal('12.50'))
+        self.assertTrue(StructuredFormatter(fmt='%(levelname)s %(message)s').format(record).endswith('INFO Order 7 completed order_id=7 total=12.50'))
+        entry = json.loads(StructuredFormatter(output='json').format(self.make_record(order_id=7, total=Decimal('12.50'))))
+        self.assertEqual(
+            {key: entry[key] for key in ('level', 'logger', 'message', 'order_id', 'total')},
+            {'level': 'INFO', 'logger': 'api.views', 'message': 'Order 7 completed', 'order_id': 7, 'total': '12.50'}
+        )
+
+    def test_module_levels(self):
+        self.assertEqual(parse_log_levels(' api.views=debug, api.stock=WARNING '), {'api.views': 'DEBUG', 'api.stock': 'WARNING'})
+        self.assertEqual(parse_log_levels(''), {})
+        with self.assertRaises(ValueError):
+            parse_log_levels('api.views')
+        loggers = build_logging_config(['api'], 'info', {'api.views': 'DEBUG'})['loggers']
+        self.assertEqual(loggers['api'], {'handlers': ['console'], 'level': 'INFO', 'propagate': False})
+        self.assertEqual(loggers['api.views'], {'level': 'DEBUG'})
+
+    def checkout(self, level):
+        order = Order.objects.create(organization=self.supplier_org, customer=self.buyer, status='pending')
+        for product in self.products:
+            OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=product.price, organization=self.supplier_org)
+        request = self.factory.post('/api/process_order/', {'total': str(order.get_cart_total), 'shipping_info': {}}, format='json')
+        force_authenticate(request, user=self.buyer_user)
+        with self.assertLogs('api', level) as logs, CaptureQueriesContext(connection) as queries:
+            response = ProcessOrderView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return order, logs.records, len(queries)
+
+    def test_debug_only_values_cost_nothing_when_disabled(self):
+        self.checkout('INFO') # Creates the buyer's inventory rows, so both measured checkouts do the same work
+        order, records, info_queries = self.checkout('INFO')
+        completed = [record for record in records if record.getMessage() == 'Order completed']
+        self.assertEqual([(record.order_id, record.movements) for record in completed], [(order.id, 6)])
+        self.assertFalse([record for record in records if record.levelno < logging.INFO])
+
+        _, records, debug_queries = self.checkout('DEBUG')
+        self.assertTrue([record for record in records if record.getMessage() == 'Pending order'])
+        # The pending order line counts are only queried for DEBUG
+        self.assertGreater(debug_queries, info_queries)
+
+    def test_read_views_write_nothing_to_stdout(self):
+        order = Order.objects.create(organization=self.supplier_org, customer=self.buyer, status='pending')
+        OrderItem.objects.create(order=order, product=self.products[0], quantity=1, unit_price=self.products[0].price, organization=self.supplier_org)
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), self.assertLogs('api', 'DEBUG') as logs:
+            for view, path in ((ProductAPIView, '/api/products/'), (CartDataView, '/api/cart-data/')):
+                request = self.factory.get(path)
+                force_authenticate(request, user=self.buyer_user)
+                response = view.as_view()(request)
+                response.render()
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertIn(('Cart loaded', order.id), [(record.getMessage(), getattr(record, 'order_id', None)) for record in logs.records])
+
+
+class DatasetGeneratorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.created = generate_dataset(
+            organizations=8, products_per_supplier=6, locations_per_organization=2, suppliers_per_buyer=2,
+            orders_per_buyer=4, lines_per_order=2, movements_per_inventory=3, buyer_stock_items=3, days=30,
+            seed=3, prefix='Gen', batch_size=7, log=lambda message: None
+        )
+
+    def test_rows_are_consistent(self):
+        self.assertEqual(self.created['Organization'], 8)
+        self.assertEqual(OrderItem.objects.count(), self.created['OrderItem'])
+        self.assertEqual(InventoryMovement.objects.count(), self.created['Inventory'] * 3)
+
+        # Every movement history ends at the current quantity and never goes below zero
+        for inventory in Inventory.objects.prefetch_related('movements'):
+            movements = sorted(inventory.movements.all(), key=lambda movement: (movement.timestamp, movement.id))
+            self.assertEqual(movements[-1].quantity_after_movement, inventory.quantity)
+            for movement in movements:
+                self.assertGreaterEqual(movement.quantity_after_movement - movement.quantity_change, 0)
+
+        for order in Order.objects.prefetch_related('items'):
+            self.assertEqual(order.total_amount, sum(item.subtotal for item in order.items.all()))
+            self.assertEqual(order.item_count, sum(item.quantity for item in order.items.all()))
+            self.assertGreater(order.order_date, timezone.now() - timedelta(days=31))
+        self.assertGreater(len(set(Order.objects.values_list('order_date__date', flat=True))), 1)
+
+    def test_saved_orders_continue_the_numbering(self):
+        supplier = Order.objects.values_list('organization', flat=True).first()
+        order = Order.objects.create(organization_id=supplier)
+        numbers = Order.objects.filter(organization_id=supplier).values_list('order_number', flat=True)
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertEqual(order.order_number, max(numbers))
+
+    def test_prefix_must_be_new(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', '--organizations', '2', '--prefix', 'Gen', stdout=open(os.devnull, 'w'))
+
+    def test_benchmarks_run_against_the_dataset(self):
+        results = run_benchmarks(prefix='Gen', runs=1, warmup=0, checkout_lines=2)
+        self.assertEqual({name: result['status_codes'] for name, result in results['results'].items()}, {
+            name: [200] for name in results['results']
+        })
+        self.assertEqual(results['dataset']['Order'], self.created['Order'])
+        # process-order is rolled back
+        self.assertEqual(Order.objects.count(), self.created['Order'])
+
+        slower = json.loads(json.dumps(results))
+        slower['results']['products']['p50_ms'] = results['results']['products']['p50_ms'] * 2
+        self.assertEqual(compare_results(results, slower)[0][3], 100.0)
+
+    def test_checkout_needs_products_in_stock(self):
+        Inventory.objects.update(quantity=0)
+        with self.assertRaisesRegex(ValueError, 'restock'):
+            run_benchmarks(prefix='Gen', endpoints=['process-order'], runs=1, warmup=0)
+
+
+class BulkFixtureLoaderTests(CatalogTestMixin, TestCase):
+
+    def write_fixture(self, objects, encoding='utf-8'):
+        text = json.dumps(objects, indent=2)
+        handle, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'wb') as f:
+            # PowerShell's `dumpdata > data.json` writes UTF-16 with a byte order mark
+            f.write(text.encode(encoding))
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_objects_are_read_across_chunks(self):
+        objects = [{'model': 'api.brand', 'pk': n, 'fields': {'name': f'Brand \u00e9 {n}', 'tags': [n, {'x': '] ,'}]}} for n in range(20)]
+        for encoding in ('utf-8', 'utf-8-sig', 'utf-16'):
+            with open(self.write_fixture(objects, encoding), 'rb') as stream:
+                self.assertEqual(list(iter_fixture_objects(stream, chunk_size=7)), objects)
+
+        with open(self.write_fixture([]), 'rb') as stream:
+            self.assertEqual(list(iter_fixture_objects(stream)), [])
+        for broken in ('[{"model": "api.brand"}', '[{"model": "api.brand"},]', '{"model": "api.brand"}'):
+            path = self.write_fixture([])
+            with open(path, 'w') as f:
+                f.write(broken)
+            with open(path, 'rb') as stream, self.assertRaises(ValueError):
+                list(iter_fixture_objects(stream, chunk_size=5))
+
+    def test_models_are_ordered_by_dependency(self):
+        order = models_in_dependency_order([OrderItem, Order, Buyer, Product, Organization, User])
+        for model, dependency in ((OrderItem, Order), (Order, Buyer), (Buyer, User), (User, Organization), (OrderItem, Product)):
+            self.assertLess(order.index(dependency), order.index(model))
+
+    def test_dump_is_bulk_loaded(self):
+        existing = Organization.objects.create(name='Existing', organization_type='supplier')
+        fields = {'activation_token': '2f1c1c9e-6a51-4c1e-9d1a-8e0a2b4a7c11', 'created_at': '2020-01-02T03:04:05Z', 'updated_at': '2020-01-02T03:04:05Z'}
+        objects = [
+            # Out of dependency order, with a row that overwrites an existing one
+            {'model': 'api.order', 'pk': 500, 'fields': {'order_number': 'ORD-900-000007', 'customer': 600, 'organization': 900, 'status': 'pending', 'order_date': '2020-01-02T03:04:05Z'}},
+            {'model': 'api.order', 'pk': 501, 'fields': {'order_number': None, 'customer': 600, 'organization': 900, 'status': 'pending'}},
+            {'model': 'api.buyer', 'pk': 600, 'fields': {'name': 'Dumped buyer', 'buyer_code': 'BUY-901-0003', 'organization': 901}},
+            {'model': 'api.supplier', 'pk': 700, 'fields': {'name': 'Without a code', 'supplier_code': '', 'organization': 900}},
+            {'model': 'api.customer', 'pk': 1, 'fields': {'name': 'Gone'}},
+            {'model': 'accounts.organization', 'pk': 900, 'fields': dict(fields, name='Dumped supplier', organization_type='supplier')},
+            {'model': 'accounts.organization', 'pk': 901, 'fields': dict(fields, name='Dumped buyer', activation_token='0d0f5a83-1a0e-4bb3-8f5b-1b6b8d5d3e02')},
+            {'model': 'accounts.organization', 'pk': existing.pk, 'fields': dict(fields, name='Renamed', activation_token=str(existing.activation_token))},
+        ]
+        path = self.write_fixture(objects, 'utf-16')
+
+        with self.assertRaises(CommandError):
+            call_command('bulk_loaddata', path, stdout=open(os.devnull, 'w'))
+        self.assertFalse(Order.objects.exists())
+
+        result = load_fixtures([path], batch_size=2, skip_unknown_models=True)
+        self.assertEqual(result['loaded'], {'accounts.organization': 3, 'api.buyer': 1, 'api.order': 2, 'api.supplier': 1})
+        self.assertEqual(result['skipped'], {'api.customer': 1})
+        self.assertEqual(result['generated_codes'], 2)
+
+        self.assertEqual(Organization.objects.get(pk=existing.pk).name, 'Renamed')
+        dumped = Order.objects.get(pk=500)
+        self.assertEqual((dumped.order_number, dumped.customer.buyer_code), ('ORD-900-000007', 'BUY-901-0003'))
+        self.assertEqual(dumped.order_date.year, 2020)
+        # Missing codes continue after the dumped ones, and so do later saves
+        self.assertEqual(Order.objects.get(pk=501).order_number, 'ORD-900-000008')
+        self.assertEqual(Supplier.objects.get(pk=700).supplier_code, 'SUP-900-0001')
+        self.assertEqual(Order.objects.create(organization_id=900).order_number, 'ORD-900-000009')
+        self.assertEqual(Buyer.objects.create(name='New', organization_id=901).buyer_code, 'BUY-901-0004')
+
+    def test_order_totals_are_recomputed_from_the_lines(self):
+        organization = self.create_organization('Totals Supplier', 'supplier')
+        products = self.create_products(organization, 2)
+        line = {'organization': organization.id, 'unit_price': '10.00'}
+        # A dump from before total_amount and item_count existed
+        path = self.write_fixture([
+            {'model': 'api.orderitem', 'pk': 800, 'fields': dict(line, order=700, product=products[0].id, quantity=2, subtotal='20.00')},
+            {'model': 'api.orderitem', 'pk': 801, 'fields': dict(line, order=700, product=products[1].id, quantity=1, subtotal='10.00')},
+            {'model': 'api.order', 'pk': 700, 'fields': {'order_number': 'ORD-T-1', 'organization': organization.id, 'status': 'pending'}},
+            {'model': 'api.order', 'pk': 701, 'fields': {'order_number': 'ORD-T-2', 'organization': organization.id, 'status': 'pending'}},
+        ])
+
+        result = load_fixtures([path], ignorenonexistent=True)
+
+        self.assertEqual(result['repaired_order_totals'], 1)
+        self.assertEqual(
+            list(Order.objects.filter(pk__in=[700, 701]).order_by('pk').values_list('total_amount', 'item_count')),
+            [(Decimal('30.00'), 3), (Decimal('0.00'), 0)]
+        )
+        call_command('check_cart_totals', stdout=open(os.devnull, 'w'))
@@ -0,0 +1,135 @@
+"""
+Unread notification and communication counters.
+
+Frontends poll the unread counts, so instead of a COUNT over the user's rows
+each user has an UnreadCounter per kind, moved by the code paths that create
+unread rows or mark them read:
+
+- Notification/Communication save() (new unread row): +1
+- notify_stock_alerts and other bulk_creates: adjust_unread with the fan-out
+- mark_read (one row, some or all): one UPDATE on the rows, then the counter
+  moves by the number of rows that actually changed, in the same transaction
+
+A counter row is created on first use from a real COUNT, so existing data
+needs no backfill. reconcile_unread_counters (and the command of the same
+name) compares every counter with a COUNT and repairs drift, e.g. after rows
+were changed with raw queryset updates.
+"""
+from collections import defaultdict
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from .models import Notification, Communication, UnreadCounter
+
+# kind: (model, field holding the user the row is unread for)
+UNREAD_SOURCES = {
+    'notification': (Notification, 'user'),
+    'communication': (Communication, 'recipient'),
+}
+
+
+def unread_rows(kind, user_ids=None):
+    model, user_field = UNREAD_SOURCES[kind]
+    rows = model.objects.filter(read_status=False)
+    if user_ids is not None:
+        rows = rows.filter(**{f'{user_field}_id__in': user_ids})
+    return rows
+
+
+def count_unread(kind, user_ids=None):
+    """{user_id: unread count} computed from the rows; users without unread rows are left out."""
+    _, user_field = UNREAD_SOURCES[kind]
+    return dict(
+        unread_rows(kind, user_ids).order_by().values_list(f'{user_field}_id').annotate(unread=Count('id'))
+    )
+
+
+def _create_counters(kind, user_ids):
+    """
+    Creates the users' counters from a COUNT, which already includes the caller's
+    own changes. Returns the users whose counter was created concurrently instead.
+    """
+    counts = count_unread(kind, user_ids)
+    raced = []
+    for user_id in user_ids:
+        try:
+            with transaction.atomic():
+                UnreadCounter.objects.create(user_id=user_id, kind=kind, count=counts.get(user_id, 0))
+        except IntegrityError:
+            # That counter was counted before our (uncommitted) change
+            raced.append(user_id)
+    return raced
+
+
+def adjust_unread(kind, deltas):
+    """
+    Moves the counters of {user_id: delta}, after the rows have been inserted or
+    updated in the current transaction. One UPDATE per distinct delta.
+    """
+    by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(user_id)
+
+    with transaction.atomic():
+        for delta, user_ids in by_delta.items():
+            counters = UnreadCounter.objects.filter(kind=kind, user_id__in=user_ids)
+            if counters.update(count=F('count') + delta) == len(user_ids):
+                continue
+            existing = set(counters.values_list('user_id', flat=True))
+            missing = [user_id for user_id in user_ids if user_id not in existing]
+            raced = _create_counters(kind, missing)
+            if raced:
+                UnreadCounter.objects.filter(kind=kind, user_id__in=raced).update(count=F('count') + delta)
+
+
+def get_unread_counts(user):
+    """{kind: unread count} for all kinds, with one query once the counters exist."""
+    counts = dict(UnreadCounter.objects.filter(user=user).values_list('kind', 'count'))
+    for kind in UNREAD_SOURCES:
+        if kind not in counts:
+            _create_counters(kind, [user.id])
+            counts[kind] = UnreadCounter.objects.filter(user=user, kind=kind).values_list('count', flat=True).get()
+    return counts
+
+
+def get_unread_count(kind, user):
+    return get_unread_counts(user)[kind]
+
+
+def mark_read(kind, user, ids=None):
+    """
+    Marks the user's unread rows of the kind (all, or those with the given IDs) as
+    read with one UPDATE and moves the counter by the number of rows it changed.
+    Returns that number.
+    """
+    model, user_field = UNREAD_SOURCES[kind]
+    rows = model.objects.filter(**{user_field: user}, read_status=False)
+    if ids is not None:
+        rows = rows.filter(pk__in=ids)
+    with transaction.atomic():
+        changed = rows.update(read_status=True)
+        if changed:
+            adjust_unread(kind, {user.pk: -changed})
+    return changed
+
+
+def reconcile_unread_counters(fix=False):
+    """
+    Compares every counter with the unread rows. Returns [(kind, user_id, stored,
+    actual)] for the counters that differ and, with fix=True, corrects them.
+    """
+    drifted = []
+    for kind in UNREAD_SOURCES:
+        actual = count_unread(kind)
+        for user_id, stored in UnreadCounter.objects.filter(kind=kind).values_list('user_id', 'count'):
+            if stored != actual.get(user_id, 0):
+                drifted.append((kind, user_id, stored, actual.get(user_id, 0)))
+
+    if fix:
+        for kind, user_id, _, _ in drifted:
+            with transaction.atomic():
+                # Recount under the row lock, so changes made since the comparison are kept
+                counter = UnreadCounter.objects.select_for_update().get(kind=kind, user_id=user_id)
+                counter.count = count_unread(kind, [user_id]).get(user_id, 0)
+                counter.save(update_fields=['count'])
+    return drifted
@@ -1,5 +1,9 @@
 from django.urls import path
 from .views import *  # Ensure new analytics views are imported if using *
+from .async_views import (
+    AsyncProductView, AsyncInventoryListView, AsyncCartDataView, AsyncAnalyticsDashboardView,
+    AsyncSalesTrendAnalyticsView, AsyncTopSellingProductsAnalyticsView
+)
 # Or explicitly import:
 # from .views import (
 #   AnalyticsDashboardView, SalesTrendAnalyticsView, TopSellingProductsAnalyticsView,
@@ -44,5 +48,22 @@ urlpatterns = [
     # Manual Inventory Adjustment URL
     path('inventory/adjust/', ManualInventoryAdjustmentView.as_view(), name='manual-inventory-adjustment'),
 
+    # Notifications and unread counts
+    path('notifications/', NotificationListView.as_view(), name='notification-list'),
+    path('notifications/unread-count/', UnreadCountView.as_view(), name='unread-count'),
+    path('notifications/mark-read/', MarkReadView.as_view(kind='notification'), name='notification-mark-read'),
+    path('communications/mark-read/', MarkReadView.as_view(kind='communication'), name='communication-mark-read'),
+
+    # Per-view request statistics of this process (staff only), see accounts.instrumentation
+    path('debug/request-stats/', RequestStatsView.as_view(), name='request-stats'),
+
+    # Async (ASGI-native) variants of the read endpoints, see api.async_views
+    path('async/products/', AsyncProductView.as_view(), name='async-products'),
+    path('async/inventory/', AsyncInventoryListView.as_view(), name='async-inventory-list'),
+    path('async/cart-data/', AsyncCartDataView.as_view(), name='async-cart-data'),
+    path('async/analytics/dashboard/', AsyncAnalyticsDashboardView.as_view(), name='async-analytics-dashboard'),
+    path('async/analytics/sales-trend/', AsyncSalesTrendAnalyticsView.as_view(), name='async-analytics-sales-trend'),
+    path('async/analytics/top-products/', AsyncTopSellingProductsAnalyticsView.as_view(), name='async-analytics-top-products'),
+
     # Add more URLs here as needed
 ]
@@ -1,53 +1,71 @@
 import json
 from .models import *
 
-def cookieCart(request):
-
-	#Create empty cart for now for non-logged in user
+def cookie_cart_lines(request):
+	"""
+	Resolves the 'cart' cookie ({product_id: {'quantity': n}, ...}) with one query.
+	Returns (lines, errors): lines are (product, quantity) for entries with a positive
+	quantity; errors list the entries that are malformed or whose product no longer exists.
+	"""
 	try:
-		cart = json.loads(request.COOKIES['cart'])
-		# print(cart)
-	except:
-		cart = {}
-		print('CART:', cart)
+		cart = json.loads(request.COOKIES.get('cart', '{}'))
+	except ValueError:
+		return [], [{'id': None, 'error': 'Malformed cart cookie.'}]
+	if not isinstance(cart, dict):
+		return [], [{'id': None, 'error': 'Malformed cart cookie.'}]
+
+	quantities = {}
+	errors = []
+	for key, entry in cart.items():
+		try:
+			product_id = int(key)
+			quantity = int(entry['quantity'])
+		except (KeyError, TypeError, ValueError):
+			errors.append({'id': key, 'error': 'Malformed cart entry.'})
+			continue
+		if quantity > 0: #items with negative quantity = lot of freebies
+			quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+	products = Product.objects.in_bulk(list(quantities))
+	lines = []
+	for product_id, quantity in quantities.items():
+		product = products.get(product_id)
+		if product is None:
+			errors.append({'id': product_id, 'error': 'Product no longer exists.'})
+		else:
+			lines.append((product, quantity))
+	return lines, errors
+
+
+def cookieCart(request):
+	#Cart of a non-logged in user, from the 'cart' cookie
+	lines, errors = cookie_cart_lines(request)
 
 	items = []
 	order = {'get_cart_total':0, 'get_cart_items':0, 'shipping':False}
-	cartItems = order['get_cart_items']
-
-	for i in cart:
-		# print(i)
-		#We use try block to prevent items in cart that may have been removed from causing error
-		try:	
-			if(cart[i]['quantity']>0): #items with negative quantity = lot of freebies  
-				cartItems += cart[i]['quantity']
-				product = Product.objects.get(id=i)
-				total = (product.price * cart[i]['quantity'])
-
-				order['get_cart_total'] += total
-				# print(order)
-				order['get_cart_items'] += cart[i]['quantity']
-
-				item = {
-				'id': product.id,
-				'product':product.name, 
-				'price': product.price, 
-				'image':product.image.url, 
-				'quantity':cart[i]['quantity'],
-				'total': total
-				}
-				items.append(item)
-
-				if product.digital == False:
-					order['shipping'] = True
-				# cart_data = {'cartItems':cartItems ,'order':order, 'items':items}
-		except:
-			pass
-			
+
+	for product, quantity in lines:
+		total = (product.price * quantity)
+		order['get_cart_total'] += total
+		order['get_cart_items'] += quantity
+
+		items.append({
+		'id': product.id,
+		'product':product.name, 
+		'price': product.price, 
+		'image':product.image.url if product.image else None, 
+		'quantity':quantity,
+		'total': total
+		})
+
+		if product.digital == False:
+			order['shipping'] = True
+
 	return { 'total_items': order['get_cart_items'],
             'total_cost': order['get_cart_total'],
             'items': items,
-            'shipping': order['shipping']
+            'shipping': order['shipping'],
+            'errors': errors
                 }
 
 
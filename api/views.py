@@ -9,22 +9,31 @@ from .serializers import (
     SalesOverviewSerializer, SalesTrendDataPointSerializer, TopSellingProductSerializer,
     InventorySummarySerializer, AnalyticsDashboardSerializer,
     ManualInventoryAdjustmentSerializer, # Import the new serializer
-    ManualInventoryAdjustmentItemSerializer # Import the item serializer if needed elsewhere, but not strictly required here
+    ManualInventoryAdjustmentItemSerializer, # Import the item serializer if needed elsewhere, but not strictly required here
+    NotificationSerializer
 )
 from .models import (
     Product, Order, OrderItem, ShippingAddress, ProductImage, ProductSize, Buyer, Brand, Supplier, Driver,
-    Category, Location, Inventory, InventoryMovement, Buyer, Supplier # Ensure Buyer and Supplier are imported
+    Category, Location, Inventory, InventoryMovement, Buyer, Supplier, # Ensure Buyer and Supplier are imported
+    Notification
 )
 from accounts.models import Organization, OrganizationRelationship, User
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import generics, status, serializers
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.db.models import Q, Prefetch, Sum
 from .filters import ProductFilter
+from .search import search_product_ids
+from .pagination import KeysetPagination
+from .stock import apply_stock_adjustments, InsufficientStockError
+from .checkout import process_checkout, CheckoutConflictError
+from .cart import apply_cart_changes, CART_ACTIONS
+from .utils import cookie_cart_lines
+from .mail import queue_email
+from .unread import get_unread_counts, mark_read
 from django_filters.rest_framework import DjangoFilterBackend
-from django.core.mail import EmailMessage, send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils import timezone
@@ -32,15 +41,24 @@ from django.urls import reverse
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 from accounts.permissions import IsBuyer, IsAdminOrManager, IsStaff
+from accounts.instrumentation import get_request_stats
+from accounts.relationships import get_accepted_supplier_ids, clear_accepted_supplier_ids
 from djoser.conf import settings as djoser_settings
 from django.db import transaction
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 # Import aggregation functions and date helper
 from .aggregation import (
     get_sales_overview, get_sales_trend, get_top_selling_products,
     get_inventory_summary, get_date_range_from_period
 )
-import json # Import json for UnAuthProcessOrderView
+from .analytics_cache import AnalyticsCache
+from .metrics import CHECKOUT_DURATION, CHECKOUT_LINES, render_metrics
+from django.http import HttpResponse
+import hmac
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 
 # Create your views here.
@@ -52,16 +70,15 @@ class ProductAPIView(generics.ListAPIView):
     """
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated] # Require authentication
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         user = self.request.user
         organization = user.organization
 
         if organization and organization.organization_type in ['buyer', 'both']:
-            print("Using BuyerSupplierProductSerializer") # Add this line
             return BuyerSupplierProductSerializer
         else:
-            print("Using ProductSerializer") # Add this line
             return ProductSerializer
 
     def get_queryset(self):
@@ -74,16 +91,13 @@ class ProductAPIView(generics.ListAPIView):
 
         if organization.organization_type in ['supplier', 'both', 'internal']:
             # Supplier or internal users see their own products
-            return Product.objects.filter(organization=organization).order_by('name')
+            return Product.objects.filter(organization=organization).select_related('category', 'brand').order_by('name')
 
         elif organization.organization_type == 'buyer':
             # Buyers see products from suppliers they have an accepted relationship with
-            accepted_supplier_ids = OrganizationRelationship.objects.filter(
-                buyer_organization=organization,
-                status='accepted'
-            ).values_list('supplier_organization__id', flat=True)
+            accepted_supplier_ids = get_accepted_supplier_ids(self.request, organization)
 
-            return Product.objects.filter(organization__id__in=accepted_supplier_ids).order_by('name')
+            return Product.objects.filter(organization__id__in=accepted_supplier_ids).select_related('category', 'brand').order_by('name')
 
         # Default case or other organization types not explicitly handled
         return Product.objects.none()
@@ -99,6 +113,7 @@ class FilteredProductListView(generics.ListAPIView):
     filter_backends = [DjangoFilterBackend]
     filterset_class = ProductFilter
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         user = self.request.user
@@ -123,16 +138,13 @@ class FilteredProductListView(generics.ListAPIView):
         if organization.organization_type in ['supplier', 'both', 'internal']:
             queryset = queryset.filter(organization=organization)
         elif organization.organization_type == 'buyer':
-            accepted_supplier_ids = OrganizationRelationship.objects.filter(
-                buyer_organization=organization,
-                status='accepted'
-            ).values_list('supplier_organization__id', flat=True)
+            accepted_supplier_ids = get_accepted_supplier_ids(self.request, organization)
             queryset = queryset.filter(organization__id__in=accepted_supplier_ids)
         else:
             return Product.objects.none() # Other organization types not explicitly handled
 
         # DjangoFilterBackend will apply filters on top of this queryset
-        return queryset.order_by('name')
+        return queryset.select_related('category', 'brand').order_by('name')
 
 class ProductSearchView(APIView):
     """
@@ -152,19 +164,23 @@ class ProductSearchView(APIView):
 
         # Filter products based on organization type and relationships
         if organization.organization_type in ['supplier', 'both', 'internal']:
-            queryset = Product.objects.filter(organization=organization)
+            organization_ids = [organization.id]
         elif organization.organization_type == 'buyer':
-            accepted_supplier_ids = OrganizationRelationship.objects.filter(
-                buyer_organization=organization,
-                status='accepted'
-            ).values_list('supplier_organization__id', flat=True)
-            queryset = Product.objects.filter(organization__id__in=accepted_supplier_ids)
+            organization_ids = get_accepted_supplier_ids(self.request, organization)
         else:
             return Response([], status=status.HTTP_200_OK) # Other organization types
 
-        # Apply search query
+        queryset = Product.objects.filter(organization__id__in=organization_ids).select_related('category', 'brand')
+
+        # Apply search query through the full-text index, best match first
         if query:
-            queryset = queryset.filter(Q(name__icontains=query) | Q(description__icontains=query))
+            ranked_ids = search_product_ids(query, organization_ids)
+            if ranked_ids is None:
+                # No full-text index for this database backend
+                queryset = queryset.filter(Q(name__icontains=query) | Q(description__icontains=query))
+            else:
+                rank = {product_id: position for position, product_id in enumerate(ranked_ids)}
+                queryset = sorted(queryset.filter(id__in=ranked_ids), key=lambda product: rank[product.id])
 
         # Select serializer based on user type
         if organization.organization_type in ['buyer', 'both']:
@@ -256,22 +272,16 @@ class CartDataView(APIView):
     authentication_classes = [JWTAuthentication]
 
     def get(self, request, *args, **kwargs):
-        print("--- Inside CartDataView GET method ---")
         user = request.user
-        print(f"User: {user}")
-        print(f"User authenticated: {user.is_authenticated}")
-        print(f"User organization: {user.organization if hasattr(user, 'organization') else 'None'}")
-
-        if not hasattr(user, 'organization') or not user.organization:
-             print("User not associated with an organization.")
+        if not hasattr(user, 'organization') or not user.organization_id:
+             logger.info('Cart requested by a user without an organization', extra={'user_id': user.id})
              return Response({"detail": "User is not associated with an organization."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Assuming a Buyer profile exists for the user (created during login or first cart interaction)
         try:
             buyer = Buyer.objects.get(user=user)
-            print(f"Found Buyer profile for user: {buyer.id}")
         except Buyer.DoesNotExist:
-            print("No Buyer profile found for the user. Cart is empty.")
+            logger.debug('No buyer profile; the cart is empty', extra={'user_id': user.id})
             # If no Buyer profile exists, the cart is empty
             return Response({"items": [], "total_amount": "0.00"}, status=status.HTTP_200_OK)
 
@@ -280,56 +290,72 @@ class CartDataView(APIView):
         order = Order.objects.filter(customer=buyer, status='pending').first()
 
         if order:
-            print(f"Found pending order: {order.id}")
+            logger.debug('Cart loaded', extra={'buyer_id': buyer.id, 'order_id': order.id})
             # Serialize the order data, including its items
             # Pass the request context to the serializer
             serializer = OrderSerializer(order, context={'request': request}) # Added context={'request': request}
-            print("OrderSerializer initialized with request context.")
-            print("--- Exiting CartDataView GET method (Success) ---")
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
-            print("No pending order found for the buyer. Cart is empty.")
+            logger.debug('No pending order; the cart is empty', extra={'buyer_id': buyer.id})
             # If no pending order exists, the cart is empty
-            print("--- Exiting CartDataView GET method (No Order) ---")
             return Response({"items": [], "total_amount": "0.00"}, status=status.HTTP_200_OK)
 
 class updateCartView(APIView):
+    """
+    Changes cart lines. Send one change as {"product_id", "action", "amount"} or
+    several as {"items": [{"product_id", "action", "amount"}, ...]}; action is
+    'add', 'remove' or 'set' ('set' accepts 0 to drop the line). Each change is a
+    single upsert (see api.cart) and the new totals come back with the response.
+    """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated, IsBuyer]
 
-    # Changed from post to patch
-    def patch(self, request, format=None):
-        print("--- Inside updateCartView PATCH method ---") # Updated print statement
-        data = request.data
-        product_id = data.get('product_id')
-        action = data.get('action')
-        amount = data.get('amount')
-        print(f"Received data: product_id={product_id}, action={action}, amount={amount}")
-
-        # Validate action
-        if action not in ['add', 'remove']:
-            print(f"Invalid action received: {action}")
-            return Response({"detail": "Invalid action. Must be 'add' or 'remove'."}, status=status.HTTP_400_BAD_REQUEST)
+    def parse_changes(self, data):
+        """Returns ([(product_id, action, amount)], None) or (None, error response)."""
+        lines = data.get('items')
+        if lines is None:
+            lines = [data]
+        if not isinstance(lines, list) or not lines:
+            return None, Response({"detail": "'items' must be a non-empty list of cart changes."}, status=status.HTTP_400_BAD_REQUEST)
+
+        changes = []
+        for line in lines:
+            if not isinstance(line, dict):
+                return None, Response({"detail": "Each cart change must be an object."}, status=status.HTTP_400_BAD_REQUEST)
+            action = line.get('action')
+            if action not in CART_ACTIONS:
+                logger.debug('Invalid cart action %r', action)
+                return None, Response({"detail": "Invalid action. Must be 'add', 'remove' or 'set'."}, status=status.HTTP_400_BAD_REQUEST)
+            # Validate amount is a positive integer (or zero for 'set')
+            try:
+                amount = int(line.get('amount'))
+            except (ValueError, TypeError):
+                logger.debug('Invalid cart amount %r', line.get('amount'))
+                return None, Response({"detail": "Invalid amount provided."}, status=status.HTTP_400_BAD_REQUEST)
+            if amount < 0 or (amount == 0 and action != 'set'):
+                logger.debug('Invalid cart amount %r', amount)
+                return None, Response({"detail": "Amount must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                product_id = int(line.get('product_id'))
+            except (ValueError, TypeError):
+                return None, Response({"detail": "Invalid product_id provided."}, status=status.HTTP_400_BAD_REQUEST)
+            changes.append((product_id, action, amount))
+        return changes, None
 
-        # Validate amount is a positive integer
-        try:
-            amount = int(amount)
-            if amount <= 0:
-                print(f"Invalid amount received: {amount}")
-                return Response({"detail": "Amount must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
-            print(f"Amount validated: {amount}")
-        except (ValueError, TypeError):
-            print(f"Invalid amount format received: {amount}")
-            return Response({"detail": "Invalid amount provided."}, status=status.HTTP_400_BAD_REQUEST)
+    def patch(self, request, format=None):
+        changes, error = self.parse_changes(request.data)
+        if error:
+            return error
 
-        product = get_object_or_404(Product, id=product_id)
         user = request.user
-        print(f"User: {user}, Product: {product.name}")
-
         if not hasattr(user, 'organization') or not user.organization:
-             print("updateCartView: User not associated with an organization.")
+             logger.info('Cart update by a user without an organization', extra={'user_id': user.id})
              return Response({"detail": "User is not associated with an organization."}, status=status.HTTP_400_BAD_REQUEST)
 
+        products = Product.objects.in_bulk({product_id for product_id, _, _ in changes})
+        if len(products) != len({product_id for product_id, _, _ in changes}):
+            return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
+
         buyer, created = Buyer.objects.get_or_create(
             user=user,
             defaults={
@@ -339,153 +365,90 @@ class updateCartView(APIView):
                 'organization': user.organization # Ensure buyer is linked to organization
             }
         )
-        print(f"updateCartView: Retrieved/Created Buyer: {buyer} (ID: {buyer.id}), Created: {created}")
-
-        if not buyer.organization:
-             if hasattr(user, 'organization') and user.organization:
-                 buyer.organization = user.organization
-                 buyer.save()
-                 print(f"updateCartView: Buyer organization set to: {buyer.organization}")
-             else:
-                 print("updateCartView: Buyer is not associated with an organization after get_or_create.")
-                 return Response({"detail": "Buyer is not associated with an organization."}, status=status.HTTP_400_BAD_REQUEST)
-
-
-        # Get or create the pending order for this buyer
-        order, order_created  = Order.objects.get_or_create(customer=buyer, status='pending')
-        print(f"updateCartView: Retrieved/Created Order: {order} (ID: {order.id}), Created: {order_created}")
+        if not buyer.organization_id:
+            buyer.organization = user.organization
+            buyer.save()
+            logger.debug('Buyer organization set', extra={'buyer_id': buyer.id, 'organization_id': buyer.organization_id})
 
-        # Explicitly set the organization on the order if it's not already set
-        if not order.organization:
-            order.organization = buyer.organization
-            order.save()
-            print(f"updateCartView: Order organization set to: {order.organization}")
-
-        # Ensure the order has an organization before proceeding
-        if not order.organization:
-             print("updateCartView: Could not determine organization for the order.")
-             return Response({"detail": "Could not determine organization for the order."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        with transaction.atomic():
+            # Locking the pending order queues up concurrent changes to the same cart
+            order, order_created = Order.objects.select_for_update().get_or_create(customer=buyer, status='pending')
+            # Explicitly set the organization on the order if it's not already set
+            if not order.organization_id:
+                order.organization = buyer.organization
+                order.save()
+                logger.debug('Order organization set', extra={'order_id': order.id, 'organization_id': order.organization_id})
 
+            quantities = apply_cart_changes(order, [(products[product_id], action, amount) for product_id, action, amount in changes])
+        logger.debug(
+            'Cart updated',
+            extra={'order_id': order.id, 'changes': len(changes), 'items': order.item_count, 'total': order.total_amount}
+        )
 
-        # Use a transaction for atomicity
-        with transaction.atomic():
-            print("updateCartView: Starting atomic transaction.")
-            # Get or create the order item
-            order_item, order_item_created = OrderItem.objects.get_or_create(
-                order=order,
-                product=product,
-                defaults={
-                    'quantity': 0, # Start with 0 if creating
-                    'unit_price': product.price,
-                    'organization': order.organization # Link order item to order's organization
+        response_data = {
+            'total_items': order.get_cart_items,
+            'total_cost': str(order.get_cart_total), # Ensure decimal is string
+        }
+        if 'items' in request.data:
+            response_data['message'] = 'Cart updated'
+            response_data['items'] = [
+                {
+                    'id': product_id,
+                    'quantity': quantity,
+                    'total': str(quantity * products[product_id].price),
                 }
-            )
-            print(f"updateCartView: OrderItem: {order_item}, Created: {order_item_created}")
-
-            current_quantity = order_item.quantity
-            new_quantity = current_quantity
-            print(f"updateCartView: Current quantity: {current_quantity}")
-
-            if action == 'add':
-                new_quantity = current_quantity + amount
-                message = 'Item quantity increased'
-                print(f"updateCartView: Action 'add'. New quantity calculated: {new_quantity}")
-            elif action == 'remove':
-                new_quantity = current_quantity - amount
-                message = 'Item quantity decreased'
-                print(f"updateCartView: Action 'remove'. New quantity calculated: {new_quantity}")
-
-            # Ensure new quantity is not negative
-            new_quantity = max(0, new_quantity)
-            print(f"updateCartView: Final new quantity (min 0): {new_quantity}")
-
-            if new_quantity <= 0:
-                # If the new quantity is 0 or less, delete the item
-                if not order_item_created: # Only delete if the item already existed
-                    order_item_id_to_delete = order_item.id # Store ID before deletion
-                    order_item.delete()
-                    updated_item_data = None # Item was deleted
-                    message = 'Item removed from cart'
-                    print(f"updateCartView: New quantity <= 0. Deleted OrderItem ID: {order_item_id_to_delete}")
-                else:
-                    # Item was just created with quantity 0, no need to delete
-                    updated_item_data = None
-                    message = 'Item quantity is zero'
-                    print("updateCartView: OrderItem was just created with quantity 0. No deletion needed.")
-
-            else:
-                # If the new quantity is greater than 0, update the quantity
-                order_item.quantity = new_quantity
-                order_item.unit_price = product.price # Ensure unit price is current
-                order_item.save()
-                print(f"updateCartView: OrderItem quantity updated to {order_item.quantity} and saved.")
-                # message is already set based on action
-
-                # Prepare updated item data for the response
-                # Re-fetch the order item to get updated calculated properties like get_total
-                try:
-                    # Use select_related to avoid extra query for product
-                    updated_order_item = OrderItem.objects.select_related('product').get(id=order_item.id)
-                    updated_item_data = {
-                        'id': updated_order_item.product.id,
-                        'product': updated_order_item.product.name,
-                        'price': str(updated_order_item.product.price), # Ensure decimal is string
-                        'image': updated_order_item.product.image.url if updated_order_item.product.image else None,
-                        'quantity': updated_order_item.quantity,
-                        'total': str(updated_order_item.get_total), # Use the property
-                        'total_completed_orders': updated_order_item.product.get_completed,
-                    }
-                    print(f"updateCartView: Updated item data prepared: {updated_item_data}")
-                except OrderItem.DoesNotExist:
-                    # This case should ideally not happen if quantity > 0 and save was successful
-                    updated_item_data = None
-                    print("updateCartView: Error: OrderItem not found after saving.")
-
-
-            # Re-fetch the order to get updated totals after item changes
-            order.refresh_from_db()
-            print(f"updateCartView: Order refreshed from DB. Current total items: {order.get_cart_items}, Current total cost: {order.get_cart_total}")
-            print(f"updateCartView: Order status after updateCartView transaction: {order.status}") # Added print statement
-
-            print("updateCartView: Transaction successful. Returning response from updateCartView.")
-            return Response({
-                'message': message,
-                'total_items': order.get_cart_items,
-                'total_cost': str(order.get_cart_total), # Ensure decimal is string
-                'updated_item': updated_item_data # Will be None if item was deleted
-            }, status=status.HTTP_200_OK)
+                for product_id, quantity in quantities.items()
+            ]
+            return Response(response_data, status=status.HTTP_200_OK)
+
+        # Single change: same response as before batching
+        product_id, action, _ = changes[0]
+        product = products[product_id]
+        quantity = quantities[product_id]
+        if quantity <= 0:
+            response_data['message'] = 'Item removed from cart'
+            response_data['updated_item'] = None # Item was deleted
+        else:
+            response_data['message'] = {'add': 'Item quantity increased', 'remove': 'Item quantity decreased', 'set': 'Item quantity updated'}[action]
+            response_data['updated_item'] = {
+                'id': product.id,
+                'product': product.name,
+                'price': str(product.price), # Ensure decimal is string
+                'image': product.image.url if product.image else None,
+                'quantity': quantity,
+                'total': str(quantity * product.price),
+                'total_completed_orders': product.get_completed,
+            }
+        return Response(response_data, status=status.HTTP_200_OK)
 
 def send_purchase_confirmation_email(user_email, first_name, order, total):
-    print("--- Inside send_purchase_confirmation_email ---")
+    """Renders the purchase confirmation and queues it; the send_queued_emails worker delivers it."""
     shipping_address = None
     if order.shipping_address:
         shipping_address = order.shippingaddress_set.all().first()
-        print(f"Shipping address found: {shipping_address}")
 
     try:
         template = render_to_string('api/email_template.html', {
             'order': order,
-            'orderitems': order.items.all(),
+            'orderitems': order.items.select_related('product'),
             "first_name": first_name,
             "total": total,
             'shipping_address': shipping_address
         })
-        print("Email template rendered successfully.")
-    except Exception as e:
-        print(f"Error rendering email template: {e}")
+    except Exception:
+        logger.exception('Error rendering the purchase confirmation email', extra={'order_id': order.id})
+        return None
 
-    email = EmailMessage(
+    email = queue_email(
         'Your purchase has been confirmed',
         template,
-        settings.EMAIL_HOST_USER,
         [user_email],
+        from_email=settings.EMAIL_HOST_USER,
+        related_object=order,
+        organization=order.organization
     )
-    email.fail_silently=False
-    try:
-        email.send()
-        print(f"Purchase confirmation email sent to {user_email}.")
-    except Exception as e:
-        print(f"Error sending email to {user_email}: {e}")
+    logger.debug('Purchase confirmation email queued', extra={'order_id': order.id, 'email_id': email.id})
+    return email
 
 class ProcessOrderView(APIView):
     # Allow IsBuyer OR IsAdminOrManager | IsStaff to process orders
@@ -493,48 +456,47 @@ class ProcessOrderView(APIView):
     authentication_classes = [JWTAuthentication]
 
     def post(self, request, format=None):
-        print("--- Inside ProcessOrderView POST method ---")
         user_info = request.data.get('user_info')
         shipping_info = request.data.get('shipping_info')
         total_str = request.data.get('total') # Get total as string initially
-        print(f"Received total string from frontend: {total_str}")
 
         user = request.user
         organization = user.organization
-        print(f"Processing order for User: {user}, Organization: {organization}")
+        logger.debug('Processing order', extra={'user_id': user.id, 'organization_id': user.organization_id, 'total': total_str})
 
         if not organization:
-             print("User not associated with an organization.")
+             logger.info('Order processing by a user without an organization', extra={'user_id': user.id})
              return Response({"detail": "User is not associated with an organization."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Ensure the user is authorized to process orders for this organization type
         if organization.organization_type not in ['buyer', 'supplier', 'both', 'internal']:
-             print(f"Organization type {organization.organization_type} not authorized to process orders.")
+             logger.info('Organization type %s is not authorized to process orders', organization.organization_type, extra={'organization_id': organization.id})
              return Response({"detail": "Your organization type is not authorized to process orders."}, status=status.HTTP_403_FORBIDDEN)
 
         # If the user is a buyer, they process their own orders
         if organization.organization_type == 'buyer':
              buyer, created = Buyer.objects.get_or_create(user=user, defaults={'first_name': user.first_name, 'last_name': user.last_name, 'email': user.email})
-             print(f"Retrieved/Created Buyer: {buyer} (ID: {buyer.id}), Created: {created}")
 
-             # Get all pending orders for this buyer
-             pending_orders = Order.objects.filter(customer=buyer, status='pending').order_by('-order_date')
-             print(f"Found {pending_orders.count()} pending orders for buyer {buyer.id}.")
-             for po in pending_orders:
-                 print(f"- Pending Order ID: {po.id}, Status: {po.status}, Items Count: {po.items.count()}, Total: {po.get_cart_total}")
+             # Get all pending orders for this buyer, most recent first; two are enough to spot duplicates
+             pending_orders = list(Order.objects.filter(customer=buyer, status='pending').order_by('-order_date')[:2])
+             if logger.isEnabledFor(logging.DEBUG):
+                 # Costs a query per order, so only when someone is reading it
+                 for po in Order.objects.filter(customer=buyer, status='pending').order_by('-order_date'):
+                     logger.debug(
+                         'Pending order',
+                         extra={'buyer_id': buyer.id, 'order_id': po.id, 'lines': po.items.count(), 'items': po.item_count, 'total': po.total_amount}
+                     )
 
              # Get the most recent pending order
-             order = pending_orders.first()
-             print(f"Selected Pending Order: {order} (ID: {order.id if order else 'None'})")
-
+             order = pending_orders[0] if pending_orders else None
 
              if not order:
-                 print("No pending order found for this buyer.")
+                 logger.info('No pending order found', extra={'buyer_id': buyer.id})
                  return Response({"detail": "No pending order found."}, status=status.HTTP_400_BAD_REQUEST)
 
              # Optional: Check for multiple pending orders (indicates a potential issue in cart logic)
-             if pending_orders.count() > 1:
-                 print(f"Warning: Multiple pending orders found for buyer {buyer.id}. Processing the most recent one (ID: {order.id}).")
+             if len(pending_orders) > 1:
+                 logger.warning('Multiple pending orders found; processing the most recent one', extra={'buyer_id': buyer.id, 'order_id': order.id})
                  # You might want to add more robust handling here, e.g., error or process the most recent one.
                  # For now, we proceed with the most recent one retrieved above.
 
@@ -547,117 +509,74 @@ class ProcessOrderView(APIView):
         elif organization.organization_type in ['supplier', 'both', 'internal']:
              # This view is primarily for the buyer completing their own order.
              # Processing orders initiated by buyers from the supplier side would require a different view/logic.
-             print("Supplier/Internal user attempting to use buyer process order endpoint.")
+             logger.info('Non-buyer organization used the buyer process order endpoint', extra={'user_id': user.id, 'organization_id': organization.id})
              return Response({"detail": "This endpoint is primarily for buyers to complete their own orders."}, status=status.HTTP_403_FORBIDDEN)
 
         # Get a default location for the buyer's organization
         # You might need more sophisticated logic to determine the correct receiving location
         buyer_default_location = Location.objects.filter(organization=organization).first()
-        print(f"Buyer default location: {buyer_default_location}")
 
         if not buyer_default_location:
-             print("Buyer organization has no locations defined.")
+             logger.info('Buyer organization has no locations defined', extra={'organization_id': organization.id})
              # Handle the case where the buyer's organization has no locations
              return Response({"detail": "Your organization does not have any locations defined. Cannot process order."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Convert the received total to Decimal for precise comparison
         try:
             received_total = Decimal(total_str)
-            print(f"Received total as Decimal: {received_total}")
         except (ValueError, TypeError):
-            print(f"Invalid total amount provided: {total_str}")
+            logger.info('Invalid total amount provided: %r', total_str, extra={'order_id': order.id})
             return Response({"detail": "Invalid total amount provided."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Use a transaction to ensure atomicity of inventory updates
+        checkout_started = time.perf_counter()
         with transaction.atomic():
-            print("Starting atomic transaction for order processing.")
             # Check the order items and calculated total before comparison
             order.refresh_from_db() # Ensure the order object is fresh
-            print(f"Order {order.id} status: {order.status}")
-            print(f"Order {order.id} items count: {order.items.count()}")
-            print(f"Order {order.id} calculated total: {order.get_cart_total}")
+            logger.debug(
+                'Checking order total',
+                extra={'order_id': order.id, 'status': order.status, 'items': order.get_cart_items, 'total': order.get_cart_total}
+            )
 
             # Compare Decimal values
             if received_total == order.get_cart_total: # Compare Decimal with Decimal
-                print("Total match. Processing order.")
                 order.status = 'completed'
                 order.date_completed = timezone.now()
                 order.save()
-                print(f"Order {order.id} status updated to 'completed'.")
-
-                # Process each order item for inventory updates
-                for order_item in order.items.all(): # Use order.items.all() to access related items
-                    product = order_item.product
-                    quantity_purchased = order_item.quantity
-                    print(f"Processing item for inventory update: Product {product.sku}, Quantity {quantity_purchased}")
-
-                    # --- Supplier Inventory Update ---
-                    supplier_organization = product.organization
-                    if supplier_organization and supplier_organization.organization_type in ['supplier', 'both']:
-                        print(f"Product belongs to supplier organization: {supplier_organization.name}")
-                        supplier_inventory_item = Inventory.objects.filter(
-                            product=product,
-                            organization=supplier_organization
-                        ).first()
-                        print(f"Supplier inventory item found: {supplier_inventory_item}")
-
-                        if supplier_inventory_item:
-                            # Decrease supplier's inventory *before* creating the movement
-                            supplier_inventory_item.quantity -= quantity_purchased
-                            supplier_inventory_item.last_sold = timezone.now()
-                            supplier_inventory_item.save()
-                            print(f"Supplier inventory updated for {product.sku}. New quantity: {supplier_inventory_item.quantity}")
-
-                            # Create supplier inventory movement (subtraction/sale)
-                            InventoryMovement.objects.create(
-                                inventory=supplier_inventory_item,
-                                movement_type='sale',
-                                quantity_change=-quantity_purchased, # Negative for subtraction
-                                quantity_after_movement=supplier_inventory_item.quantity, # Set quantity after change
-                                user=user, # User who processed the order (the buyer in this flow)
-                                organization=supplier_organization, # The supplier's organization
-                                note=f"Sale to {organization.name} (Order {order.id})"
-                            )
-                            print("Supplier inventory movement recorded.")
-                        else:
-                            print(f"Warning: Supplier inventory item not found for product {product.sku} at organization {supplier_organization.name}")
-
-
-                    # --- Buyer Inventory Update ---
-                    buyer_inventory_item, created = Inventory.objects.get_or_create(
-                        product=product,
-                        organization=organization, # The buyer's organization
-                        location=buyer_default_location, # Use the fetched location
-                        defaults={'quantity': 0} # Start with 0 if creating
+
+                # Move the stock for all order items at once: supplier and buyer inventory rows are
+                # resolved with one query each and updated with one statement per side
+                try:
+                    movements = process_checkout(order, organization, buyer_default_location, user=user)
+                except InsufficientStockError as e:
+                    logger.info('%s; rolling back the order', e, extra={'order_id': order.id})
+                    transaction.set_rollback(True)
+                    return Response(
+                        {"detail": f"Insufficient stock for {e.inventory.product.name}. Order not processed."},
+                        status=status.HTTP_400_BAD_REQUEST
                     )
-                    print(f"Buyer inventory item found/created: {buyer_inventory_item}, Created: {created}")
-
-                    # Increase buyer's inventory *before* creating the movement
-                    buyer_inventory_item.quantity += quantity_purchased
-                    buyer_inventory_item.save()
-                    print(f"Buyer inventory updated for {product.sku}. New quantity: {buyer_inventory_item.quantity}")
-
-                    # Create buyer inventory movement (addition/purchase)
-                    InventoryMovement.objects.create(
-                        inventory=buyer_inventory_item,
-                        movement_type='purchase',
-                        quantity_change=quantity_purchased, # Positive for addition
-                        quantity_after_movement=buyer_inventory_item.quantity, # Set quantity after change
-                        user=user, # User who processed the order (the buyer)
-                        organization=organization, # The buyer's organization
-                        note=f"Purchase from {supplier_organization.name} (Order {order.id})"
+                except CheckoutConflictError as e:
+                    logger.info('%s; rolling back the order', e, extra={'order_id': order.id})
+                    transaction.set_rollback(True)
+                    return Response(
+                        {"detail": "The supplier's stock changed during checkout. Please review your cart and try again."},
+                        status=status.HTTP_409_CONFLICT
                     )
-                    print("Buyer inventory movement recorded.")
+                # One purchase movement per order line
+                CHECKOUT_DURATION.observe(time.perf_counter() - checkout_started)
+                CHECKOUT_LINES.observe(sum(1 for movement in movements if movement.movement_type == 'purchase'))
 
             else:
                 # Handle total mismatch
-                print(f"Total mismatch for Order {order.id}: Received {received_total}, Calculated {order.get_cart_total}")
+                logger.info(
+                    'Total mismatch; order not processed',
+                    extra={'order_id': order.id, 'received_total': received_total, 'total': order.get_cart_total}
+                )
                 return Response({"detail": "Total mismatch. Order not processed."}, status=status.HTTP_400_BAD_REQUEST)
 
 
         # Check if shipping is required based on the order object
         if order.shipping_address: # Assuming shipping_address field indicates if shipping is needed
-            print("Shipping address exists on order. Creating ShippingAddress object.")
             ShippingAddress.objects.create(
             customer=buyer,
             order=order,
@@ -667,60 +586,98 @@ class ProcessOrderView(APIView):
             zipcode=shipping_info.get('zipcode'),
             country=shipping_info.get('country')
             )
-            print("ShippingAddress object created.")
 
         # Pass the Decimal total to the email function
-        print("Sending purchase confirmation email.")
         send_purchase_confirmation_email(request.user.email, request.user.first_name, order, received_total)
-        print("Purchase confirmation email sent.")
 
         # Return order status based on the 'status' field
-        print(f"Order processing complete. Returning status: {order.status}")
+        logger.info('Order completed', extra={'order_id': order.id, 'movements': len(movements), 'total': received_total})
         return Response({'order_status': order.status, 'redirect': '/'}, status=status.HTTP_200_OK)
 
 class UnAuthProcessOrderView(APIView):
-    def post(self, request, format=None):         
+    """
+    Checkout for guests. The cart comes from the 'cart' cookie: its products are
+    resolved with one query and the order lines are inserted with one bulk_create.
+    """
+    def post(self, request, format=None):
         user_info = request.data.get('user_info')
-        shipping_info = request.data.get('shipping_info')
-        total = request.data.get('total')
-        first_name = user_info['first_name']
-        last_name = user_info['last_name']
-        email = user_info['email']
-
-        buyer, created = Buyer.objects.get_or_create(first_name=first_name, last_name=last_name, email=email)
-        order, created = Order.objects.get_or_create(customer=buyer, complete=False)
-        cart = json.loads(request.COOKIES['cart'])
-        for i in cart:
-            if cart[i]['quantity'] > 0:  
-                product = Product.objects.get(id=i)
-                OrderItem.objects.get_or_create(
-                order=order, 
-                product=product,
-                defaults={'quantity': cart[i]['quantity']}
+        shipping_info = request.data.get('shipping_info') or {}
+        try:
+            first_name = user_info['first_name']
+            last_name = user_info['last_name']
+            email = user_info['email']
+        except (KeyError, TypeError):
+            return Response({"detail": "user_info with first_name, last_name and email is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            received_total = Decimal(str(request.data.get('total')))
+        except (InvalidOperation, ValueError, TypeError):
+            logger.info('Invalid guest order total: %r', request.data.get('total'))
+            return Response({"detail": "Invalid total amount provided."}, status=status.HTTP_400_BAD_REQUEST)
+
+        lines, errors = cookie_cart_lines(request)
+        if errors:
+            logger.info('Guest cart entries could not be processed', extra={'errors': errors})
+            return Response({"detail": "Some cart entries could not be processed.", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        if not lines:
+            return Response({"detail": "Cart is empty."}, status=status.HTTP_400_BAD_REQUEST)
+
+        total_amount = sum((product.price * quantity for product, quantity in lines), Decimal('0.00'))
+        if received_total != total_amount: # Compare Decimal with Decimal
+            logger.info('Guest order total mismatch', extra={'received': received_total, 'calculated': total_amount})
+            return Response({"detail": "Total mismatch. Order not processed."}, status=status.HTTP_400_BAD_REQUEST)
+
+        shipping = any(not product.digital for product, _ in lines)
+        with transaction.atomic():
+            buyer, created = Buyer.objects.get_or_create(first_name=first_name, last_name=last_name, email=email)
+            # The totals are known up front; bulk_create skips OrderItem.save, which would otherwise maintain them
+            order = Order.objects.create(
+                customer=buyer,
+                status='pending',
+                total_amount=total_amount,
+                item_count=sum(quantity for _, quantity in lines)
             )
-        
-        if round(float(total), 2) == round(float(order.get_cart_total), 2): # Compare floats carefully
-            order.complete = True
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=product,
+                    quantity=quantity,
+                    unit_price=product.price,
+                    subtotal=product.price * quantity,
+                    organization_id=product.organization_id
+                )
+                for product, quantity in lines
+            ])
+
+            if shipping and shipping_info.get('address'):
+                ShippingAddress.objects.create(
+                customer=buyer,
+                order=order,
+                address=shipping_info.get('address'),
+                city=shipping_info.get('city') or '',
+                state=shipping_info.get('state') or '',
+                zipcode=shipping_info.get('zipcode') or '',
+                country=shipping_info.get('country') or ''
+                )
+                order.shipping_address = shipping_info.get('address')
+
+            # Completed only now, so the sales rollup sees the lines
+            order.status = 'completed'
             order.date_completed = timezone.now()
             order.save()
-        
-        if order.shipping == True:
-            ShippingAddress.objects.create(
-            customer=buyer,
-            order=order,
-            address=shipping_info['address'],
-            city=shipping_info['city'],
-            state=shipping_info['state'],
-            zipcode=shipping_info['zipcode'],
-            country=shipping_info['country']
-            )
-        send_purchase_confirmation_email(email, first_name, order, total)
+            logger.info('Guest order completed', extra={'order_id': order.id, 'lines': len(lines)})
 
-        response = Response({'order_status': order.complete, 'redirect': '/'}, status=status.HTTP_200_OK)
+        send_purchase_confirmation_email(email, first_name, order, received_total)
+
+        response = Response({'order_status': order.status, 'redirect': '/'}, status=status.HTTP_200_OK)
         response.delete_cookie('cart') # Clear the cart cookie after successful unauthenticated order
         return response
 
 def send_organization_activation_email(organization):
+    """
+    Renders the activation email and queues it. organization.email_sent is set by
+    the send_queued_emails worker once the email has actually been delivered.
+    """
     subject = 'Activate Your StockSync Organization'
     activation_link = settings.FRONTEND_URL + reverse('api:activate-organization', kwargs={'token': organization.activation_token})
 
@@ -729,21 +686,16 @@ def send_organization_activation_email(organization):
         'activation_link': activation_link,
     })
 
-    email = EmailMessage(
+    email = queue_email(
         subject,
         template,
-        settings.EMAIL_HOST_USER,
         [organization.contact_email],
+        from_email=settings.EMAIL_HOST_USER,
+        related_object=organization,
+        organization=organization
     )
-    email.fail_silently = False
-
-    try:
-        email.send()
-        organization.email_sent = True
-        organization.save(update_fields=['email_sent'])
-        print(f"Activation email sent successfully to {organization.contact_email}")
-    except Exception as e:
-        print(f"Error sending activation email to {organization.contact_email}: {e}")
+    logger.info('Activation email queued', extra={'organization_id': organization.id, 'email_id': email.id})
+    return email
 
 class OrganizationCreateView(generics.CreateAPIView):
     queryset = Organization.objects.all()
@@ -755,8 +707,8 @@ class OrganizationCreateView(generics.CreateAPIView):
         if organization.contact_email:
             try:
                 send_organization_activation_email(organization)
-            except Exception as e:
-                print(f"Error sending activation email to {organization.contact_email}: {e}")
+            except Exception:
+                logger.exception('Error queuing the activation email', extra={'organization_id': organization.id})
 
 class OrganizationActivationView(APIView):
     permission_classes = [AllowAny]
@@ -845,6 +797,7 @@ class OrganizationOnboardingView(generics.CreateAPIView):
 class OrganizationRelationshipListView(generics.ListAPIView):
     serializer_class = OrganizationRelationshipSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -907,6 +860,8 @@ class OrganizationRelationshipUpdateView(generics.UpdateAPIView):
              raise serializers.ValidationError({"status": "Status can only be changed to 'accepted' or 'rejected'."})
 
         self.perform_update(serializer)
+        # The accepted supplier set memoized for this request is now stale
+        clear_accepted_supplier_ids(request)
 
         if getattr(instance, '_prefetched_objects_cache', None):
             instance._prefetched_objects_cache = {}
@@ -920,6 +875,7 @@ class PotentialSupplierListView(generics.ListAPIView):
     """
     serializer_class = PotentialSupplierSerializer
     permission_classes = [IsAuthenticated] # Only authenticated users can see this list
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -948,6 +904,7 @@ class InventoryListView(generics.ListAPIView):
     """
     # serializer_class is now determined dynamically
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         user = self.request.user
@@ -973,10 +930,7 @@ class InventoryListView(generics.ListAPIView):
         # If the user's organization is a Buyer (or both)
         if organization.organization_type in ['buyer', 'both']:
             # Get IDs of organizations that are accepted suppliers to the buyer's organization
-            accepted_supplier_ids = OrganizationRelationship.objects.filter(
-                buyer_organization=organization,
-                status='accepted'
-            ).values_list('supplier_organization__id', flat=True)
+            accepted_supplier_ids = get_accepted_supplier_ids(self.request, organization)
 
             # Filter inventory where:
             # 1. The inventory item belongs to the buyer's own organization OR
@@ -1028,10 +982,7 @@ class InventoryDetailView(generics.RetrieveAPIView):
         queryset = Inventory.objects.select_related('product', 'location')
 
         if organization.organization_type in ['buyer', 'both']:
-            accepted_supplier_ids = OrganizationRelationship.objects.filter(
-                buyer_organization=organization,
-                status='accepted'
-            ).values_list('supplier_organization__id', flat=True)
+            accepted_supplier_ids = get_accepted_supplier_ids(self.request, organization)
 
             # Filter inventory where:
             # 1. The inventory item belongs to the buyer's own organization OR
@@ -1152,6 +1103,7 @@ class InventoryMovementListView(generics.ListAPIView):
     """
     serializer_class = InventoryMovementSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -1172,10 +1124,7 @@ class InventoryMovementListView(generics.ListAPIView):
             # Buyers see movements for inventory items belonging to:
             # 1. Their own organization OR
             # 2. Products from organizations they have an 'accepted' supplier relationship with.
-            accepted_supplier_ids = OrganizationRelationship.objects.filter(
-                buyer_organization=organization,
-                status='accepted'
-            ).values_list('supplier_organization__id', flat=True)
+            accepted_supplier_ids = get_accepted_supplier_ids(self.request, organization)
 
             queryset = queryset.filter(
                 Q(inventory__organization=organization) | Q(inventory__product__organization__id__in=accepted_supplier_ids)
@@ -1220,6 +1169,7 @@ class BrandListView(generics.ListCreateAPIView):
     serializer_class = BrandSerializer
     # Allow IsBuyer OR IsAdminOrManager
     permission_classes = [IsAuthenticated, IsBuyer | IsAdminOrManager]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -1273,6 +1223,7 @@ class CategoryListView(generics.ListCreateAPIView):
     serializer_class = CategorySerializer
     # Allow IsBuyer OR IsAdminOrManager
     permission_classes = [IsAuthenticated, IsBuyer | IsAdminOrManager]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -1326,6 +1277,7 @@ class LocationListView(generics.ListCreateAPIView):
     serializer_class = LocationSerializer
     # Allow IsBuyer OR IsAdminOrManager
     permission_classes = [IsAuthenticated, IsBuyer | IsAdminOrManager]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -1402,8 +1354,9 @@ class AnalyticsDashboardView(APIView):
                  start_date, end_date = get_date_range_from_period('this_month')
 
 
-        sales_overview_data = get_sales_overview(organization, start_date, end_date)
-        inventory_summary_data = get_inventory_summary(organization)
+        analytics_cache = AnalyticsCache(organization)
+        sales_overview_data = analytics_cache.sales_overview(start_date, end_date)
+        inventory_summary_data = analytics_cache.inventory_summary()
         # top_products_revenue = get_top_selling_products(organization, start_date, end_date, limit=5, by='revenue')
         # top_products_units = get_top_selling_products(organization, start_date, end_date, limit=5, by='units')
 
@@ -1416,7 +1369,7 @@ class AnalyticsDashboardView(APIView):
         }
 
         serializer = AnalyticsDashboardSerializer(dashboard_data)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return analytics_cache.add_headers(Response(serializer.data, status=status.HTTP_200_OK))
 
 class SalesTrendAnalyticsView(APIView):
     """
@@ -1452,9 +1405,10 @@ class SalesTrendAnalyticsView(APIView):
         except ValueError:
             return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
 
-        trend_data = get_sales_trend(organization, start_date, end_date, interval)
+        analytics_cache = AnalyticsCache(organization)
+        trend_data = analytics_cache.sales_trend(start_date, end_date, interval)
         serializer = SalesTrendDataPointSerializer(trend_data, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return analytics_cache.add_headers(Response(serializer.data, status=status.HTTP_200_OK))
 
 class TopSellingProductsAnalyticsView(APIView):
     """
@@ -1490,9 +1444,10 @@ class TopSellingProductsAnalyticsView(APIView):
         if by_param not in ['revenue', 'units']:
             return Response({"error": "Invalid 'by' parameter. Choose 'revenue' or 'units'."}, status=status.HTTP_400_BAD_REQUEST)
 
-        top_products_data = get_top_selling_products(organization, start_date, end_date, limit, by_param)
+        analytics_cache = AnalyticsCache(organization)
+        top_products_data = analytics_cache.top_selling_products(start_date, end_date, limit, by_param)
         serializer = TopSellingProductSerializer(top_products_data, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return analytics_cache.add_headers(Response(serializer.data, status=status.HTTP_200_OK))
 
 class ManualInventoryAdjustmentView(APIView):
     """
@@ -1506,13 +1461,11 @@ class ManualInventoryAdjustmentView(APIView):
     serializer_class = ManualInventoryAdjustmentSerializer # Set the serializer class
 
     def post(self, request, *args, **kwargs):
-        print("--- Inside ManualInventoryAdjustmentView POST method ---")
         user = request.user
         organization = user.organization
-        print(f"User: {user}, Organization: {organization}")
 
         if not organization:
-             print("User not associated with an organization.")
+             logger.info('Inventory adjustment by a user without an organization', extra={'user_id': user.id})
              return Response({"detail": "User is not associated with an organization."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Use the serializer to validate the input data
@@ -1521,65 +1474,111 @@ class ManualInventoryAdjustmentView(APIView):
 
         movement_type = serializer.validated_data['movement_type']
         items_data = serializer.validated_data['items']
-        inventory_dict = serializer.validated_data['_inventory_items'] # Get pre-fetched inventory items
 
-        print(f"Processing manual inventory adjustment: Type='{movement_type}', Items Count={len(items_data)}")
+        logger.debug(
+            'Processing manual inventory adjustment',
+            extra={'user_id': user.id, 'organization_id': organization.id, 'movement_type': movement_type, 'items': len(items_data)}
+        )
 
         try:
-            with transaction.atomic():
-                print("Starting atomic transaction for manual inventory adjustment.")
-                for item_data in items_data:
-                    inventory_id = item_data['inventory_id'].id
-                    quantity_change_abs = item_data['quantity'] # Absolute quantity change
-                    note = item_data.get('note')
-                    reference = item_data.get('reference')
-
-                    inventory = inventory_dict[inventory_id]
-                    print(f"Processing item: Inventory ID={inventory.id}, Product='{inventory.product.name}', Quantity Change (abs)={quantity_change_abs}")
-
-                    if movement_type == 'addition':
-                        # add_stock method should handle quantity update, movement creation, and low stock check
-                        inventory.add_stock(
-                            quantity_change_abs,
-                            user=user,
-                            organization=organization,
-                            note=note,
-                            reference=reference
-                        )
-                        print(f"Added {quantity_change_abs} to inventory {inventory.id}. New quantity: {inventory.quantity}")
-
-                    elif movement_type in ['removal', 'sale']:
-                        # Check for sufficient stock (already done by serializer, but double-check)
-                        if inventory.quantity < quantity_change_abs:
-                             # This should be caught by the serializer, but as a safeguard:
-                             print(f"Insufficient stock detected during processing for {movement_type}: {inventory.product.name}")
-                             raise serializers.ValidationError(f"Insufficient stock for {movement_type}: {inventory.product.name}")
-
-                        # Use the remove_stock method which should handle quantity update, movement creation, and low stock check
-                        inventory.remove_stock(
-                            quantity_change_abs,
-                            user=user,
-                            organization=organization,
-                            note=note or f"Manual {movement_type} of {quantity_change_abs} units",
-                            reference=reference
-                        )
-                        print(f"Removed {quantity_change_abs} from inventory {inventory.id} ({movement_type}). New quantity: {inventory.quantity}")
-
-
-                    # The 'adjustment' case logic needs to be defined based on how you want it to behave
-                    # with the current serializer structure (quantity >= 1).
-                    # If 'adjustment' means adding/removing a specific amount, the serializer/logic needs refinement.
-                    # For now, we proceed with addition, removal, sale.
-
-
-                print("Manual inventory adjustment transaction successful.")
-                return Response({"detail": "Inventory adjusted successfully."}, status=status.HTTP_200_OK)
-
+            # The 'adjustment' case logic needs to be defined based on how you want it to behave
+            # with the current serializer structure (quantity >= 1).
+            # If 'adjustment' means adding/removing a specific amount, the serializer/logic needs refinement.
+            # For now, we proceed with addition, removal, sale.
+            if movement_type in ['addition', 'removal', 'sale']:
+                # Locks the rows once, one bulk_update, one bulk_create and one alert pass for the whole batch
+                apply_stock_adjustments(organization, movement_type, items_data, user=user)
+
+            return Response({"detail": "Inventory adjusted successfully."}, status=status.HTTP_200_OK)
+
+        except InsufficientStockError as e:
+            # Stock was taken by a concurrent request after validation
+            logger.info('Insufficient stock during manual adjustment: %s', e, extra={'inventory_id': e.inventory.id})
+            return Response({"items": {str(e.inventory.id): str(e)}}, status=status.HTTP_400_BAD_REQUEST)
         except serializers.ValidationError as e:
-            print(f"Validation error during manual adjustment: {e.detail}")
+            logger.info('Validation error during manual adjustment: %s', e.detail)
             return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            # Log the error
-            print(f"Error during manual inventory adjustment: {e}")
+        except Exception:
+            logger.exception('Error during manual inventory adjustment', extra={'organization_id': organization.id, 'movement_type': movement_type})
             # In production, avoid returning raw exception details
-            return Response({"detail": "An internal server error occurred."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({"detail": "An internal server error occurred."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class NotificationListView(generics.ListAPIView):
+    """
+    The user's notifications, newest first, with keyset paging. ?unread=true
+    lists only the unread ones.
+    """
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(user=self.request.user).order_by('-timestamp')
+        if self.request.query_params.get('unread', '').lower() in ['1', 'true']:
+            queryset = queryset.filter(read_status=False)
+        return queryset
+
+
+class UnreadCountView(APIView):
+    """Unread notification and communication counts, read from the per-user counters."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        counts = get_unread_counts(request.user)
+        return Response({
+            'notifications': counts['notification'],
+            'communications': counts['communication'],
+        }, status=status.HTTP_200_OK)
+
+
+class MarkReadView(APIView):
+    """
+    Marks the user's notifications (or communications) as read: those listed in
+    "ids", or all of them without it. The rows and the unread counter are updated
+    in one transaction.
+    """
+    permission_classes = [IsAuthenticated]
+    kind = 'notification'
+
+    def post(self, request, *args, **kwargs):
+        ids = request.data.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list):
+                return Response({"detail": "'ids' must be a list of IDs."}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                ids = [int(value) for value in ids]
+            except (ValueError, TypeError):
+                return Response({"detail": "'ids' must be a list of IDs."}, status=status.HTTP_400_BAD_REQUEST)
+
+        marked = mark_read(self.kind, request.user, ids=ids)
+        return Response({
+            'marked_read': marked,
+            'unread': get_unread_counts(request.user)[self.kind],
+        }, status=status.HTTP_200_OK)
+
+
+class RequestStatsView(APIView):
+    """Staff only: the request time histograms, query counts and DB/serializer time per view of this process."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_request_stats(), status=status.HTTP_200_OK)
+
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint (api.metrics). With METRICS_TOKEN set, the scraper
+    sends it as "Authorization: Bearer <token>". Without one, only addresses in
+    METRICS_ALLOWED_IPS (or anyone with DEBUG on) get the metrics; everyone else
+    gets a 404, as if the endpoint did not exist.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        expected = f'Bearer {token}'
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+    elif not settings.DEBUG and request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        return HttpResponse('Not Found\n', status=404, content_type='text/plain')
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,101 @@
+"""
+Logging setup for the project: structured records and per-module levels.
+
+Code logs with the standard library and lazy %-formatting, and puts the values
+worth filtering on in extra:
+
+    logger = logging.getLogger(__name__)
+    logger.debug('Cart updated', extra={'order_id': order.id, 'items': order.item_count})
+
+A call below the logger's level returns after one cached level check, so the
+message is never formatted and its arguments' __str__ (which may hit the
+database) never runs. Values that exist only to be logged and cost a query must
+still be guarded with logger.isEnabledFor(logging.DEBUG).
+
+StructuredFormatter renders the extra fields after the message as key=value
+pairs (LOG_FORMAT=text) or the whole record as one JSON object per line
+(LOG_FORMAT=json). Levels are set with LOG_LEVEL for the project's apps and
+LOG_LEVELS for single modules, e.g. LOG_LEVELS="api.views=DEBUG,api.stock=WARNING".
+
+This module is imported by the settings, so it must not import Django.
+"""
+import json
+import logging
+
+# Attributes every LogRecord has; anything else on a record came from extra
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+def record_fields(record):
+    """The extra fields of a record, in the order they were given."""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, output='text', **kwargs):
+        kwargs.setdefault('fmt', '%(asctime)s %(levelname)s %(name)s %(message)s')
+        super().__init__(**kwargs)
+        self.output = output
+
+    def format(self, record):
+        if self.output == 'json':
+            entry = {
+                'time': self.formatTime(record),
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage(),
+            }
+            entry.update(record_fields(record))
+            if record.exc_info:
+                entry['exception'] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+
+        message = super().format(record)
+        fields = record_fields(record)
+        if not fields:
+            return message
+        pairs = ' '.join(f'{key}={value}' for key, value in fields.items())
+        # Keep a traceback (added by super().format) below the fields
+        first_line, separator, rest = message.partition('\n')
+        return f'{first_line} {pairs}{separator}{rest}'
+
+
+def parse_log_levels(value):
+    """'api.views=DEBUG,api.stock=warning' -> {'api.views': 'DEBUG', 'api.stock': 'WARNING'}"""
+    levels = {}
+    for entry in (value or '').split(','):
+        if not entry.strip():
+            continue
+        name, separator, level = entry.partition('=')
+        if not separator or not name.strip() or not level.strip():
+            raise ValueError(f"Invalid LOG_LEVELS entry {entry!r}; expected <module>=<level>")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def build_logging_config(apps, level='INFO', module_levels=None, output='text'):
+    """
+    A LOGGING dict for the settings: the project's apps log to one console
+    handler at level, the given modules at theirs. Django's own loggers keep
+    their default configuration.
+    """
+    loggers = {app: {'handlers': ['console'], 'level': level.upper(), 'propagate': False} for app in apps}
+    for name, module_level in (module_levels or {}).items():
+        loggers.setdefault(name, {})['level'] = module_level
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'structured': {
+                '()': 'stocksync.logs.StructuredFormatter',
+                'output': output,
+            },
+        },
+        'handlers': {
+            'console': {
+                'class': 'logging.StreamHandler',
+                'formatter': 'structured',
+            },
+        },
+        'loggers': loggers,
+    }
@@ -1,8 +1,10 @@
 from pathlib import Path
 from dotenv import load_dotenv
 import os
+import tempfile
 import dj_database_url
 from datetime import timedelta
+from stocksync.logs import build_logging_config, parse_log_levels
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -56,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'accounts.request_middleware.RequestMiddleware',
+    'accounts.instrumentation.InstrumentationMiddleware',
     'accounts.middleware.OrganizationMiddleware',
 ]
 
@@ -94,10 +97,17 @@ DATABASES = {
 DATABASE_URL = os.environ.get('DATABASE_URL')
 DATABASES['default'] = dj_database_url.config(default=DATABASE_URL)
 
+# SQLite's default in-memory test database uses shared-cache table locks, which fail
+# immediately instead of waiting. Use a file so threaded tests get real lock waits; it lives in
+# the temp directory so a run that dies before teardown leaves nothing in the repository.
+if DATABASES['default'].get('ENGINE') == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('TEST', {}).setdefault('NAME', os.path.join(tempfile.gettempdir(), 'stocksync_test_db.sqlite3'))
+
 # Email Settings
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend' # Use standard SMTP backend
-# EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend' # Comment out if using SMTP
-# EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails') # Comment out if using SMTP
+# SMTP unless EMAIL_BACKEND says otherwise, e.g. django.core.mail.backends.filebased.EmailBackend
+# for local development, which writes the messages to EMAIL_FILE_PATH instead of sending them
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', os.path.join(tempfile.gettempdir(), 'stocksync_sent_emails'))
 
 # Load email settings from environment variables
 EMAIL_HOST = os.environ.get('EMAIL_HOST') # <-- Load from environment
@@ -123,6 +133,14 @@ elif EMAIL_USE_TLS and EMAIL_USE_SSL:
 
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER) # <-- Load from environment
 
+# Outbound email queue (api.mail), delivered by `python manage.py send_queued_emails`
+OUTBOUND_EMAIL_BATCH_SIZE = int(os.environ.get('OUTBOUND_EMAIL_BATCH_SIZE', 50)) # Emails sent per SMTP connection
+OUTBOUND_EMAIL_MAX_ATTEMPTS = 5
+OUTBOUND_EMAIL_RETRY_DELAY = 60 # Seconds before the first retry; doubles on every further attempt
+OUTBOUND_EMAIL_MAX_RETRY_DELAY = 3600
+OUTBOUND_EMAIL_LOCK_TIMEOUT = 600 # Seconds after which a batch claimed by a dead worker is retried
+OUTBOUND_EMAIL_POLL_INTERVAL = 5
+
 FRONTEND_URL = os.environ.get('FRONTEND_URL')
 
 # Password validation
@@ -170,6 +188,11 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Keyset pagination for the API list endpoints (api.pagination.KeysetPagination).
+# Clients can ask for a different size with ?page_size=, capped at API_MAX_PAGE_SIZE.
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 50))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 500))
+
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.google.GoogleOAuth2',
     'django.contrib.auth.backends.ModelBackend',
@@ -237,4 +260,54 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Order numbers and supplier/buyer codes (api.sequences). Above 1, each process reserves
+# this many numbers at a time: fewer writes to the counter row, but numbers get gaps.
+SEQUENCE_BLOCK_SIZE = int(os.environ.get('SEQUENCE_BLOCK_SIZE', 1))
+
+# Caches. 'analytics' holds the analytics endpoint results (api.analytics_cache): entries
+# expire after ANALYTICS_CACHE_TIMEOUT seconds and the least recently used ones are evicted
+# past MAX_ENTRIES. LocMemCache is per process; use a shared backend with several workers.
+ANALYTICS_CACHE_TIMEOUT = int(os.environ.get('ANALYTICS_CACHE_TIMEOUT', 300))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analytics': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'analytics',
+        'TIMEOUT': ANALYTICS_CACHE_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('ANALYTICS_CACHE_MAX_ENTRIES', 5000)),
+        },
+    },
+}
+
+# Stock alerts (api.notifications): repeated low stock/overstock alerts for the same item
+# within STOCK_ALERT_DEDUP_WINDOW seconds are suppressed and reported in a digest by
+# send_stock_alert_digests, which polls every STOCK_ALERT_DIGEST_INTERVAL seconds with --loop.
+STOCK_ALERT_DEDUP_WINDOW = int(os.environ.get('STOCK_ALERT_DEDUP_WINDOW', 3600))
+STOCK_ALERT_DIGEST_INTERVAL = int(os.environ.get('STOCK_ALERT_DIGEST_INTERVAL', 300))
+
+# Request instrumentation (accounts.instrumentation): requests slower than REQUEST_TIME_BUDGET_MS
+# log their SLOW_REQUEST_QUERY_LOG_COUNT slowest SQL queries.
+REQUEST_TIME_BUDGET_MS = int(os.environ.get('REQUEST_TIME_BUDGET_MS', 500))
+SLOW_REQUEST_QUERY_LOG_COUNT = int(os.environ.get('SLOW_REQUEST_QUERY_LOG_COUNT', 5))
+
+# Prometheus endpoint (/metrics, api.metrics): when METRICS_TOKEN is set, scrapers must send
+# it as "Authorization: Bearer <token>". Without a token only the comma-separated
+# METRICS_ALLOWED_IPS may scrape (anyone while DEBUG is on); the rest get a 404. Keeping the
+# path off the public proxy is still a good idea on top of this.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
+# Logging (stocksync.logs): the project's apps log structured records at LOG_LEVEL; LOG_LEVELS
+# overrides single modules ("api.views=DEBUG,api.stock=WARNING") and LOG_FORMAT is text or json.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_LEVELS = parse_log_levels(os.environ.get('LOG_LEVELS', ''))
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+LOGGING = build_logging_config(['accounts', 'api', 'store', 'stocksync'], LOG_LEVEL, LOG_LEVELS, LOG_FORMAT)
+
+# Maximum number of ranked results returned by the product search endpoint
+PRODUCT_SEARCH_RESULT_LIMIT = int(os.environ.get('PRODUCT_SEARCH_RESULT_LIMIT', 100))
+
 
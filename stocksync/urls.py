@@ -5,6 +5,7 @@ from django.conf.urls.static import static
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from api.views import metrics_view
 
 # Schema view for drf-yasg
 schema_view = get_schema_view(
@@ -26,6 +27,7 @@ urlpatterns = [
     path('auth/', include('djoser.urls.jwt')),
     path('auth/', include('djoser.social.urls')),
     path("api/", include("api.urls", namespace="api")),
+    path("metrics", metrics_view, name="metrics"),
     path("", include("store.urls")),
     # drf-yasg URLs
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),